@@ -1,148 +1,2233 @@
-import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
+import hashlib
+import importlib.util
+import json
 import os
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils.dataframe import dataframe_to_rows
-import matplotlib.pyplot as plt
-import seaborn as sns
+import platform
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unicodedata
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+
+def _importar_tardio(nome):
+    """Importa o módulo só no primeiro acesso a um atributo (partida rápida da linha de comando)"""
+    if nome in sys.modules:
+        return sys.modules[nome]
+    spec = importlib.util.find_spec(nome)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{nome}'", name=nome)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nome] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def _concluir_importacao(nome):
+    """Conclui já a importação tardia de um módulo (ex.: para cronometrar só o trabalho seguinte)"""
+    return importlib.import_module(nome)
+
+
+# pandas e numpy são carregados no primeiro uso; matplotlib, openpyxl e pyarrow, nas funções que os usam
+pd = _importar_tardio('pandas')
+np = _importar_tardio('numpy')
+
+# Arquivos de entrada padrão
+ARQUIVO_INTERNO = 'dados/guias_sistema_interno.csv'
+ARQUIVO_OPERADORA = 'dados/demonstrativo_operadora.csv'
+
+# Estado persistido da conciliação incremental
+ARQUIVO_ESTADO = 'conciliacao/estado_conciliacao.sqlite'
+
+# Índice de aging das guias em aberto, atualizado a cada conciliação e consultado sem reler as fontes
+ARQUIVO_INDICE_AGING = 'conciliacao/indice_aging.sqlite'
+CLASSIFICACOES_EM_ABERTO = ['🔴 Não Processado', '❌ Glosado']
+FAIXAS_AGING = [('0-30', 0, 30), ('31-60', 31, 60), ('61-90', 61, 90), ('90+', 91, None)]
+
+# Cubo de glosas e divergências (Parquet), regravado a cada conciliação
+ARQUIVO_CUBO_GLOSAS = 'conciliacao/cubo_glosas.parquet'
+
+# Diretório do cache colunar (Parquet) das fontes CSV
+DIRETORIO_CACHE = 'dados/cache'
+
+# Esquema de tipos das fontes: texto, categorias de baixa cardinalidade e valores em R$
+# (lidos como float e convertidos para centavos inteiros logo na leitura)
+ESQUEMA_INTERNO = {
+    'numero_guia': str,
+    'convenio': 'category',
+    'paciente': str,
+    'procedimento': 'category',
+    'valor_enviado': 'float64',
+    'status_interno': 'category',
+    'lote': 'category',
+}
+ESQUEMA_OPERADORA = {
+    'numero_guia': str,
+    'convenio': 'category',
+    'paciente': str,
+    'procedimento': 'category',
+    'valor_pago': 'float64',
+    'status_operadora': 'category',
+    'motivo_glosa': 'category',
+}
+
+# Colunas de data de cada fonte, lidas com formato fixo
+DATAS_INTERNO = ['data_atendimento', 'data_envio']
+DATAS_OPERADORA = ['data_processamento']
+FORMATO_DATA = 'ISO8601'
+
+# Valores monetários circulam em centavos (int64) e só voltam a R$ na apresentação
+COLUNAS_MONETARIAS = ['valor_enviado', 'valor_pago', 'diferenca_valor']
+
+# Colunas do demonstrativo usadas na conciliação
+COLUNAS_OPERADORA = ['numero_guia', 'valor_pago', 'status_operadora', 'motivo_glosa', 'data_processamento']
+
+# Colunas do demonstrativo usadas pela correspondência secundária, quando existirem
+COLUNAS_CHAVE_SECUNDARIA = ['convenio', 'paciente', 'procedimento']
+
+# Demonstrativos em outros layouts: nomes aceitos para cada coluna canônica, comparados
+# sem acentos, caixa e separadores (CSV e XLSX com cabeçalhos variados)
+SINONIMOS_OPERADORA = {
+    'numero_guia': ['numero_guia', 'guia', 'n_guia', 'no_guia', 'nr_guia', 'num_guia', 'numero_da_guia',
+                    'numero_guia_prestador', 'guia_prestador'],
+    'valor_pago': ['valor_pago', 'vl_pago', 'valor_liberado', 'vl_liberado', 'valor_pagamento', 'valor_liquido'],
+    'status_operadora': ['status_operadora', 'status', 'situacao', 'situacao_guia', 'status_guia'],
+    'motivo_glosa': ['motivo_glosa', 'glosa', 'motivo', 'motivo_da_glosa', 'descricao_glosa', 'codigo_glosa'],
+    'data_processamento': ['data_processamento', 'dt_processamento', 'data_pagamento', 'dt_pagamento',
+                           'data_analise'],
+    'convenio': ['convenio', 'operadora'],
+    'paciente': ['paciente', 'beneficiario', 'nome_beneficiario'],
+    'procedimento': ['procedimento', 'descricao_procedimento'],
+}
+
+# TISS XML: elemento de cada guia no demonstrativo de análise de conta e, para cada coluna
+# canônica, os elementos procurados na guia e depois nos cabeçalhos já lidos (ex.: dataProtocolo)
+REGISTRO_TISS = 'relacaoGuias'
+CAMPOS_TISS = {
+    'numero_guia': ['numeroGuiaPrestador'],
+    'valor_pago': ['valorLiberadoGuia', 'valorPagoGuia'],
+    'status_operadora': ['situacaoGuia'],
+    'motivo_glosa': ['descricaoGlosa', 'codigoGlosa'],
+    'data_processamento': ['dataPagamento', 'dataProtocolo'],
+    'paciente': ['nomeBeneficiario'],
+}
+
+# Texto em largura fixa: (coluna, início, fim) com posições a partir de zero e fim exclusivo;
+# valores em centavos sem separador decimal e datas AAAAMMDD
+LAYOUT_LARGURA_FIXA = [
+    ('numero_guia', 0, 20),
+    ('data_processamento', 20, 28),
+    ('valor_pago', 28, 41),
+    ('status_operadora', 41, 61),
+    ('motivo_glosa', 61, 121),
+]
+
+# Benchmark: tamanhos padrão, base de comparação e limite de regressão (20%)
+TAMANHOS_BENCHMARK = [1_000, 100_000, 1_000_000, 10_000_000]
+ARQUIVO_BASE_BENCHMARK = 'relatorios/benchmark_base.json'
+LIMITE_REGRESSAO_BENCHMARK = 0.20
+TEMPO_MINIMO_BENCHMARK = 0.05  # segundos; diferenças menores são tratadas como ruído
+
+# Métricas estruturadas de cada execução (uma linha JSON por evento)
+ARQUIVO_METRICAS = 'relatorios/metricas_conciliacao.jsonl'
+
+# Saídas da conciliação: só as pedidas são geradas (matplotlib e openpyxl são importados sob demanda);
+# 'aging' e 'glosas' são o índice de guias em aberto e o cubo de glosas consultados pelos subcomandos
+SAIDAS_DISPONIVEIS = ('excel', 'png', 'json', 'aging', 'glosas')
+SAIDAS_PADRAO = ('excel', 'png', 'aging', 'glosas')
+ARQUIVO_GRAFICO = 'graficos/conciliacao_guias.png'
+DPI_GRAFICO = 300
+DPI_PREVIA = 72  # prévia: bem mais barata de renderizar e gravar
+
+# Dados fictícios: opções sorteadas e probabilidades de cada situação no demonstrativo
+CONVENIOS = ['Unimed', 'Bradesco', 'SulAmerica', 'Amil', 'NotreDame']
+PROCEDIMENTOS = [
+    'Consulta Cardiologia', 'Exame ECG', 'Ultrassom Abdomen', 'Raio-X Torax',
+    'Consulta Ortopedia', 'Ressonancia Magnetica', 'Tomografia', 'Endoscopia',
+    'Hemograma Completo', 'Glicemia', 'Colesterol Total', 'Ureia e Creatinina'
+]
+PROBABILIDADES_SITUACAO = {
+    'paga_correta': 0.70,
+    'valor_divergente': 0.15,
+    'glosada': 0.10,
+    'nao_processada': 0.05  # Não aparece no demonstrativo
+}
+MOTIVOS_DIVERGENCIA = ['Valor tabela diferente', 'Co-participação aplicada', 'Desconto contratual', 'Valor não conferido']
+MOTIVOS_GLOSA = [
+    'Falta de documentação', 'Autorização inválida', 'Código incorreto',
+    'Prazo de envio vencido', 'Procedimento não coberto'
+]
+
+# Guias repetidas antes da junção. Demonstrativo: 'somar' (pagamento parcial + complemento),
+# 'mais_recente' (lote reprocessado substitui o anterior) ou 'erro'; sistema interno:
+# 'mais_recente' (reenvio substitui o envio anterior) ou 'erro'
+POLITICAS_DUPLICIDADE_OPERADORA = ('somar', 'mais_recente', 'erro')
+POLITICAS_DUPLICIDADE_INTERNO = ('mais_recente', 'erro')
+
+# Com 'somar', só linhas complementares são somadas: todas pagas (situação começando por
+# 'Pago') e com total até o valor enviado da guia. As demais são conflito (fica a mais recente).
+# Linhas somadas em situações diferentes ficam com a situação própria da soma
+PREFIXO_SITUACAO_PAGA = 'Pago'
+SITUACAO_PAGAMENTO_SOMADO = 'Pago Parcial + Complemento'
+
+# Coluna da conciliação que marca a guia consolidada a partir de linhas repetidas do
+# demonstrativo ('duplicata', 'complementar' ou 'conflito'; nula nas demais)
+COLUNA_DUPLICIDADE = 'duplicidade_operadora'
+
+# Correspondência secundária: janela entre atendimento e processamento na chave
+# composta e tamanho mínimo do número normalizado na busca aproximada
+JANELA_CHAVE_COMPOSTA_DIAS = 90
+TAMANHO_MINIMO_APROXIMADO = 6
+
+# Busca aproximada: com numeração sequencial, um número a uma edição costuma ser outra
+# guia. O par só é aceito com evidências (mesmo paciente, mesmo procedimento, valor pago
+# até 5% do enviado; +0,1 cada sobre 0,5) até a confiança mínima; abaixo dela, só se pedido
+TOLERANCIA_VALOR_APROXIMADO = 0.05
+CONFIANCA_MINIMA_APROXIMADA = 0.7
+
+# Colunas exportadas nas abas detalhadas do Excel
+COLUNAS_CONCILIACAO = [
+    'numero_guia', 'convenio', 'data_atendimento', 'paciente', 'procedimento',
+    'valor_enviado', 'valor_pago', 'diferenca_valor', 'percentual_divergencia',
+    'classificacao', 'status_operadora', 'motivo_glosa', 'data_envio', 'dias_em_aberto',
+    'regra_conciliacao', 'confianca_conciliacao', COLUNA_DUPLICIDADE
+]
+
+# Tamanho padrão dos blocos lidos no modo streaming
+TAMANHO_CHUNK_PADRAO = 200_000
+
+# Modo streaming: linhas por parte gravada em disco (a leitura ordenada mantém uma parte de
+# cada bloco em memória) e baldes da leitura prévia, que separam os hashes das guias internas
+LINHAS_POR_PARTE_DISCO = 50_000
+BALDES_LEITURA_PREVIA = 64
+
+# Limite de linhas de uma aba do Excel (com o cabeçalho); acima dele a aba continua em outra
+LIMITE_LINHAS_EXCEL = 1_048_576
+
+# Largura das faixas fixas do histograma de divergências (centavos)
+LARGURA_FAIXA_HISTOGRAMA = 100
+
+# Condições das regras de classificação. São funções de módulo (e não lambdas)
+# para que o conciliador possa ser enviado aos processos da conciliação paralela.
+def _sem_processamento(df):
+    return df['data_processamento'].isna()
+
+def _sem_pagamento(df):
+    return df['valor_pago'] == 0
+
+def _valores_conferem(df):
+    return df['diferenca_valor'] == 0  # Mesmo valor, ao centavo
+
+def _pago_a_maior(df):
+    return df['diferenca_valor'] > 0
+
+# Regras de classificação, avaliadas em ordem (a primeira condição verdadeira vence).
+# Cada condição recebe o DataFrame da conciliação e devolve uma máscara booleana,
+# permitindo incluir novas classes (faixas de tolerância, glosa parcial) sem apply.
+REGRAS_CLASSIFICACAO = [
+    ('🔴 Não Processado', _sem_processamento),
+    ('❌ Glosado', _sem_pagamento),
+    ('✅ OK - Valores Conferem', _valores_conferem),
+    ('⚠️ Pago a Maior', _pago_a_maior),
+]
+CLASSIFICACAO_PADRAO = '🟡 Pago a Menor'
+
+
+def para_centavos(serie):
+    """Converte valores em R$ para centavos inteiros (valores ausentes viram zero)"""
+    return (serie.astype('float64') * 100).round().fillna(0).astype('int64')
+
+
+def compactar_centavos(df):
+    """Grava colunas em centavos como int32 quando a faixa de valores permite"""
+    limites = np.iinfo('int32')
+    compactas = {
+        coluna: df[coluna].astype('int32') for coluna in COLUNAS_MONETARIAS
+        if coluna in df.columns and (df.empty or limites.min <= df[coluna].min() <= df[coluna].max() <= limites.max)
+    }
+    return df.assign(**compactas) if compactas else df
+
+
+class RelatorioDivergencias(Mapping):
+    """Medidas do relatório de divergências, compartilhadas por resumo, gráficos e Excel
+    
+    Os subconjuntos podem ficar como máscaras sobre a conciliação ou, no modo
+    streaming, em partes no disco: só viram DataFrame quando lidos, e
+    `quantidade` os conta sem copiar linhas.
+    """
+    
+    def __init__(self, medidas, conciliacao=None, mascaras=None, disco=None):
+        self._medidas = dict(medidas)
+        self._conciliacao = conciliacao
+        self._mascaras = dict(mascaras or {})
+        self._disco = disco
+        self._em_disco = list(disco.subconjuntos) if disco is not None else []
+    
+    def __getitem__(self, chave):
+        if chave not in self._medidas and chave in self._mascaras:
+            self._medidas[chave] = self._conciliacao[self._mascaras[chave]]
+        elif chave not in self._medidas and chave in self._em_disco:
+            self._medidas[chave] = pd.concat(list(self._disco.blocos_subconjunto(chave)))
+        return self._medidas[chave]
+    
+    def __iter__(self):
+        tardias = list(self._mascaras) + self._em_disco
+        return iter(list(self._medidas) + [chave for chave in tardias if chave not in self._medidas])
+    
+    def __len__(self):
+        return len(set(self._medidas) | set(self._mascaras) | set(self._em_disco))
+    
+    def em_disco(self, chave):
+        """Indica se o subconjunto está em partes no disco (e deve ser lido em blocos)"""
+        return chave not in self._medidas and chave in self._em_disco
+    
+    def quantidade(self, chave):
+        """Número de linhas de um subconjunto, sem materializá-lo"""
+        if chave not in self._medidas and chave in self._mascaras:
+            return int(self._mascaras[chave].sum())
+        if self.em_disco(chave):
+            return self._disco.linhas_subconjunto(chave)
+        return len(self[chave])
+    
+    def subconjunto(self, chave, colunas):
+        """Colunas de um subconjunto, copiando as linhas uma única vez"""
+        if chave not in self._medidas and chave in self._mascaras:
+            return self._conciliacao.loc[self._mascaras[chave], colunas]
+        return self[chave][colunas]
+    
+    def maximos_texto(self, chave):
+        """Maiores textos por coluna medidos ao gravar o subconjunto no disco (None se não medidos)"""
+        return self._disco.maximos_texto.get(chave) if self.em_disco(chave) else None
+    
+    def blocos(self, chave, colunas):
+        """Colunas de um subconjunto em blocos, na ordem das guias (do disco, um bloco por vez)"""
+        if self.em_disco(chave):
+            yield from self._disco.blocos_subconjunto(chave, colunas)
+        else:
+            yield self.subconjunto(chave, colunas)
+
+
+class CuboGlosas:
+    """Cubo de glosas e divergências por convênio × procedimento × motivo × mês de envio
+    
+    Guarda contagens e valores (em centavos) já somados por combinação de dimensões,
+    de modo que drill-downs e rankings são respondidos sem os dados linha a linha.
+    Dimensões ausentes viram texto vazio.
+    """
+    
+    DIMENSOES = ['convenio', 'procedimento', 'motivo_glosa', 'mes_envio']
+    MEDIDAS = ['quantidade', 'quantidade_glosada', 'quantidade_divergente',
+               'valor_enviado', 'valor_glosado', 'valor_divergente']
+    
+    def __init__(self, dados=None):
+        if dados is None:
+            dados = pd.DataFrame({coluna: pd.Series(dtype=object) for coluna in self.DIMENSOES}
+                                 | {medida: pd.Series(dtype='int64') for medida in self.MEDIDAS})
+        self.dados = dados
+    
+    @classmethod
+    def calcular(cls, conciliacao):
+        """Cubo de uma conciliação (ou de um bloco dela) numa passagem, com np.bincount"""
+        classificacao = conciliacao['classificacao']
+        diferenca = conciliacao['diferenca_valor'].to_numpy(dtype='int64')
+        glosada = (classificacao == '❌ Glosado').to_numpy()
+        # Divergência: guia processada e paga, com valor diferente do enviado
+        divergente = (diferenca != 0) & ~glosada & (classificacao != '🔴 Não Processado').to_numpy()
+        
+        # Um código por dimensão (0 = ausente) e um código por combinação presente no bloco
+        codigos, rotulos = [], []
+        series = [conciliacao['convenio'], conciliacao['procedimento'], conciliacao['motivo_glosa'],
+                  conciliacao['data_envio'].to_numpy().astype('datetime64[M]')]
+        for serie in series:
+            codigos_dimensao, valores = pd.factorize(serie)
+            codigos.append(codigos_dimensao + 1)
+            rotulos.append(np.concatenate([[''], np.asarray(valores).astype(str)]).astype(object))
+        dimensoes = tuple(len(rotulo) for rotulo in rotulos)
+        grupos, chaves = pd.factorize(np.ravel_multi_index(codigos, dimensoes))
+        
+        valor_enviado = conciliacao['valor_enviado'].to_numpy(dtype='int64')
+        valor_pago = conciliacao['valor_pago'].to_numpy(dtype='int64')
+        pesos = {
+            'quantidade': None,
+            'quantidade_glosada': glosada,
+            'quantidade_divergente': divergente,
+            'valor_enviado': valor_enviado,
+            'valor_glosado': np.where(glosada, valor_enviado - valor_pago, 0),
+            'valor_divergente': np.where(divergente, diferenca, 0),
+        }
+        posicoes = np.unravel_index(chaves, dimensoes)
+        dados = {dimensao: rotulo[posicao] for dimensao, rotulo, posicao in zip(cls.DIMENSOES, rotulos, posicoes)}
+        for medida, peso in pesos.items():
+            # Somas de centavos inteiros: exatas enquanto abaixo de 2**53
+            somas = np.bincount(grupos, weights=peso, minlength=len(chaves))
+            dados[medida] = np.rint(somas).astype('int64')
+        return cls(pd.DataFrame(dados))
+    
+    @classmethod
+    def unir(cls, cubos):
+        """Soma cubos parciais (blocos, partições ou deltas) num cubo só"""
+        dados = pd.concat([cubo.dados for cubo in cubos], ignore_index=True) if cubos else cls().dados
+        dados = dados.astype({dimensao: object for dimensao in cls.DIMENSOES})
+        return cls(dados.groupby(cls.DIMENSOES, sort=True)[cls.MEDIDAS].sum().reset_index())
+    
+    def consultar(self, agrupar_por=('convenio',), filtros=None, ordenar_por='valor_glosado', top=None,
+                  crescente=False):
+        """Soma as medidas por `agrupar_por`, restritas aos `filtros` (drill-down), ordenadas e
+        limitadas às `top` primeiras linhas
+        
+        Ex.: consultar(['procedimento', 'motivo_glosa'], {'convenio': 'Bradesco'}, top=10)
+        """
+        agrupar_por = [agrupar_por] if isinstance(agrupar_por, str) else list(agrupar_por)
+        desconhecidas = (set(agrupar_por) | set(filtros or {})) - set(self.DIMENSOES)
+        if desconhecidas:
+            raise ValueError(f"Dimensões desconhecidas: {', '.join(sorted(desconhecidas))} "
+                             f"(disponíveis: {', '.join(self.DIMENSOES)})")
+        if ordenar_por not in self.MEDIDAS:
+            raise ValueError(f"Medida desconhecida: {ordenar_por} (disponíveis: {', '.join(self.MEDIDAS)})")
+        
+        dados = self.dados
+        for dimensao, valores in (filtros or {}).items():
+            valores = [valores] if isinstance(valores, str) else list(valores)
+            dados = dados[dados[dimensao].isin(valores)]
+        
+        resultado = dados.groupby(agrupar_por, observed=True)[self.MEDIDAS].sum()
+        resultado = resultado.sort_values(ordenar_por, ascending=crescente, kind='stable')
+        return resultado.head(top) if top else resultado
+    
+    def gravar(self, caminho=ARQUIVO_CUBO_GLOSAS):
+        """Grava o cubo em Parquet (dimensões com dicionário) e substitui o arquivo anterior de uma vez"""
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        temporario = caminho + '.tmp'
+        self.dados.astype({dimensao: 'category' for dimensao in self.DIMENSOES}).to_parquet(temporario, index=False)
+        os.replace(temporario, caminho)
+        return len(self.dados)
+    
+    @classmethod
+    def ler(cls, caminho=ARQUIVO_CUBO_GLOSAS):
+        dados = pd.read_parquet(caminho)
+        return cls(dados.astype({dimensao: object for dimensao in cls.DIMENSOES}))
+
+
+class AcumuladorRelatorio:
+    """Acumula as medidas do relatório de divergências bloco a bloco
+    
+    Cada bloco é lido uma única vez: as contagens e somas vão para um cubo por
+    (convênio, mês de envio, classificação), de onde saem os totais, a distribuição
+    por classificação, o resumo por convênio e a evolução mensal. Na mesma passagem
+    saem as máscaras dos subconjuntos, os candidatos ao top N e o histograma das
+    divergências em faixas fixas.
+    
+    Com `disco` (modo streaming), as linhas dos subconjuntos vão para partes no disco
+    e a memória não cresce com o número de guias; sem ele, ficam em memória.
+    """
+    
+    CHAVES_CUBO = ['convenio', 'mes_envio', 'classificacao']
+    COLUNAS_CUBO = ['numero_guia', 'valor_enviado', 'valor_pago', 'diferenca_valor']
+    SUBCONJUNTOS = ['divergencias_significativas', 'nao_processadas_antigas']
+    
+    def __init__(self, top_n=10, disco=None):
+        self.top_n = top_n
+        self.disco = disco
+        self.cubos = []
+        self.maiores_divergencias = None
+        self.divergencias_significativas = []
+        self.nao_processadas_antigas = []
+        self.histograma = self.histograma_divergencias(np.empty(0, dtype='int64'))
+        self.cubos_glosas = []
+    
+    @staticmethod
+    def histograma_divergencias(diferencas):
+        """Quantidade de divergências por faixa fixa de LARGURA_FAIXA_HISTOGRAMA centavos
+        (índice: início da faixa, em centavos)"""
+        faixas, contagens = np.unique(np.floor_divide(diferencas, LARGURA_FAIXA_HISTOGRAMA), return_counts=True)
+        return pd.Series(contagens, index=faixas * LARGURA_FAIXA_HISTOGRAMA, dtype='int64')
+    
+    def _somar_histograma(self, histograma):
+        self.histograma = self.histograma.add(histograma, fill_value=0).astype('int64')
+    
+    def _incorporar(self, conciliacao):
+        """Passagem única sobre o bloco; retorna as máscaras dos subconjuntos"""
+        classificacao = conciliacao['classificacao']
+        diferenca = conciliacao['diferenca_valor'].to_numpy()
+        
+        # Cubo: um código por combinação de chaves e np.bincount para contagens e somas
+        codigos_convenio, convenios = pd.factorize(conciliacao['convenio'])
+        codigos_mes, meses = pd.factorize(conciliacao['data_envio'].to_numpy().astype('datetime64[M]'))
+        categorias = classificacao.cat.categories
+        dimensoes = (len(convenios) + 1, len(meses) + 1, len(categorias))
+        chave = np.ravel_multi_index((codigos_convenio + 1, codigos_mes + 1, classificacao.cat.codes.to_numpy()),
+                                     dimensoes)
+        
+        tamanho = int(np.prod(dimensoes))
+        contagem = np.bincount(chave, minlength=tamanho)
+        presentes = np.flatnonzero(contagem)
+        cubo = {'numero_guia': contagem[presentes]}
+        for coluna in self.COLUNAS_CUBO[1:]:
+            # Somas de centavos inteiros: exatas enquanto abaixo de 2**53 (R$ 90 trilhões)
+            somas = np.bincount(chave, weights=conciliacao[coluna].to_numpy(), minlength=tamanho)
+            cubo[coluna] = np.rint(somas[presentes]).astype('int64')
+        
+        posicao_convenio, posicao_mes, posicao_classificacao = np.unravel_index(presentes, dimensoes)
+        rotulos_convenio = np.concatenate([[None], np.asarray(convenios, dtype=object).astype(str)])
+        rotulos_mes = pd.PeriodIndex(np.concatenate([[np.datetime64('NaT')], meses]).astype('datetime64[ns]'),
+                                     freq='M')
+        self.cubos.append(pd.DataFrame({
+            'convenio': rotulos_convenio[posicao_convenio],
+            'mes_envio': rotulos_mes[posicao_mes],
+            'classificacao': pd.Categorical.from_codes(posicao_classificacao, dtype=classificacao.dtype),
+            **cubo
+        }))
+        
+        # Cubo de glosas por convênio, procedimento, motivo e mês
+        self.cubos_glosas.append(CuboGlosas.calcular(conciliacao))
+        
+        # Divergências: histograma em faixas fixas (tamanho limitado pela faixa de valores) e top N
+        nao_nulas = np.flatnonzero(diferenca != 0)
+        self._somar_histograma(self.histograma_divergencias(diferenca[nao_nulas]))
+        
+        # Top N corrente: candidatos do bloco disputam com os já selecionados
+        posicoes = nao_nulas[pd.Series(diferenca[nao_nulas]).nlargest(self.top_n).index.to_numpy()]
+        candidatos = conciliacao.iloc[posicoes]
+        if self.maiores_divergencias is not None:
+            candidatos = pd.concat([self.maiores_divergencias, candidatos]).nlargest(self.top_n, 'diferenca_valor')
+        self.maiores_divergencias = candidatos
+        
+        return {
+            # Guias com divergência significativa (>5% ou valor absoluto > R$ 50,00)
+            'divergencias_significativas': (
+                (abs(conciliacao['percentual_divergencia']) > 5) | (abs(conciliacao['diferenca_valor']) > 5000)
+            ).to_numpy(),
+            # Guias não processadas há mais de 30 dias
+            'nao_processadas_antigas': (
+                (classificacao == '🔴 Não Processado') & (conciliacao['dias_em_aberto'] > 30)
+            ).to_numpy()
+        }
+    
+    def adicionar(self, conciliacao):
+        """Incorpora um bloco já conciliado aos totais, guardando as linhas dos subconjuntos"""
+        for nome, mascara in self._incorporar(conciliacao).items():
+            if self.disco is not None:
+                self.disco.gravar_subconjunto(nome, conciliacao[mascara])
+            else:
+                getattr(self, nome).append(conciliacao[mascara])
+        return self
+    
+    def analisar(self, conciliacao):
+        """Relatório de uma conciliação em memória, com subconjuntos como máscaras"""
+        mascaras = self._incorporar(conciliacao)
+        return RelatorioDivergencias(self._medidas(), conciliacao, mascaras)
+    
+    def combinar(self, outro):
+        """Incorpora os totais de outro acumulador (ex.: de outra partição)"""
+        if not outro.cubos:
+            return self
+        self.cubos.extend(outro.cubos)
+        self.divergencias_significativas.extend(outro.divergencias_significativas)
+        self.nao_processadas_antigas.extend(outro.nao_processadas_antigas)
+        self._somar_histograma(outro.histograma)
+        self.cubos_glosas.extend(outro.cubos_glosas)
+        if self.maiores_divergencias is None:
+            self.maiores_divergencias = outro.maiores_divergencias
+        else:
+            # Empates no top N resolvidos pela ordem original das linhas, como em memória
+            self.maiores_divergencias = pd.concat(
+                [self.maiores_divergencias, outro.maiores_divergencias]
+            ).sort_index(kind='stable').nlargest(self.top_n, 'diferenca_valor')
+        return self
+    
+    def _medidas(self):
+        """Totais (em centavos), distribuição, resumos e top N a partir dos cubos acumulados"""
+        cubo = pd.concat(self.cubos, ignore_index=True) if len(self.cubos) > 1 else self.cubos[0]
+        
+        valor_enviado_total = int(cubo['valor_enviado'].sum())
+        valor_pago_total = int(cubo['valor_pago'].sum())
+        diferenca_total = valor_pago_total - valor_enviado_total
+        
+        # Categorias fixas, na ordem da contagem (empates na ordem das categorias)
+        stats_classificacao = cubo.groupby('classificacao', observed=False)['numero_guia'].sum().rename('count')
+        stats_classificacao = stats_classificacao.sort_values(ascending=False, kind='stable')
+        stats_classificacao = stats_classificacao[stats_classificacao > 0]
+        
+        resumo_convenio = cubo.dropna(subset=['convenio']).groupby('convenio')[self.COLUNAS_CUBO].sum()
+        evolucao_mensal = cubo.dropna(subset=['mes_envio']).groupby('mes_envio')[['diferenca_valor', 'numero_guia']].sum()
+        
+        return {
+            'resumo_geral': {
+                'total_guias': int(cubo['numero_guia'].sum()),
+                'valor_enviado_total': valor_enviado_total,
+                'valor_pago_total': valor_pago_total,
+                'diferenca_total': diferenca_total,
+                'percentual_diferenca_total': (diferenca_total / valor_enviado_total * 100) if valor_enviado_total > 0 else 0
+            },
+            'stats_classificacao': stats_classificacao,
+            'maiores_divergencias': self.maiores_divergencias,
+            'resumo_convenio': resumo_convenio,
+            'evolucao_mensal': evolucao_mensal,
+            'histograma_divergencias': self.histograma,
+            'cubo_glosas': CuboGlosas.unir(self.cubos_glosas)
+        }
+    
+    def finalizar(self):
+        """Monta o relatório no mesmo formato do modo em memória"""
+        medidas = self._medidas()
+        if self.disco is not None:
+            # Partes gravadas bloco a bloco, já na ordem das guias
+            return RelatorioDivergencias(medidas, disco=self.disco)
+        for nome in self.SUBCONJUNTOS:
+            medidas[nome] = pd.concat(getattr(self, nome)).sort_index(kind='stable')
+        return RelatorioDivergencias(medidas)
+
+
+class ConciliacaoEmDisco:
+    """Conciliação gravada em disco em partes por classificação (modo streaming)
+    
+    Também guarda, na ordem das guias, as linhas dos subconjuntos do relatório
+    (divergências significativas, não processadas antigas). Cada bloco gravado vira,
+    por classificação, uma sequência de partes de até `linhas_por_parte` linhas já
+    ordenadas pela diferença; a leitura ordenada intercala as sequências com uma parte
+    de cada em memória. Com `medir_texto`, os maiores textos de cada coluna (larguras
+    do Excel) são acumulados durante a gravação, sem releitura.
+    """
+    
+    def __init__(self, diretorio=None, medir_texto=None, linhas_por_parte=LINHAS_POR_PARTE_DISCO):
+        self.diretorio = diretorio or tempfile.mkdtemp(prefix='conciliacao_')
+        self.partes = {}
+        self.subconjuntos = {}
+        self.total_partes = 0
+        self.linhas_por_parte = linhas_por_parte
+        self.medir_texto = medir_texto
+        self.maximos_texto = {}  # por destino ('conciliacao' ou nome do subconjunto)
+    
+    def _gravar_parte(self, df):
+        caminho = os.path.join(self.diretorio, f"parte_{self.total_partes:06d}.pkl")
+        compactar_centavos(df).to_pickle(caminho)
+        self.total_partes += 1
+        return caminho
+    
+    def _medir(self, destino, df):
+        if self.medir_texto is not None:
+            self.medir_texto(df, self.maximos_texto.setdefault(destino, {}))
+    
+    def gravar(self, conciliacao):
+        """Grava um bloco conciliado, separado por classificação e ordenado pela diferença (decrescente)"""
+        self._medir('conciliacao', conciliacao)
+        for classificacao, grupo in conciliacao.groupby('classificacao', observed=True, sort=False):
+            grupo = grupo.sort_values('diferenca_valor', ascending=False, kind='stable')
+            self.partes.setdefault(classificacao, []).append([
+                self._gravar_parte(grupo.iloc[inicio:inicio + self.linhas_por_parte])
+                for inicio in range(0, len(grupo), self.linhas_por_parte)
+            ])
+    
+    def gravar_subconjunto(self, nome, df):
+        """Acrescenta as linhas de um bloco a um subconjunto do relatório (a primeira parte é
+        gravada mesmo vazia, para guardar as colunas)"""
+        self._medir(nome, df)
+        partes, linhas = self.subconjuntos.get(nome, ([], 0))
+        if len(df) or not partes:
+            partes.append(self._gravar_parte(df))
+        self.subconjuntos[nome] = (partes, linhas + len(df))
+    
+    def linhas_subconjunto(self, nome):
+        return self.subconjuntos[nome][1]
+    
+    def blocos_subconjunto(self, nome, colunas=None):
+        """Lê as partes de um subconjunto na ordem em que foram gravadas, uma de cada vez"""
+        for caminho in self.subconjuntos[nome][0]:
+            bloco = pd.read_pickle(caminho)
+            yield bloco if colunas is None else bloco[colunas]
+    
+    def blocos_por_classificacao(self, colunas=None, classificacoes=None):
+        """Lê as partes de cada classificação (ou só das informadas), em ordem alfabética, uma de cada vez"""
+        for classificacao in sorted(self.partes):
+            if classificacoes is not None and classificacao not in classificacoes:
+                continue
+            for sequencia in self.partes[classificacao]:
+                for caminho in sequencia:
+                    bloco = pd.read_pickle(caminho)
+                    yield bloco if colunas is None else bloco[colunas]
+    
+    def blocos_ordenados(self, colunas=None):
+        """Partes em ordem de classificação e diferença decrescente (empates na ordem das guias),
+        como a ordenação em memória, mas com no máximo uma parte de cada bloco gravado em memória"""
+        for classificacao in sorted(self.partes):
+            for bloco in self._intercalar(self.partes[classificacao]):
+                yield bloco if colunas is None else bloco[colunas]
+    
+    @staticmethod
+    def _intercalar(sequencias):
+        """Intercala sequências de partes ordenadas pela diferença (decrescente)
+        
+        Uma linha sai quando nenhuma parte ainda não lida de outra sequência pode precedê-la:
+        sua diferença é maior que a última lida dessa sequência ou, no empate, a outra
+        sequência foi gravada depois (o que mantém a ordem das guias entre empates).
+        """
+        lidas = [0] * len(sequencias)
+        atuais = [None] * len(sequencias)
+        while True:
+            for i, sequencia in enumerate(sequencias):
+                if (atuais[i] is None or not len(atuais[i])) and lidas[i] < len(sequencia):
+                    atuais[i] = pd.read_pickle(sequencia[lidas[i]])
+                    lidas[i] += 1
+            ativas = [i for i, atual in enumerate(atuais) if atual is not None and len(atual)]
+            if not ativas:
+                return
+            
+            # Última diferença lida de cada sequência que ainda tem partes no disco
+            ultimas = {i: atuais[i]['diferenca_valor'].iloc[-1] for i in ativas if lidas[i] < len(sequencias[i])}
+            saida = []
+            for i in ativas:
+                outras = [(ultima, j) for j, ultima in ultimas.items() if j != i]
+                diferencas = atuais[i]['diferenca_valor'].to_numpy()
+                if not outras:
+                    quantidade = len(diferencas)
+                else:
+                    limite = max(ultima for ultima, _ in outras)
+                    bloqueada = any(ultima == limite and j < i for ultima, j in outras)
+                    quantidade = np.count_nonzero(diferencas > limite if bloqueada else diferencas >= limite)
+                saida.append(atuais[i].iloc[:quantidade])
+                atuais[i] = atuais[i].iloc[quantidade:]
+            
+            # Sequências concatenadas na ordem de gravação: a ordenação estável preserva os empates
+            saida = pd.concat(saida)
+            if len(saida):
+                ordem = np.argsort(-saida['diferenca_valor'].to_numpy(dtype='int64'), kind='stable')
+                yield saida.iloc[ordem]
+    
+    def limpar(self):
+        """Remove os arquivos temporários"""
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+        self.partes = {}
+        self.subconjuntos = {}
+
+class CacheColunar:
+    """Cache Parquet das fontes, validado por caminho, mtime, hash do conteúdo e leitor usado"""
+    
+    # Versão do formato gravado (2: valores em centavos); caches de outra versão são refeitos
+    VERSAO = 2
+    
+    def __init__(self, diretorio=DIRETORIO_CACHE):
+        self.diretorio = diretorio
+        # O cache é opcional: sem pyarrow as fontes são sempre lidas do CSV
+        self.disponivel = importlib.util.find_spec('pyarrow') is not None
+    
+    def _caminhos(self, caminho_csv):
+        chave = hashlib.sha1(os.path.abspath(caminho_csv).encode('utf-8')).hexdigest()[:16]
+        base = os.path.join(self.diretorio, f"{os.path.splitext(os.path.basename(caminho_csv))[0]}_{chave}")
+        return base + '.parquet', base + '.json'
+    
+    @staticmethod
+    def _hash_arquivo(caminho, tamanho_bloco=1 << 20):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(caminho, 'rb') as arquivo:
+            for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+                digest.update(bloco)
+        return digest.hexdigest()
+    
+    def ler(self, caminho_csv, colunas=None, leitor=None):
+        """Retorna o DataFrame em cache ou None se ausente/desatualizado (ou lido com outro `leitor`)"""
+        if not self.disponivel:
+            return None
+        
+        caminho_parquet, caminho_meta = self._caminhos(caminho_csv)
+        if not os.path.exists(caminho_parquet) or not os.path.exists(caminho_meta):
+            return None
+        
+        with open(caminho_meta, encoding='utf-8') as arquivo:
+            meta = json.load(arquivo)
+        if meta.get('versao') != self.VERSAO or meta.get('leitor') != leitor:
+            return None
+        
+        stat = os.stat(caminho_csv)
+        if meta['tamanho'] != stat.st_size:
+            return None
+        if meta['mtime'] != stat.st_mtime_ns:
+            # Arquivo tocado ou copiado: só reaproveita se o conteúdo for o mesmo
+            if meta['hash'] != self._hash_arquivo(caminho_csv):
+                return None
+            meta['mtime'] = stat.st_mtime_ns
+            with open(caminho_meta, 'w', encoding='utf-8') as arquivo:
+                json.dump(meta, arquivo)
+        
+        if colunas is not None:
+            # Colunas opcionais podem não existir em todas as fontes
+            import pyarrow.parquet as pq
+            existentes = set(pq.read_schema(caminho_parquet).names)
+            colunas = [coluna for coluna in colunas if coluna in existentes]
+        df = pd.read_parquet(caminho_parquet, columns=colunas)
+        
+        # Gravados como int32 quando cabem; as contas são sempre em int64
+        return df.astype({coluna: 'int64' for coluna in COLUNAS_MONETARIAS if coluna in df.columns})
+    
+    def gravar(self, caminho_csv, df, leitor=None):
+        """Grava o DataFrame tipado junto com a chave de validação"""
+        if not self.disponivel:
+            return
+        
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho_parquet, caminho_meta = self._caminhos(caminho_csv)
+        stat = os.stat(caminho_csv)
+        
+        compactar_centavos(df).to_parquet(caminho_parquet, index=False)
+        with open(caminho_meta, 'w', encoding='utf-8') as arquivo:
+            json.dump({
+                'versao': self.VERSAO,
+                'leitor': leitor,
+                'caminho': os.path.abspath(caminho_csv),
+                'mtime': stat.st_mtime_ns,
+                'tamanho': stat.st_size,
+                'hash': self._hash_arquivo(caminho_csv)
+            }, arquivo)
+
+
+def normalizar_numero_guia(serie):
+    """Número da guia só com dígitos e sem zeros à esquerda (ignora prefixos e separadores)"""
+    return serie.astype(str).str.replace(r'\D', '', regex=True).str.lstrip('0')
+
+
+def _distancia_osa(a, b):
+    """Distância de edição com transposição de vizinhos (optimal string alignment)"""
+    anterior2, anterior = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        atual = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            custo = 0 if a[i - 1] == b[j - 1] else 1
+            atual[j] = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + custo)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                atual[j] = min(atual[j], anterior2[j - 2] + 1)
+        anterior2, anterior = anterior, atual
+    return anterior[-1]
+
+
+class CorrespondenciaSecundaria:
+    """Segunda etapa de correspondência para guias ausentes do demonstrativo
+    
+    Vincula guias sem correspondência exata a linhas órfãs do demonstrativo (cujo
+    número não existe no sistema interno), em etapas de confiança decrescente:
+    número normalizado, chave composta (convênio + paciente + procedimento dentro
+    de uma janela de datas) e número aproximado (uma edição de distância, confirmado
+    por paciente, procedimento, valor e janela de datas). Todas as etapas são
+    junções por hash, sem comparar todos os pares.
+    
+    Pares aproximados abaixo de `confianca_minima_aproximada` são descartados; para
+    aceitá-los, informe uma confiança mínima menor (a regra e a confiança ficam na
+    conciliação).
+    """
+    
+    CHAVE_COMPOSTA = ['convenio', 'paciente', 'procedimento']
+    
+    def __init__(self, janela_dias=JANELA_CHAVE_COMPOSTA_DIAS, tamanho_minimo=TAMANHO_MINIMO_APROXIMADO,
+                 tolerancia_valor=TOLERANCIA_VALOR_APROXIMADO, confianca_minima_aproximada=CONFIANCA_MINIMA_APROXIMADA):
+        self.janela_dias = janela_dias
+        self.tamanho_minimo = tamanho_minimo
+        self.tolerancia_valor = tolerancia_valor
+        self.confianca_minima_aproximada = confianca_minima_aproximada
+    
+    def vincular(self, pendentes, orfas):
+        """Retorna os pares (posição em pendentes, número da guia no demonstrativo, regra, confiança)"""
+        pendentes = pendentes.reset_index(drop=True)
+        orfas = orfas.reset_index(drop=True)
+        livres_pendentes = np.ones(len(pendentes), dtype=bool)
+        livres_orfas = np.ones(len(orfas), dtype=bool)
+        
+        pares = []
+        for etapa in (self._por_guia_normalizada, self._por_chave_composta, self._por_aproximacao):
+            if not livres_pendentes.any() or not livres_orfas.any():
+                break
+            
+            # Cada linha órfã é usada no máximo uma vez entre as etapas
+            encontrados = self._um_para_um(etapa(pendentes[livres_pendentes], orfas[livres_orfas]))
+            livres_pendentes[encontrados['posicao'].to_numpy(dtype='int64')] = False
+            livres_orfas[encontrados['posicao_orfa'].to_numpy(dtype='int64')] = False
+            pares.append(encontrados)
+        
+        pares = pd.concat(pares, ignore_index=True) if pares else pd.DataFrame(
+            {'posicao': [], 'posicao_orfa': [], 'regra': [], 'confianca': []}
+        )
+        pares['numero_guia_operadora'] = orfas['numero_guia'].to_numpy()[pares['posicao_orfa'].to_numpy(dtype='int64')]
+        return pares.drop(columns='posicao_orfa')
+    
+    @staticmethod
+    def _um_para_um(candidatos):
+        """Mantém o melhor candidato de cada guia e de cada linha órfã (ordem determinística)"""
+        candidatos = candidatos.sort_values(['confianca', 'posicao', 'posicao_orfa'], ascending=[False, True, True])
+        candidatos = candidatos.drop_duplicates('posicao').drop_duplicates('posicao_orfa')
+        return candidatos[['posicao', 'posicao_orfa', 'regra', 'confianca']]
+    
+    @staticmethod
+    def _chaves_normalizadas(df, coluna_posicao):
+        return pd.DataFrame({coluna_posicao: df.index, 'chave': normalizar_numero_guia(df['numero_guia']).to_numpy()})
+    
+    def _por_guia_normalizada(self, pendentes, orfas):
+        """Mesmo número após remover prefixo, separadores e zeros à esquerda"""
+        chaves_pendentes = self._chaves_normalizadas(pendentes, 'posicao')
+        chaves_orfas = self._chaves_normalizadas(orfas, 'posicao_orfa')
+        candidatos = chaves_pendentes[chaves_pendentes['chave'] != ''].merge(chaves_orfas, on='chave')
+        return candidatos.assign(regra='guia_normalizada', confianca=0.95)
+    
+    def _por_chave_composta(self, pendentes, orfas):
+        """Mesmo convênio, paciente e procedimento, processada dentro da janela de dias"""
+        colunas = self.CHAVE_COMPOSTA
+        if not set(colunas + ['data_processamento']).issubset(orfas.columns):
+            return pd.DataFrame(columns=['posicao', 'posicao_orfa', 'regra', 'confianca'])
+        
+        lado_pendentes = pendentes[colunas + ['data_atendimento']].astype({c: object for c in colunas})
+        lado_orfas = orfas[colunas + ['data_processamento']].astype({c: object for c in colunas})
+        candidatos = lado_pendentes.dropna(subset=colunas).rename_axis('posicao').reset_index().merge(
+            lado_orfas.dropna(subset=colunas).rename_axis('posicao_orfa').reset_index(), on=colunas
+        )
+        
+        dias = (candidatos['data_processamento'] - candidatos['data_atendimento']).dt.days
+        candidatos = candidatos[(dias >= 0) & (dias <= self.janela_dias)]
+        dias = dias[candidatos.index]
+        
+        # Quanto mais próxima a data de processamento do atendimento, maior a confiança
+        return candidatos.assign(regra='chave_composta', confianca=(0.9 - 0.2 * dias / self.janela_dias).round(4))
+    
+    def _variantes(self, df, coluna_posicao):
+        """Número normalizado e suas variantes com um dígito removido, por bloco de convênio"""
+        chaves = self._chaves_normalizadas(df, coluna_posicao)
+        chaves['bloco'] = df['convenio'].astype(object).fillna('').to_numpy() if 'convenio' in df.columns else ''
+        chaves = chaves[chaves['chave'].str.len() >= self.tamanho_minimo]
+        
+        variantes = [chaves.assign(variante=chaves['chave'])]
+        for posicao in range(int(chaves['chave'].str.len().max()) if len(chaves) else 0):
+            com_posicao = chaves[chaves['chave'].str.len() > posicao]
+            variantes.append(com_posicao.assign(
+                variante=com_posicao['chave'].str[:posicao] + com_posicao['chave'].str[posicao + 1:]
+            ))
+        return pd.concat(variantes, ignore_index=True)
+    
+    def _por_aproximacao(self, pendentes, orfas):
+        """Número a uma edição de distância (troca, falta, sobra ou inversão de dígitos)"""
+        variantes_pendentes = self._variantes(pendentes, 'posicao')
+        variantes_orfas = self._variantes(orfas, 'posicao_orfa')
+        
+        # Índice de deleções: números a uma edição compartilham alguma variante
+        candidatos = variantes_pendentes.merge(
+            variantes_orfas, on=['bloco', 'variante'], suffixes=('', '_orfa')
+        ).drop_duplicates(['posicao', 'posicao_orfa'])
+        
+        # Confirmação exata da distância apenas nos candidatos do índice
+        distancias = np.fromiter(
+            (_distancia_osa(a, b) for a, b in zip(candidatos['chave'], candidatos['chave_orfa'])),
+            dtype='int64', count=len(candidatos)
+        )
+        candidatos = candidatos[distancias == 1]
+        return self._corroborar(candidatos, pendentes, orfas)
+    
+    def _corroborar(self, candidatos, pendentes, orfas):
+        """Confiança dos pares aproximados pelas evidências de que são a mesma guia
+        
+        Fora da janela de datas o par é descartado; dentro dela, cada evidência (mesmo
+        paciente, mesmo procedimento, valor pago próximo do enviado) soma 0,1 a 0,5.
+        """
+        posicoes, posicoes_orfas = candidatos['posicao'].to_numpy(), candidatos['posicao_orfa'].to_numpy()
+        
+        def lados(coluna_pendente, coluna_orfa, tipo=object):
+            if coluna_pendente not in pendentes.columns or coluna_orfa not in orfas.columns:
+                return None, None
+            return (pendentes[coluna_pendente].astype(tipo).reindex(posicoes).to_numpy(),
+                    orfas[coluna_orfa].astype(tipo).reindex(posicoes_orfas).to_numpy())
+        
+        evidencias = np.zeros(len(candidatos), dtype='int64')
+        for coluna in ('paciente', 'procedimento'):
+            a, b = lados(coluna, coluna)
+            if a is not None:
+                evidencias += pd.notna(a) & (a == b)
+        enviado, pago = lados('valor_enviado', 'valor_pago', 'float64')
+        if enviado is not None:
+            evidencias += np.abs(pago - enviado) <= self.tolerancia_valor * np.abs(enviado)
+        
+        # Datas ausentes não descartam o par; datas fora da janela, sim
+        dentro_janela = np.ones(len(candidatos), dtype=bool)
+        atendimento, processamento = lados('data_atendimento', 'data_processamento', 'datetime64[ns]')
+        if atendimento is not None:
+            dias = (processamento - atendimento) / np.timedelta64(1, 'D')
+            dentro_janela = ~((dias < 0) | (dias > self.janela_dias))
+        
+        candidatos = candidatos.assign(regra='guia_aproximada', confianca=(0.5 + 0.1 * evidencias).round(4))
+        return candidatos[dentro_janela & (candidatos['confianca'] >= self.confianca_minima_aproximada).to_numpy()]
+
+
+class ConsolidacaoDuplicidades:
+    """Detecta e consolida guias repetidas antes da junção, que passa a ser um para um
+    
+    A detecção é por hash (`duplicated` sobre o número da guia), em tempo linear, e só
+    as linhas repetidas são reagrupadas. No demonstrativo, linhas idênticas são uma
+    duplicata (ficam uma vez); linhas diferentes da mesma guia seguem a política:
+    'somar' soma as complementares (todas pagas, com total até o valor enviado) e trata
+    as demais como conflito, em que fica a linha processada por último; 'mais_recente'
+    fica sempre com essa linha; 'erro' interrompe. A guia consolidada leva o tipo da
+    ocorrência em `COLUNA_DUPLICIDADE`. No sistema interno fica o envio mais recente.
+    """
+    
+    COLUNAS_OCORRENCIAS = ['lado', 'numero_guia', 'linhas', 'tipo']
+    
+    def __init__(self, politica_operadora='somar', politica_interno='mais_recente'):
+        if politica_operadora not in POLITICAS_DUPLICIDADE_OPERADORA:
+            raise ValueError(f"Política desconhecida para o demonstrativo: {politica_operadora} "
+                             f"(disponíveis: {', '.join(POLITICAS_DUPLICIDADE_OPERADORA)})")
+        if politica_interno not in POLITICAS_DUPLICIDADE_INTERNO:
+            raise ValueError(f"Política desconhecida para o sistema interno: {politica_interno} "
+                             f"(disponíveis: {', '.join(POLITICAS_DUPLICIDADE_INTERNO)})")
+        self.politica_operadora = politica_operadora
+        self.politica_interno = politica_interno
+    
+    def _ocorrencias(self, lado, linhas, tipos):
+        return pd.DataFrame({'lado': lado, 'numero_guia': linhas.index.to_numpy(dtype=object),
+                             'linhas': linhas.to_numpy(dtype='int64'), 'tipo': tipos})
+    
+    def sem_ocorrencias(self):
+        return pd.DataFrame({coluna: pd.Series(dtype='int64' if coluna == 'linhas' else object)
+                             for coluna in self.COLUNAS_OCORRENCIAS})
+    
+    @staticmethod
+    def _exigir(politica, ocorrencias, descricao):
+        if politica == 'erro' and len(ocorrencias):
+            exemplos = ', '.join(ocorrencias['numero_guia'].head(5))
+            raise ValueError(f"{len(ocorrencias):,} guias repetidas {descricao} (ex.: {exemplos})")
+    
+    @staticmethod
+    def _substituir(serie, valores):
+        """Troca os valores da série pelos informados (alinhados pelo índice), ampliando as
+        categorias quando necessário"""
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            novas = pd.Index(valores.dropna().unique()).difference(serie.cat.categories)
+            serie = serie.cat.add_categories(novas) if len(novas) else serie
+        serie = serie.copy()
+        serie.loc[valores.index] = valores
+        return serie
+    
+    def _complementares(self, distintas, guias, valores_enviados):
+        """Guias (entre as informadas) cujas linhas distintas podem ser somadas"""
+        if valores_enviados is None:
+            return pd.Series(False, index=guias)
+        linhas = distintas[distintas['numero_guia'].isin(guias)]
+        pagas = linhas['status_operadora'].astype(str).str.startswith(PREFIXO_SITUACAO_PAGA)
+        por_guia = linhas.assign(_paga=pagas.to_numpy()).groupby('numero_guia', sort=True)
+        todas_pagas = por_guia['_paga'].all().reindex(guias)
+        total = por_guia['valor_pago'].sum().reindex(guias)
+        enviado = valores_enviados.reindex(guias)
+        return (todas_pagas & (total <= enviado)).fillna(False).astype(bool)
+    
+    def consolidar_operadora(self, df_operadora, valores_enviados=None):
+        """Uma linha por guia do demonstrativo; retorna também as ocorrências encontradas
+        
+        `valores_enviados` é o valor enviado (centavos) de cada guia interna, indexado pelo
+        número; sem ele, ou para guias que o sistema interno não tem, nada é somado.
+        """
+        repetidas = df_operadora['numero_guia'].duplicated(keep=False).to_numpy()
+        if not repetidas.any():
+            return df_operadora, self.sem_ocorrencias()
+        
+        grupo = df_operadora[repetidas]
+        # Linhas idênticas (mesmo hash em todas as colunas) contam uma vez só
+        distintas = grupo[~pd.util.hash_pandas_object(grupo, index=False).duplicated().to_numpy()]
+        linhas = grupo.groupby('numero_guia', sort=True).size()
+        variantes = distintas.groupby('numero_guia', sort=True).size().reindex(linhas.index)
+        diferentes = (variantes > 1).to_numpy()
+        complementares = np.zeros(len(linhas), dtype=bool)
+        if self.politica_operadora == 'somar' and diferentes.any():
+            complementares[diferentes] = self._complementares(distintas, linhas.index[diferentes],
+                                                              valores_enviados).to_numpy()
+        tipos = pd.Series(np.select([~diferentes, complementares], ['duplicata', 'complementar'], 'conflito'),
+                          index=linhas.index)
+        ocorrencias = self._ocorrencias('operadora', linhas, tipos.to_numpy())
+        self._exigir(self.politica_operadora, ocorrencias[ocorrencias['tipo'] != 'duplicata'],
+                     'com linhas conflitantes no demonstrativo')
+        
+        # Processada por último vence (empates: a que vem depois no arquivo)
+        ordenadas = distintas.sort_values('data_processamento', kind='stable', na_position='first')
+        consolidadas = ordenadas[~ordenadas['numero_guia'].duplicated(keep='last')]
+        consolidadas = consolidadas.assign(**{COLUNA_DUPLICIDADE: tipos.reindex(consolidadas['numero_guia']).to_numpy()})
+        
+        # Complementares: valor, situação e motivos vêm da soma de todas as linhas, nunca de uma só
+        if complementares.any():
+            somadas = distintas[distintas['numero_guia'].isin(linhas.index[complementares])]
+            por_guia = somadas.groupby('numero_guia', sort=True)
+            situacoes = por_guia['status_operadora'].nunique()
+            situacao = pd.Series(SITUACAO_PAGAMENTO_SOMADO, index=situacoes.index)[situacoes > 1]
+            motivos = somadas[['numero_guia', 'motivo_glosa']].dropna().astype({'motivo_glosa': str})
+            motivos = motivos[motivos['motivo_glosa'] != ''].drop_duplicates()
+            motivos = motivos.groupby('numero_guia', sort=True)['motivo_glosa'].agg('; '.join)
+            
+            # Índice das linhas consolidadas de cada guia, para alinhar os valores somados
+            linha = pd.Series(consolidadas.index, index=consolidadas['numero_guia'].to_numpy())
+            
+            def por_linha(valores):
+                return valores.set_axis(linha[valores.index].to_numpy())
+            
+            consolidadas = consolidadas.assign(
+                valor_pago=self._substituir(consolidadas['valor_pago'], por_linha(por_guia['valor_pago'].sum())),
+                status_operadora=self._substituir(consolidadas['status_operadora'], por_linha(situacao)),
+                motivo_glosa=self._substituir(consolidadas['motivo_glosa'], por_linha(motivos))
+            )
+        
+        df_operadora = pd.concat([df_operadora[~repetidas], consolidadas]).sort_index(kind='stable')
+        return df_operadora.reset_index(drop=True), ocorrencias
+    
+    def linhas_descartadas(self, guias, datas_envio, posicoes=None):
+        """Posições (ordenadas) das linhas do sistema interno descartadas entre guias repetidas
+        e as ocorrências
+        
+        `posicoes` identifica as linhas recebidas quando são só parte do arquivo (ex.: as
+        candidatas do modo streaming); sem ela, são as posições 0..n-1.
+        """
+        guias = pd.Series(np.asarray(guias, dtype=object))
+        posicoes = np.arange(len(guias)) if posicoes is None else np.asarray(posicoes, dtype='int64')
+        repetidas = guias.duplicated(keep=False).to_numpy()
+        if not repetidas.any():
+            return np.empty(0, dtype='int64'), self.sem_ocorrencias()
+        
+        grupo = pd.DataFrame({'numero_guia': guias.to_numpy()[repetidas],
+                              'data_envio': np.asarray(datas_envio)[repetidas], 'posicao': posicoes[repetidas]})
+        linhas = grupo.groupby('numero_guia', sort=True).size()
+        ocorrencias = self._ocorrencias('interno', linhas, 'repetida')
+        self._exigir(self.politica_interno, ocorrencias, 'no sistema interno')
+        
+        # Envio mais recente vence (empates: a linha que vem depois no arquivo)
+        grupo = grupo.sort_values('data_envio', kind='stable', na_position='first')
+        descartadas = grupo['posicao'].to_numpy()[grupo['numero_guia'].duplicated(keep='last').to_numpy()]
+        return np.sort(descartadas), ocorrencias
+    
+    def consolidar_interno(self, df_interno):
+        """Uma linha por guia do sistema interno; retorna também as ocorrências encontradas"""
+        descartadas, ocorrencias = self.linhas_descartadas(df_interno['numero_guia'], df_interno['data_envio'])
+        if not len(descartadas):
+            return df_interno, ocorrencias
+        manter = np.ones(len(df_interno), dtype=bool)
+        manter[descartadas] = False
+        return df_interno[manter].reset_index(drop=True), ocorrencias
+
+
+class GeradorDadosFicticios:
+    """Gerador vetorizado e reprodutível de guias e demonstrativos fictícios
+    
+    Gera blocos de guias com `np.random.default_rng`, sem laços por guia. Cada bloco
+    usa um gerador próprio semeado por (semente, número do bloco): a mesma semente,
+    o mesmo tamanho de bloco e a mesma data de referência produzem sempre os mesmos
+    dados, que podem ser gravados bloco a bloco em CSV ou Parquet.
+    """
+    
+    def __init__(self, total_guias=300, convenios=None, procedimentos=None, probabilidades_situacao=None,
+                 data_referencia=None, semente=42, tamanho_bloco=TAMANHO_CHUNK_PADRAO):
+        self.total_guias = total_guias
+        self.convenios, self.pesos_convenios = self._mix(convenios or CONVENIOS)
+        self.procedimentos, self.pesos_procedimentos = self._mix(procedimentos or PROCEDIMENTOS)
+        
+        probabilidades = dict(probabilidades_situacao or PROBABILIDADES_SITUACAO)
+        if set(probabilidades) != set(PROBABILIDADES_SITUACAO):
+            raise ValueError(f"Situações esperadas: {', '.join(PROBABILIDADES_SITUACAO)}")
+        self.probabilidades_situacao = self._normalizar([probabilidades[s] for s in PROBABILIDADES_SITUACAO])
+        
+        # Data fixa: sem ela os dados mudariam a cada execução
+        self.data_referencia = pd.Timestamp(
+            data_referencia or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        )
+        self.semente = semente
+        self.tamanho_bloco = tamanho_bloco
+    
+    @staticmethod
+    def _normalizar(pesos):
+        pesos = np.asarray(pesos, dtype='float64')
+        if (pesos < 0).any() or pesos.sum() <= 0:
+            raise ValueError("Pesos devem ser não negativos e somar mais que zero")
+        return pesos / pesos.sum()
+    
+    @classmethod
+    def _mix(cls, opcoes):
+        """Aceita uma lista (pesos iguais) ou um dicionário {opção: peso}"""
+        if isinstance(opcoes, dict):
+            return np.array(list(opcoes), dtype=object), cls._normalizar(list(opcoes.values()))
+        return np.array(list(opcoes), dtype=object), None
+    
+    def blocos(self):
+        """Gera (df_interno, df_operadora) bloco a bloco"""
+        for numero_bloco, inicio in enumerate(range(0, self.total_guias, self.tamanho_bloco)):
+            quantidade = min(self.tamanho_bloco, self.total_guias - inicio)
+            yield self.gerar_bloco(numero_bloco, inicio, quantidade)
+    
+    def gerar(self):
+        """Gera todos os dados em memória"""
+        blocos = list(self.blocos())
+        if len(blocos) == 1:
+            return blocos[0]
+        return tuple(pd.concat(partes, ignore_index=True) for partes in zip(*blocos))
+    
+    def gerar_bloco(self, numero_bloco, inicio, quantidade):
+        """Gera as guias [inicio, inicio + quantidade) e suas linhas no demonstrativo"""
+        rng = np.random.default_rng([self.semente, numero_bloco])
+        sequencia = np.arange(inicio + 1, inicio + quantidade + 1)
+        numeros = pd.Series(sequencia).astype(str)
+        referencia = self.data_referencia.to_datetime64()
+        
+        # 1. Sistema Interno (o que o hospital enviou)
+        valor_enviado = np.round(rng.uniform(50, 1500, quantidade), 2)
+        df_interno = pd.DataFrame({
+            'numero_guia': 'GH2024' + numeros.str.zfill(6),  # GH2024000001
+            'convenio': rng.choice(self.convenios, quantidade, p=self.pesos_convenios),
+            'data_atendimento': referencia - rng.integers(1, 60, quantidade).astype('timedelta64[D]'),
+            'paciente': 'Paciente ' + numeros.str.zfill(3),
+            'procedimento': rng.choice(self.procedimentos, quantidade, p=self.pesos_procedimentos),
+            'valor_enviado': valor_enviado,
+            'status_interno': rng.choice(['Enviado', 'Reenviado', 'Aguardando'], quantidade, p=[0.8, 0.15, 0.05]),
+            'data_envio': referencia - rng.integers(1, 30, quantidade).astype('timedelta64[D]'),
+            'lote': 'LT' + pd.Series(rng.integers(1000, 9999, quantidade)).astype(str)
+        })
+        
+        # 2. Demonstrativo da Operadora: uma situação sorteada por guia;
+        # as não processadas não aparecem no demonstrativo
+        situacoes = list(PROBABILIDADES_SITUACAO)
+        situacao = rng.choice(len(situacoes), quantidade, p=self.probabilidades_situacao)
+        paga_correta = situacao == situacoes.index('paga_correta')
+        valor_divergente = situacao == situacoes.index('valor_divergente')
+        glosada = situacao == situacoes.index('glosada')
+        
+        # Valor diferente (pode ser menor por co-participação, ou por tabela diferente)
+        fator = rng.choice([0.7, 0.8, 0.9, 1.1, 1.2], quantidade, p=[0.3, 0.3, 0.2, 0.1, 0.1])
+        valor_pago = np.select([paga_correta, valor_divergente], [valor_enviado, np.round(valor_enviado * fator, 2)], 0.0)
+        status_operadora = np.select([paga_correta, valor_divergente], ['Pago', 'Pago com Divergência'], 'Glosado')
+        motivo_glosa = np.select(
+            [valor_divergente, glosada],
+            [rng.choice(MOTIVOS_DIVERGENCIA, quantidade), rng.choice(MOTIVOS_GLOSA, quantidade)],
+            ''
+        )
+        data_processamento = referencia - rng.integers(1, 15, quantidade).astype('timedelta64[D]')
+        
+        processada = paga_correta | valor_divergente | glosada
+        df_operadora = pd.DataFrame({
+            'numero_guia': df_interno['numero_guia'],
+            'convenio': df_interno['convenio'],
+            'data_processamento': data_processamento,
+            'paciente': df_interno['paciente'],
+            'procedimento': df_interno['procedimento'],
+            'valor_pago': valor_pago,
+            'status_operadora': status_operadora,
+            'motivo_glosa': motivo_glosa
+        })[processada].reset_index(drop=True)
+        
+        return df_interno, df_operadora
+    
+    def gravar(self, arquivo_interno=ARQUIVO_INTERNO, arquivo_operadora=ARQUIVO_OPERADORA, formato='csv'):
+        """Grava os dados bloco a bloco em CSV ou Parquet, sem manter tudo em memória"""
+        if formato not in ('csv', 'parquet'):
+            raise ValueError(f"Formato não suportado: {formato}")
+        if formato == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+            raise ImportError("Gravação em Parquet requer o pacote pyarrow")
+        
+        for caminho in (arquivo_interno, arquivo_operadora):
+            os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        
+        totais = [0, 0]
+        escritores = [None, None]
+        try:
+            for numero_bloco, dfs in enumerate(self.blocos()):
+                for lado, (df, caminho) in enumerate(zip(dfs, (arquivo_interno, arquivo_operadora))):
+                    if formato == 'csv':
+                        df.to_csv(caminho, index=False, mode='w' if numero_bloco == 0 else 'a',
+                                  header=numero_bloco == 0)
+                    else:
+                        import pyarrow as pa
+                        import pyarrow.parquet as pq
+                        tabela = pa.Table.from_pandas(df, preserve_index=False)
+                        if escritores[lado] is None:
+                            escritores[lado] = pq.ParquetWriter(caminho, tabela.schema)
+                        escritores[lado].write_table(tabela.cast(escritores[lado].schema))
+                    totais[lado] += len(df)
+        finally:
+            for escritor in escritores:
+                if escritor is not None:
+                    escritor.close()
+        
+        return tuple(totais)
+
+
+def _conciliar_particao(conciliador, df_interno, df_operadora, data_referencia, adiar_pendentes=False):
+    """Concilia uma partição num processo do pool e devolve a conciliação e os totais
+    
+    Com `adiar_pendentes`, as guias sem correspondência exata ficam de fora: a correspondência
+    secundária as concilia depois, contra as órfãs de todas as partições.
+    """
+    conciliacao = conciliador.conciliar_guias(df_interno, df_operadora, data_referencia)
+    if adiar_pendentes:
+        conciliacao = conciliacao[conciliacao['regra_conciliacao'].notna()]
+    return conciliacao, AcumuladorRelatorio().adicionar(conciliacao)
+
+
+def _validar_saidas(saidas):
+    desconhecidas = set(saidas) - set(SAIDAS_DISPONIVEIS)
+    if desconhecidas:
+        raise ValueError(f"Saídas desconhecidas: {', '.join(sorted(desconhecidas))} "
+                         f"(disponíveis: {', '.join(SAIDAS_DISPONIVEIS)})")
+
+
+def _gerar_graficos_processo(conciliador, medidas, arquivo, dpi):
+    """Renderiza os gráficos num processo separado e devolve o arquivo e o tempo gasto"""
+    inicio = time.perf_counter()
+    arquivo = conciliador.gerar_graficos_conciliacao(None, medidas, arquivo, dpi)
+    return arquivo, round(time.perf_counter() - inicio, 4)
+
+
+def ler_csv_tipado(caminho, esquema, datas, colunas=None, chunksize=None):
+    """Lê um CSV aplicando o esquema de tipos e o formato fixo de datas"""
+    
+    def converter(df):
+        for coluna in datas:
+            if coluna in df.columns:
+                df[coluna] = pd.to_datetime(df[coluna], format=FORMATO_DATA)
+        for coluna in COLUNAS_MONETARIAS:
+            if coluna in df.columns:
+                df[coluna] = para_centavos(df[coluna])
+        return df
+    
+    leitor = pd.read_csv(caminho, dtype=esquema, usecols=colunas, chunksize=chunksize)
+    if chunksize is None:
+        return converter(leitor)
+    return (converter(df) for df in leitor)
+
+
+def _normalizar_nome_coluna(nome):
+    """Nome de coluna sem acentos, em minúsculas e com '_' como único separador"""
+    texto = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_')
+
+
+def mapear_colunas(nomes, sinonimos=None):
+    """Associa os nomes de um cabeçalho às colunas canônicas (cada uma usada uma vez)"""
+    normalizados = {}
+    for nome in nomes:
+        normalizados.setdefault(_normalizar_nome_coluna(nome), nome)
+    mapeamento = {}
+    for canonica, aceitos in (sinonimos or SINONIMOS_OPERADORA).items():
+        for aceito in aceitos:
+            nome = normalizados.get(_normalizar_nome_coluna(aceito))
+            if nome is not None and nome not in mapeamento:
+                mapeamento[nome] = canonica
+                break
+    return mapeamento
+
+
+def _validar_mapeamento(caminho, mapeamento):
+    """Exige as colunas sem as quais o demonstrativo não pode ser conciliado"""
+    faltantes = [coluna for coluna in ('numero_guia', 'valor_pago') if coluna not in mapeamento.values()]
+    if faltantes:
+        raise ValueError(f"Colunas obrigatórias não encontradas em {caminho}: {', '.join(faltantes)}")
+
+
+def _valores_decimais(serie):
+    """Valores em R$ vindos como número ou texto ('1.234,56', 'R$ 10,50' ou '944.44')"""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie
+    texto = serie.astype('string').str.replace(r'[R$\s]', '', regex=True)
+    virgula = texto.str.contains(',', regex=False, na=False)
+    texto = texto.where(~virgula, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    return pd.to_numeric(texto.replace('', pd.NA), errors='raise')
+
+
+def tipar_demonstrativo(df, formato_data=FORMATO_DATA, valores_em_centavos=False):
+    """Aplica o esquema do demonstrativo a um bloco já com as colunas canônicas"""
+    for coluna in COLUNAS_OPERADORA:
+        if coluna not in df.columns:
+            df[coluna] = None
+    # Nulos saem antes da conversão para texto (no pandas 2, None viraria a guia 'None')
+    df = df[df['numero_guia'].notna()]
+    df = df.assign(numero_guia=df['numero_guia'].astype(str).str.strip())
+    df = df[df['numero_guia'] != '']
+    if valores_em_centavos:
+        df['valor_pago'] = pd.to_numeric(df['valor_pago']).fillna(0).astype('int64')
+    else:
+        df['valor_pago'] = para_centavos(_valores_decimais(df['valor_pago']))
+    df['data_processamento'] = pd.to_datetime(df['data_processamento'], format=formato_data)
+    colunas = [coluna for coluna in df.columns if coluna in COLUNAS_OPERADORA + COLUNAS_CHAVE_SECUNDARIA]
+    return df[colunas].astype({
+        coluna: tipo for coluna, tipo in ESQUEMA_OPERADORA.items() if coluna in colunas and tipo != 'float64'
+    })
+
+
+class AdaptadorDemonstrativo:
+    """Leitura de um layout de demonstrativo em blocos, já nas colunas e tipos canônicos
+    
+    Cada adaptador implementa `blocos_brutos` (blocos com as colunas canônicas ainda
+    em texto); a tipagem é comum a todos. Só um bloco fica em memória durante a
+    leitura, e o resultado guarda apenas as colunas usadas na conciliação.
+    """
+    
+    formato_data = FORMATO_DATA
+    valores_em_centavos = False
+    convenio = None  # preenche o convênio em arquivos de uma só operadora
+    
+    def blocos_brutos(self, caminho, tamanho_bloco):
+        raise NotImplementedError
+    
+    def blocos(self, caminho, tamanho_bloco=TAMANHO_CHUNK_PADRAO):
+        """Blocos tipados do demonstrativo, prontos para a conciliação"""
+        for bloco in self.blocos_brutos(caminho, tamanho_bloco):
+            if self.convenio is not None and 'convenio' not in bloco.columns:
+                bloco['convenio'] = self.convenio
+            yield tipar_demonstrativo(bloco, self.formato_data, self.valores_em_centavos)
+    
+    def ler(self, caminho, tamanho_bloco=TAMANHO_CHUNK_PADRAO):
+        """Demonstrativo completo, com as categorias unificadas entre os blocos"""
+        blocos = list(self.blocos(caminho, tamanho_bloco))
+        if not blocos:
+            blocos = [tipar_demonstrativo(pd.DataFrame(columns=COLUNAS_OPERADORA))]
+        df = pd.concat(blocos, ignore_index=True) if len(blocos) > 1 else blocos[0].reset_index(drop=True)
+        return df.astype({
+            coluna: 'category' for coluna, tipo in ESQUEMA_OPERADORA.items() if tipo == 'category' and coluna in df.columns
+        })
+    
+    def assinatura(self):
+        """Identifica o adaptador e sua configuração (invalida o cache quando muda)"""
+        return f"{type(self).__name__}:{json.dumps(vars(self), sort_keys=True, default=str)}"
+
+
+class AdaptadorCSV(AdaptadorDemonstrativo):
+    """CSV com cabeçalho variável, separador e formato decimal configuráveis"""
+    
+    def __init__(self, sinonimos=None, separador=',', decimal='.', milhar=None, encoding='utf-8',
+                 formato_data=FORMATO_DATA, convenio=None):
+        self.sinonimos = sinonimos
+        self.separador = separador
+        self.decimal = decimal
+        self.milhar = milhar
+        self.encoding = encoding
+        self.formato_data = formato_data
+        self.convenio = convenio
+    
+    def blocos_brutos(self, caminho, tamanho_bloco):
+        cabecalho = pd.read_csv(caminho, sep=self.separador, encoding=self.encoding, nrows=0).columns
+        mapeamento = mapear_colunas(cabecalho, self.sinonimos)
+        _validar_mapeamento(caminho, mapeamento)
+        
+        # Tipos do esquema já na leitura (categorias e valores numéricos pelo parser em C)
+        tipos = {nome: ESQUEMA_OPERADORA.get(canonica, str) for nome, canonica in mapeamento.items()}
+        leitor = pd.read_csv(caminho, sep=self.separador, encoding=self.encoding, usecols=list(mapeamento),
+                             dtype=tipos, decimal=self.decimal, thousands=self.milhar, chunksize=tamanho_bloco)
+        for bloco in leitor:
+            yield bloco.rename(columns=mapeamento)
+
+
+class AdaptadorXLSX(AdaptadorDemonstrativo):
+    """Planilha XLSX lida em modo somente leitura, linha a linha
+    
+    O cabeçalho é a primeira linha (entre as `linhas_busca_cabecalho` iniciais) que
+    contém o número da guia e o valor pago; linhas de título acima dele são ignoradas.
+    """
+    
+    def __init__(self, sinonimos=None, aba=None, linhas_busca_cabecalho=20, formato_data='%d/%m/%Y',
+                 convenio=None):
+        self.sinonimos = sinonimos
+        self.aba = aba
+        self.linhas_busca_cabecalho = linhas_busca_cabecalho
+        self.formato_data = formato_data
+        self.convenio = convenio
+    
+    @staticmethod
+    def _texto(valor):
+        # Números de guia digitados como número voltam do Excel como float
+        if isinstance(valor, float) and valor.is_integer():
+            return str(int(valor))
+        return valor
+    
+    def blocos_brutos(self, caminho, tamanho_bloco):
+        from openpyxl import load_workbook
+        
+        wb = load_workbook(caminho, read_only=True, data_only=True)
+        try:
+            ws = wb[self.aba] if self.aba else wb.active
+            linhas = ws.iter_rows(values_only=True)
+            
+            mapeamento = {}
+            for _, linha in zip(range(self.linhas_busca_cabecalho), linhas):
+                mapeamento = mapear_colunas([nome for nome in linha if nome is not None], self.sinonimos)
+                if {'numero_guia', 'valor_pago'} <= set(mapeamento.values()):
+                    posicoes = {mapeamento[nome]: posicao for posicao, nome in enumerate(linha) if nome in mapeamento}
+                    break
+            _validar_mapeamento(caminho, mapeamento)
+            
+            colunas = {canonica: [] for canonica in posicoes}
+            for linha in linhas:
+                for canonica, posicao in posicoes.items():
+                    colunas[canonica].append(linha[posicao] if posicao < len(linha) else None)
+                colunas['numero_guia'][-1] = self._texto(colunas['numero_guia'][-1])
+                if len(colunas['numero_guia']) == tamanho_bloco:
+                    yield pd.DataFrame(colunas, dtype=object)
+                    colunas = {canonica: [] for canonica in posicoes}
+            if colunas['numero_guia']:
+                yield pd.DataFrame(colunas, dtype=object)
+        finally:
+            wb.close()
+
+
+class AdaptadorLarguraFixa(AdaptadorDemonstrativo):
+    """Texto em largura fixa, conforme um layout de posições (ver LAYOUT_LARGURA_FIXA)"""
+    
+    def __init__(self, layout=None, linhas_cabecalho=0, encoding='latin-1', formato_data='%Y%m%d',
+                 valores_em_centavos=True, convenio=None):
+        self.layout = [tuple(campo) for campo in (layout or LAYOUT_LARGURA_FIXA)]
+        self.linhas_cabecalho = linhas_cabecalho
+        self.encoding = encoding
+        self.formato_data = formato_data
+        self.valores_em_centavos = valores_em_centavos
+        self.convenio = convenio
+    
+    def blocos_brutos(self, caminho, tamanho_bloco):
+        _validar_mapeamento(caminho, {coluna: coluna for coluna, _, _ in self.layout})
+        leitor = pd.read_fwf(
+            caminho, colspecs=[(inicio, fim) for _, inicio, fim in self.layout],
+            names=[coluna for coluna, _, _ in self.layout], dtype=str, header=None,
+            skiprows=self.linhas_cabecalho, encoding=self.encoding, chunksize=tamanho_bloco
+        )
+        yield from leitor
+
+
+class AdaptadorTISS(AdaptadorDemonstrativo):
+    """Demonstrativo TISS (XML) lido com iterparse, uma guia por vez
+    
+    Cada elemento `registro` (por padrão, relacaoGuias) vira uma linha e é descartado
+    logo depois, junto com os elementos já lidos fora das guias: a memória não cresce
+    com o tamanho do arquivo. Os namespaces são ignorados na comparação dos nomes.
+    """
+    
+    def __init__(self, registro=REGISTRO_TISS, campos=None, formato_data=FORMATO_DATA, convenio=None):
+        self.registro = registro
+        self.campos = campos or CAMPOS_TISS
+        self.formato_data = formato_data
+        self.convenio = convenio
+    
+    def blocos_brutos(self, caminho, tamanho_bloco):
+        import xml.etree.ElementTree as ET
+        
+        colunas = {canonica: [] for canonica in self.campos}
+        cabecalhos = {}  # últimos valores lidos fora das guias (ex.: data do protocolo)
+        nomes = {}  # nome sem namespace de cada tag, calculado uma vez por tag
+        pilha = []
+        dentro_registro = 0
+        
+        for evento, elemento in ET.iterparse(caminho, events=('start', 'end')):
+            if evento == 'start':
+                nome = nomes.get(elemento.tag)
+                if nome is None:
+                    nome = nomes[elemento.tag] = elemento.tag.rsplit('}', 1)[-1]
+                pilha.append(elemento)
+                dentro_registro += nome == self.registro
+                continue
+            
+            nome = nomes[elemento.tag]
+            pilha.pop()
+            if nome == self.registro:
+                dentro_registro -= 1
+                valores = {}
+                for filho in elemento.iter():
+                    texto = filho.text and filho.text.strip()
+                    if texto:
+                        valores.setdefault(nomes[filho.tag], texto)
+                for canonica, candidatos in self.campos.items():
+                    colunas[canonica].append(next(
+                        (fonte[nome] for fonte in (valores, cabecalhos) for nome in candidatos if nome in fonte), None
+                    ))
+                if len(colunas['numero_guia']) == tamanho_bloco:
+                    yield pd.DataFrame(colunas, dtype=object)
+                    colunas = {canonica: [] for canonica in self.campos}
+            elif dentro_registro:
+                continue
+            elif elemento.text and elemento.text.strip():
+                cabecalhos[nome] = elemento.text.strip()
+            
+            # Elemento já consumido: sai da árvore para não acumular em memória
+            if pilha:
+                pilha[-1].remove(elemento)
+        
+        if colunas['numero_guia']:
+            yield pd.DataFrame(colunas, dtype=object)
+
+
+# Adaptador usado para cada extensão de arquivo do demonstrativo (substituível no ConciliadorGuias)
+ADAPTADORES_DEMONSTRATIVO = {
+    '.csv': AdaptadorCSV(),
+    '.xml': AdaptadorTISS(),
+    '.xlsx': AdaptadorXLSX(),
+    '.txt': AdaptadorLarguraFixa(),
+}
+
+
+class EstadoConciliacao:
+    """Estado persistido da conciliação (SQLite), atualizado apenas com as guias alteradas"""
+    
+    COLUNAS_INTERNO = [
+        'numero_guia', 'convenio', 'data_atendimento', 'paciente', 'procedimento',
+        'valor_enviado', 'status_interno', 'data_envio', 'lote'
+    ]
+    COLUNAS_RESULTADO = [
+        'diferenca_valor', 'percentual_divergencia', 'classificacao',
+        'regra_conciliacao', 'confianca_conciliacao', 'numero_guia_operadora', COLUNA_DUPLICIDADE
+    ]
+    COLUNAS_DATA = ['data_atendimento', 'data_envio', 'data_processamento']
+    CHAVES_AGREGADO = ['convenio', 'mes_envio', 'classificacao']
+    
+    # Versão do formato gravado (1: valores das guias em centavos; 2: cubo de glosas)
+    VERSAO = 2
+    
+    def __init__(self, caminho=ARQUIVO_ESTADO, tipo_classificacao=None):
+        self.caminho = caminho
+        self.tipo_classificacao = tipo_classificacao
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        self.con = sqlite3.connect(caminho)
+        
+        colunas = self.COLUNAS_INTERNO[1:] + COLUNAS_OPERADORA[1:] + self.COLUNAS_RESULTADO
+        self.con.executescript(f"""
+            CREATE TABLE IF NOT EXISTS guias (
+                numero_guia TEXT PRIMARY KEY,
+                {', '.join(colunas)},
+                assinatura_interno INTEGER NOT NULL,
+                assinatura_operadora INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_guias_classificacao ON guias (classificacao);
+            CREATE INDEX IF NOT EXISTS idx_guias_diferenca ON guias (diferenca_valor);
+            CREATE TABLE IF NOT EXISTS agregados (
+                convenio TEXT NOT NULL,
+                mes_envio TEXT NOT NULL,
+                classificacao TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                valor_enviado_centavos INTEGER NOT NULL,
+                valor_pago_centavos INTEGER NOT NULL,
+                diferenca_centavos INTEGER NOT NULL,
+                PRIMARY KEY (convenio, mes_envio, classificacao)
+            );
+            CREATE TABLE IF NOT EXISTS agregados_glosas (
+                convenio TEXT NOT NULL,
+                procedimento TEXT NOT NULL,
+                motivo_glosa TEXT NOT NULL,
+                mes_envio TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                quantidade_glosada INTEGER NOT NULL,
+                quantidade_divergente INTEGER NOT NULL,
+                valor_enviado INTEGER NOT NULL,
+                valor_glosado INTEGER NOT NULL,
+                valor_divergente INTEGER NOT NULL,
+                PRIMARY KEY (convenio, procedimento, motivo_glosa, mes_envio)
+            );
+        """)
+        self._migrar(colunas)
+    
+    def _migrar(self, colunas):
+        """Atualiza estados gravados por versões anteriores"""
+        existentes = {linha[1] for linha in self.con.execute('PRAGMA table_info(guias)')}
+        faltantes = [coluna for coluna in colunas if coluna not in existentes]
+        versao = self.con.execute('PRAGMA user_version').fetchone()[0]
+        if not faltantes and versao >= self.VERSAO:
+            return
+        with self.con:
+            for coluna in faltantes:
+                self.con.execute(f'ALTER TABLE guias ADD COLUMN {coluna}')
+            # Estados anteriores só conheciam a correspondência exata pelo número da guia
+            if 'regra_conciliacao' in faltantes:
+                self.con.execute(f"""
+                    UPDATE guias SET regra_conciliacao = 'numero_guia', confianca_conciliacao = 1.0
+                    WHERE assinatura_operadora != {self.SEM_ASSINATURA}
+                """)
+            # Versão 1: valores das guias passam de R$ (float) a centavos inteiros
+            if versao < 1:
+                self.con.execute(f"""
+                    UPDATE guias SET {', '.join(
+                        f'{coluna} = CAST(ROUND({coluna} * 100) AS INTEGER)' for coluna in COLUNAS_MONETARIAS
+                    )}
+                """)
+            # Versão 2: cubo de glosas, montado a partir das guias já gravadas
+            if versao < 2:
+                self._somar_cubo_glosas(CuboGlosas.calcular(
+                    self._tipar(pd.read_sql_query('SELECT * FROM guias', self.con))
+                ))
+            self.con.execute(f'PRAGMA user_version = {self.VERSAO}')
+    
+    def fechar(self):
+        self.con.close()
+    
+    # Assinatura usada quando a guia não consta do demonstrativo. Sem NULL a coluna
+    # volta do SQLite como int64; com NULL o pandas a converteria para float64,
+    # perdendo precisão nas assinaturas de 64 bits
+    SEM_ASSINATURA = 0
+    
+    @staticmethod
+    def assinar(df, colunas):
+        """Assinatura (hash de 64 bits) de cada linha nas colunas informadas"""
+        return pd.Series(
+            pd.util.hash_pandas_object(df[colunas], index=False).values.view('int64'),
+            index=df['numero_guia'].values
+        )
+    
+    def _carregar_chaves(self, chaves):
+        """Carrega as guias informadas numa tabela temporária para junções"""
+        self.con.execute('DROP TABLE IF EXISTS temp.chaves')
+        self.con.execute('CREATE TEMP TABLE chaves (numero_guia TEXT PRIMARY KEY)')
+        self.con.executemany('INSERT OR IGNORE INTO temp.chaves VALUES (?)', ((chave,) for chave in chaves))
+    
+    def _consultar_chaves(self, chaves, consulta):
+        """Executa uma consulta restrita às guias informadas"""
+        self._carregar_chaves(chaves)
+        return pd.read_sql_query(consulta, self.con)
+    
+    def _tipar(self, df, data_referencia=None):
+        """Restaura os tipos de uma leitura do SQLite"""
+        for coluna in self.COLUNAS_DATA:
+            if coluna in df.columns:
+                df[coluna] = pd.to_datetime(df[coluna], format=FORMATO_DATA)
+        if 'classificacao' in df.columns and self.tipo_classificacao is not None:
+            df['classificacao'] = df['classificacao'].astype(self.tipo_classificacao)
+        if data_referencia is not None:
+            df['dias_em_aberto'] = (data_referencia - df['data_envio']).dt.days
+        return df
+    
+    def guias_armazenadas(self, chaves):
+        """Linhas já conciliadas das guias informadas"""
+        guias = self._consultar_chaves(chaves, 'SELECT g.* FROM guias g JOIN temp.chaves USING (numero_guia)')
+        return self._tipar(guias).set_index('numero_guia', drop=False)
+    
+    def guias_revinculaveis(self):
+        """Guias sem correspondência exata, candidatas à correspondência secundária"""
+        guias = pd.read_sql_query(
+            "SELECT * FROM guias WHERE regra_conciliacao IS NULL OR regra_conciliacao != 'numero_guia'", self.con
+        )
+        return self._tipar(guias).set_index('numero_guia', drop=False)
+    
+    @classmethod
+    def _contribuicoes(cls, conciliacao):
+        """Contribuição de cada guia para a tabela de agregados (valores em centavos)"""
+        contribuicoes = pd.DataFrame({
+            'convenio': conciliacao['convenio'].astype(object).fillna(''),
+            'mes_envio': conciliacao['data_envio'].dt.strftime('%Y-%m').fillna(''),
+            'classificacao': conciliacao['classificacao'].astype(object),
+            'quantidade': 1,
+            'valor_enviado_centavos': conciliacao['valor_enviado'].astype('int64'),
+            'valor_pago_centavos': conciliacao['valor_pago'].astype('int64'),
+            'diferenca_centavos': conciliacao['diferenca_valor'].astype('int64'),
+        })
+        return contribuicoes.groupby(cls.CHAVES_AGREGADO).sum()
+    
+    def _somar_cubo_glosas(self, cubo):
+        """Soma um cubo (ou a diferença entre dois) à tabela do cubo de glosas"""
+        colunas = CuboGlosas.DIMENSOES + CuboGlosas.MEDIDAS
+        self.con.executemany(f"""
+            INSERT INTO agregados_glosas VALUES ({', '.join('?' * len(colunas))})
+            ON CONFLICT ({', '.join(CuboGlosas.DIMENSOES)}) DO UPDATE SET
+                {', '.join(f'{medida} = {medida} + excluded.{medida}' for medida in CuboGlosas.MEDIDAS)}
+        """, cubo.dados[colunas].itertuples(index=False, name=None))
+        self.con.execute('DELETE FROM agregados_glosas WHERE quantidade = 0')
+    
+    def registrar(self, conciliacao, anteriores):
+        """Grava as guias reconciliadas e ajusta os agregados pela diferença"""
+        delta = self._contribuicoes(conciliacao)
+        delta_glosas = CuboGlosas.calcular(conciliacao)
+        if not anteriores.empty:
+            delta = delta.sub(self._contribuicoes(anteriores), fill_value=0).astype('int64')
+            removidas = CuboGlosas.calcular(anteriores).dados
+            removidas[CuboGlosas.MEDIDAS] = -removidas[CuboGlosas.MEDIDAS]
+            delta_glosas = CuboGlosas.unir([delta_glosas, CuboGlosas(removidas)])
+        
+        linhas = conciliacao[self.COLUNAS_INTERNO + COLUNAS_OPERADORA[1:] + self.COLUNAS_RESULTADO
+                             + ['assinatura_interno', 'assinatura_operadora']].copy()
+        for coluna in ['convenio', 'procedimento', 'status_interno', 'lote',
+                       'status_operadora', 'motivo_glosa', 'classificacao']:
+            linhas[coluna] = linhas[coluna].astype(object)
+        for coluna in self.COLUNAS_DATA:
+            linhas[coluna] = linhas[coluna].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+        
+        with self.con:
+            self._carregar_chaves(linhas['numero_guia'])
+            self.con.execute('DELETE FROM guias WHERE numero_guia IN (SELECT numero_guia FROM temp.chaves)')
+            linhas.to_sql('guias', self.con, if_exists='append', index=False)
+            
+            self.con.executemany("""
+                INSERT INTO agregados VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (convenio, mes_envio, classificacao) DO UPDATE SET
+                    quantidade = quantidade + excluded.quantidade,
+                    valor_enviado_centavos = valor_enviado_centavos + excluded.valor_enviado_centavos,
+                    valor_pago_centavos = valor_pago_centavos + excluded.valor_pago_centavos,
+                    diferenca_centavos = diferenca_centavos + excluded.diferenca_centavos
+            """, (tuple(chave) + tuple(int(v) for v in valores)
+                  for chave, valores in zip(delta.index, delta.values)))
+            self.con.execute('DELETE FROM agregados WHERE quantidade = 0')
+            self._somar_cubo_glosas(delta_glosas)
+    
+    def _ler_guias(self, filtro='', parametros=(), data_referencia=None, ordem='numero_guia'):
+        consulta = f"SELECT * FROM guias {filtro} ORDER BY {ordem}"
+        df = pd.read_sql_query(consulta, self.con, params=parametros)
+        return self._tipar(df.drop(columns=['assinatura_interno', 'assinatura_operadora']),
+                           data_referencia or datetime.now())
+    
+    def carregar_conciliacao(self, data_referencia=None):
+        """Conciliação completa armazenada, com dias em aberto na data de referência"""
+        return self._ler_guias(data_referencia=data_referencia)
+    
+    def gerar_relatorio(self, data_referencia=None, top_n=10):
+        """Monta o relatório a partir dos agregados e de consultas indexadas"""
+        data_referencia = data_referencia or datetime.now()
+        agregados = pd.read_sql_query('SELECT * FROM agregados', self.con)
+        agregados = agregados.rename(columns={
+            'quantidade': 'numero_guia', 'valor_enviado_centavos': 'valor_enviado',
+            'valor_pago_centavos': 'valor_pago', 'diferenca_centavos': 'diferenca_valor'
+        })
+        
+        valor_enviado_total = int(agregados['valor_enviado'].sum())
+        valor_pago_total = int(agregados['valor_pago'].sum())
+        diferenca_total = valor_pago_total - valor_enviado_total
+        
+        stats_classificacao = agregados.groupby('classificacao')['numero_guia'].sum()
+        if self.tipo_classificacao is not None:
+            stats_classificacao = stats_classificacao.reindex(self.tipo_classificacao.categories, fill_value=0)
+            stats_classificacao.index = pd.CategoricalIndex(stats_classificacao.index, dtype=self.tipo_classificacao,
+                                                            name='classificacao')
+        stats_classificacao = stats_classificacao.sort_values(ascending=False, kind='stable').rename('count')
+        stats_classificacao = stats_classificacao[stats_classificacao > 0]
+        
+        colunas_convenio = ['numero_guia', 'valor_enviado', 'valor_pago', 'diferenca_valor']
+        resumo_convenio = agregados[agregados['convenio'] != ''].groupby('convenio')[colunas_convenio].sum()
+        
+        evolucao_mensal = agregados[agregados['mes_envio'] != ''].groupby('mes_envio')[
+            ['diferenca_valor', 'numero_guia']
+        ].sum()
+        evolucao_mensal.index = pd.PeriodIndex(evolucao_mensal.index, freq='M', name='mes_envio')
+        
+        # Guias não processadas: filtra a idade na data de referência
+        nao_processadas = self._ler_guias('WHERE classificacao = ?', ('🔴 Não Processado',), data_referencia)
+        
+        # Histograma em faixas fixas agrupado no próprio SQLite (resto sempre positivo: piso da divisão)
+        faixa = f'diferenca_valor - ((diferenca_valor % {LARGURA_FAIXA_HISTOGRAMA}) + {LARGURA_FAIXA_HISTOGRAMA}) % {LARGURA_FAIXA_HISTOGRAMA}'
+        histograma = pd.read_sql_query(
+            f'SELECT {faixa} AS faixa, count(*) AS quantidade FROM guias WHERE diferenca_valor != 0 '
+            f'GROUP BY faixa ORDER BY faixa', self.con
+        )
+        histograma_divergencias = pd.Series(histograma['quantidade'].to_numpy(dtype='int64'),
+                                            index=histograma['faixa'].to_numpy(dtype='int64'))
+        
+        return RelatorioDivergencias({
+            'resumo_geral': {
+                'total_guias': int(agregados['numero_guia'].sum()),
+                'valor_enviado_total': valor_enviado_total,
+                'valor_pago_total': valor_pago_total,
+                'diferenca_total': diferenca_total,
+                'percentual_diferenca_total': (diferenca_total / valor_enviado_total * 100) if valor_enviado_total > 0 else 0
+            },
+            'stats_classificacao': stats_classificacao,
+            'divergencias_significativas': self._ler_guias(
+                'WHERE abs(percentual_divergencia) > 5 OR abs(diferenca_valor) > 5000',
+                data_referencia=data_referencia
+            ),
+            'maiores_divergencias': self._ler_guias(
+                'WHERE diferenca_valor != 0', data_referencia=data_referencia,
+                ordem=f'diferenca_valor DESC, numero_guia LIMIT {int(top_n)}'
+            ),
+            'nao_processadas_antigas': nao_processadas[nao_processadas['dias_em_aberto'] > 30],
+            'resumo_convenio': resumo_convenio,
+            'evolucao_mensal': evolucao_mensal,
+            'histograma_divergencias': histograma_divergencias,
+            'cubo_glosas': CuboGlosas(pd.read_sql_query(
+                f"SELECT * FROM agregados_glosas ORDER BY {', '.join(CuboGlosas.DIMENSOES)}", self.con
+            ))
+        })
+
+
+class IndiceAging:
+    """Guias em aberto (não processadas ou glosadas) ordenadas por convênio, lote e data de envio
+    
+    A tabela é WITHOUT ROWID com chave (convenio, lote, data_envio, numero_guia), ou seja, fica
+    gravada nessa ordem: consultas por convênio, lote e faixa de dias são buscas por intervalo.
+    Os dias em aberto são calculados na consulta, a partir da data de envio.
+    """
+    
+    COLUNAS = ['convenio', 'lote', 'data_envio', 'numero_guia', 'classificacao', 'paciente',
+               'procedimento', 'valor_enviado', 'valor_pago', 'motivo_glosa']
+    FORMATO_DATA_SQL = '%Y-%m-%d %H:%M:%S.%f'
+    
+    def __init__(self, caminho=ARQUIVO_INDICE_AGING):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        self.con = sqlite3.connect(caminho)
+        self.con.executescript("""
+            CREATE TABLE IF NOT EXISTS guias_em_aberto (
+                convenio TEXT NOT NULL,
+                lote TEXT NOT NULL,
+                data_envio TEXT NOT NULL,
+                numero_guia TEXT NOT NULL,
+                classificacao TEXT NOT NULL,
+                paciente TEXT,
+                procedimento TEXT,
+                valor_enviado INTEGER NOT NULL,
+                valor_pago INTEGER NOT NULL,
+                motivo_glosa TEXT,
+                PRIMARY KEY (convenio, lote, data_envio, numero_guia)
+            ) WITHOUT ROWID;
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_aberto_guia ON guias_em_aberto (numero_guia);
+            CREATE INDEX IF NOT EXISTS idx_aberto_lote ON guias_em_aberto (lote, data_envio);
+            CREATE INDEX IF NOT EXISTS idx_aberto_envio ON guias_em_aberto (data_envio);
+            CREATE TABLE IF NOT EXISTS metadados (chave TEXT PRIMARY KEY, valor TEXT);
+        """)
+    
+    def fechar(self):
+        self.con.close()
+    
+    def atualizado_em(self):
+        """Momento da última atualização (None se o índice nunca foi preenchido)"""
+        linha = self.con.execute("SELECT valor FROM metadados WHERE chave = 'atualizado_em'").fetchone()
+        return linha[0] if linha else None
+    
+    def atualizar(self, conciliacao, completa=True):
+        """Regrava o índice a partir da conciliação; com `completa=False`, só as guias informadas"""
+        if isinstance(conciliacao, ConciliacaoEmDisco):
+            blocos = conciliacao.blocos_por_classificacao(classificacoes=CLASSIFICACOES_EM_ABERTO)
+        else:
+            blocos = [conciliacao]
+        
+        total = 0
+        with self.con:
+            if completa:
+                self.con.execute('DELETE FROM guias_em_aberto')
+            for bloco in blocos:
+                if not completa:
+                    self.con.executemany('DELETE FROM guias_em_aberto WHERE numero_guia = ?',
+                                         ((guia,) for guia in bloco['numero_guia']))
+                linhas = self._linhas(bloco[bloco['classificacao'].isin(CLASSIFICACOES_EM_ABERTO)])
+                linhas.to_sql('guias_em_aberto', self.con, if_exists='append', index=False)
+                total += len(linhas)
+            self.con.execute("INSERT OR REPLACE INTO metadados VALUES ('atualizado_em', ?)",
+                             (datetime.now().isoformat(timespec='seconds'),))
+        return total
+    
+    def _linhas(self, guias):
+        """Linhas no formato da tabela (chaves ausentes viram texto vazio, valores em centavos)"""
+        linhas = pd.DataFrame({
+            'convenio': guias['convenio'].astype(object).fillna(''),
+            'lote': guias['lote'].astype(object).fillna(''),
+            'data_envio': guias['data_envio'].dt.strftime(self.FORMATO_DATA_SQL).fillna(''),
+            'numero_guia': guias['numero_guia'].astype(object),
+            'classificacao': guias['classificacao'].astype(object),
+            'paciente': guias['paciente'].astype(object),
+            'procedimento': guias['procedimento'].astype(object),
+            'valor_enviado': guias['valor_enviado'].astype('int64'),
+            'valor_pago': guias['valor_pago'].astype('int64'),
+            'motivo_glosa': guias['motivo_glosa'].astype(object),
+        })
+        return linhas.sort_values(['convenio', 'lote', 'data_envio', 'numero_guia'])
+    
+    def _limite(self, data_referencia, dias):
+        """Data de envio que completa `dias` dias em aberto na data de referência"""
+        return (data_referencia - timedelta(days=dias)).strftime(self.FORMATO_DATA_SQL)
+    
+    def _filtro(self, convenio=None, lote=None, dias_minimo=None, dias_maximo=None, faixa=None,
+                data_referencia=None):
+        """Cláusula WHERE (sobre as colunas indexadas) e parâmetros da consulta"""
+        if faixa is not None:
+            faixas = {nome: (minimo, maximo) for nome, minimo, maximo in FAIXAS_AGING}
+            if faixa not in faixas:
+                raise ValueError(f"Faixa desconhecida: {faixa} (disponíveis: {', '.join(faixas)})")
+            dias_minimo, dias_maximo = faixas[faixa]
+        
+        condicoes, parametros = ["data_envio != ''"], []
+        if convenio is not None:
+            condicoes.append('convenio = ?')
+            parametros.append(convenio)
+        if lote is not None:
+            condicoes.append('lote = ?')
+            parametros.append(lote)
+        # dias_em_aberto >= N  <=>  data_envio <= referência - N dias
+        if dias_minimo is not None:
+            condicoes.append('data_envio <= ?')
+            parametros.append(self._limite(data_referencia, dias_minimo))
+        # dias_em_aberto <= N  <=>  data_envio > referência - (N + 1) dias
+        if dias_maximo is not None:
+            condicoes.append('data_envio > ?')
+            parametros.append(self._limite(data_referencia, dias_maximo + 1))
+        return 'WHERE ' + ' AND '.join(condicoes), parametros
+    
+    def consultar(self, convenio=None, lote=None, dias_minimo=None, dias_maximo=None, faixa=None,
+                  data_referencia=None, limite=None):
+        """Guias em aberto que atendem aos filtros, das mais antigas para as mais recentes"""
+        data_referencia = data_referencia or datetime.now()
+        filtro, parametros = self._filtro(convenio, lote, dias_minimo, dias_maximo, faixa, data_referencia)
+        consulta = f"SELECT * FROM guias_em_aberto {filtro} ORDER BY data_envio, numero_guia"
+        if limite is not None:
+            consulta += f" LIMIT {int(limite)}"
+        
+        guias = pd.read_sql_query(consulta, self.con, params=parametros)
+        guias['data_envio'] = pd.to_datetime(guias['data_envio'], format=FORMATO_DATA)
+        guias['dias_em_aberto'] = (data_referencia - guias['data_envio']).dt.days
+        guias['faixa_aging'] = self.faixas(guias['dias_em_aberto'])
+        return guias[self.COLUNAS + ['dias_em_aberto', 'faixa_aging']]
+    
+    @staticmethod
+    def faixas(dias_em_aberto):
+        """Faixa de aging (0-30, 31-60, 61-90, 90+) de cada quantidade de dias"""
+        limites = [maximo for _, _, maximo in FAIXAS_AGING if maximo is not None]
+        rotulos = np.array([nome for nome, _, _ in FAIXAS_AGING], dtype=object)
+        return pd.Categorical(rotulos[np.searchsorted(limites, dias_em_aberto.to_numpy(), side='left')],
+                              categories=rotulos)
+    
+    def resumo_faixas(self, convenio=None, lote=None, data_referencia=None, agrupar_por='convenio',
+                      dias_minimo=None, dias_maximo=None, faixa=None):
+        """Quantidade e valores em aberto por faixa de aging, agrupados por convênio ou lote
+        (com os mesmos filtros de `consultar`)"""
+        if agrupar_por not in ('convenio', 'lote'):
+            raise ValueError(f"Agrupamento não suportado: {agrupar_por}")
+        data_referencia = data_referencia or datetime.now()
+        filtro, parametros = self._filtro(convenio, lote, dias_minimo, dias_maximo, faixa, data_referencia)
+        
+        # Faixas pelos limites de data de envio, sem calcular dias linha a linha
+        casos, limites = [], []
+        for nome, _, maximo in FAIXAS_AGING:
+            if maximo is None:
+                casos.append(f"ELSE '{nome}'")
+            else:
+                casos.append(f"WHEN data_envio > ? THEN '{nome}'")
+                limites.append(self._limite(data_referencia, maximo + 1))
+        consulta = f"""
+            SELECT {agrupar_por}, CASE {' '.join(casos)} END AS faixa_aging,
+                   COUNT(*) AS quantidade, SUM(valor_enviado) AS valor_enviado,
+                   SUM(valor_enviado - valor_pago) AS valor_em_aberto
+            FROM guias_em_aberto {filtro}
+            GROUP BY 1, 2
+        """
+        resumo = pd.read_sql_query(consulta, self.con, params=limites + parametros)
+        resumo['faixa_aging'] = pd.Categorical(resumo['faixa_aging'], categories=[nome for nome, _, _ in FAIXAS_AGING])
+        return resumo.sort_values([agrupar_por, 'faixa_aging']).set_index([agrupar_por, 'faixa_aging'])
+
+
+def _zerar_pico_memoria():
+    """Zera o pico de RSS do processo (Linux); nos demais sistemas o pico é cumulativo"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as arquivo:
+            arquivo.write('5')
+    except OSError:
+        pass
+
+
+def _pico_memoria_mb():
+    """Pico de RSS do processo em MB (None se o sistema não informar)"""
+    try:
+        with open('/proc/self/status') as arquivo:
+            for linha in arquivo:
+                if linha.startswith('VmHWM:'):
+                    return round(int(linha.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if importlib.util.find_spec('resource') is None:
+        return None
+    import resource
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em bytes no macOS e em KB nos demais
+    return round(pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024, 1)
+
+
+class MedidorEtapas:
+    """Tempo de parede, pico de RSS, linhas e vazão de cada etapa medida
+    
+    Com `arquivo_metricas`, cada etapa concluída (ou com erro) vira uma linha JSON
+    no arquivo, identificada pela execução, para consumo por agendadores e alertas.
+    """
+    
+    def __init__(self, arquivo_metricas=None, execucao=None):
+        self.etapas = {}
+        self.arquivo_metricas = arquivo_metricas
+        self.execucao = execucao or datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    @contextmanager
+    def etapa(self, nome, linhas_entrada=None):
+        """Mede o bloco; o chamador pode anotar `linhas_saida` (e outros campos) no dicionário"""
+        medida = {}
+        _zerar_pico_memoria()
+        inicio = time.perf_counter()
+        try:
+            yield medida
+        except Exception as e:
+            self.etapas[nome] = {'segundos': round(time.perf_counter() - inicio, 4),
+                                 'erro': f"{type(e).__name__}: {e}"}
+            self.registrar('etapa', etapa=nome, **self.etapas[nome])
+            raise
+        segundos = time.perf_counter() - inicio
+        self.etapas[nome] = {
+            'segundos': round(segundos, 4),
+            'pico_rss_mb': _pico_memoria_mb(),
+            'linhas_entrada': linhas_entrada,
+            'linhas_por_segundo': round(linhas_entrada / segundos) if linhas_entrada and segundos > 0 else None,
+            **medida
+        }
+        self.registrar('etapa', etapa=nome, **self.etapas[nome])
+    
+    def registrar(self, evento, **campos):
+        """Acrescenta um evento ao arquivo de métricas (JSON lines)"""
+        if self.arquivo_metricas is None:
+            return
+        linha = {'momento': datetime.now().isoformat(timespec='milliseconds'),
+                 'execucao': self.execucao, 'evento': evento, **campos}
+        with open(self.arquivo_metricas, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(json.dumps(linha, ensure_ascii=False, default=str) + '\n')
+    
+    def pico_memoria_mb(self):
+        """Maior pico de RSS entre as etapas medidas"""
+        picos = [medida['pico_rss_mb'] for medida in self.etapas.values() if medida.get('pico_rss_mb')]
+        return max(picos) if picos else None
+
 
 class ConciliadorGuias:
-    def __init__(self):
-        self.setup_directories()
-        
-    def setup_directories(self):
-        """Cria diretórios necessários"""
-        directories = ['dados', 'relatorios', 'graficos', 'conciliacao']
-        for directory in directories:
-            if not os.path.exists(directory):
-                os.makedirs(directory)
-    
-    def gerar_dados_ficticios(self):
-        """Gera dados fictícios para demonstração"""
-        np.random.seed(42)
-        
-        # Dados básicos
-        convenios = ['Unimed', 'Bradesco', 'SulAmerica', 'Amil', 'NotreDame']
-        procedimentos = [
-            'Consulta Cardiologia', 'Exame ECG', 'Ultrassom Abdomen', 'Raio-X Torax',
-            'Consulta Ortopedia', 'Ressonancia Magnetica', 'Tomografia', 'Endoscopia',
-            'Hemograma Completo', 'Glicemia', 'Colesterol Total', 'Ureia e Creatinina'
-        ]
+    def __init__(self, regras_classificacao=None, classificacao_padrao=CLASSIFICACAO_PADRAO,
+                 correspondencia_secundaria=True, arquivo_interno=ARQUIVO_INTERNO,
+                 arquivo_operadora=ARQUIVO_OPERADORA, diretorio_saida='', diretorio_cache=DIRETORIO_CACHE,
+                 arquivo_estado=ARQUIVO_ESTADO, adaptadores_demonstrativo=None, duplicidades=True):
+        self.regras_classificacao = list(regras_classificacao or REGRAS_CLASSIFICACAO)
+        self.classificacao_padrao = classificacao_padrao
+        # True usa a configuração padrão; também aceita uma instância já configurada ou False
+        if correspondencia_secundaria is True:
+            correspondencia_secundaria = CorrespondenciaSecundaria()
+        self.correspondencia = correspondencia_secundaria or None
+        # Consolidação das guias repetidas antes da junção (True: políticas padrão; False: a junção
+        # só exige uma linha do demonstrativo por guia e falha se houver repetidas)
+        if duplicidades is True:
+            duplicidades = ConsolidacaoDuplicidades()
+        self.duplicidades = duplicidades or None
+        self.ocorrencias_duplicidade = None  # guias repetidas encontradas na última carga
+        # Sem efeitos no disco aqui: os diretórios são criados na primeira gravação
+        self.arquivo_interno = arquivo_interno
+        self.arquivo_operadora = arquivo_operadora
+        self.diretorio_saida = diretorio_saida
+        self.arquivo_estado = arquivo_estado
+        self.cache = CacheColunar(diretorio_cache)
+        # Adaptador de cada extensão de demonstrativo; os informados substituem os padrão
+        self.adaptadores_demonstrativo = {**ADAPTADORES_DEMONSTRATIVO, **(adaptadores_demonstrativo or {})}
         
-        # 1. Sistema Interno (o que o hospital enviou)
-        guias_internas = []
-        for i in range(300):  # 300 guias
-            numero_guia = f"GH{2024}{str(i+1).zfill(6)}"  # GH2024000001
-            convenio = np.random.choice(convenios)
-            
-            guia = {
-                'numero_guia': numero_guia,
-                'convenio': convenio,
-                'data_atendimento': datetime.now() - timedelta(days=np.random.randint(1, 60)),
-                'paciente': f"Paciente {i+1:03d}",
-                'procedimento': np.random.choice(procedimentos),
-                'valor_enviado': round(np.random.uniform(50, 1500), 2),
-                'status_interno': np.random.choice(['Enviado', 'Reenviado', 'Aguardando'], p=[0.8, 0.15, 0.05]),
-                'data_envio': datetime.now() - timedelta(days=np.random.randint(1, 30)),
-                'lote': f"LT{np.random.randint(1000, 9999)}"
-            }
-            guias_internas.append(guia)
-        
-        df_interno = pd.DataFrame(guias_internas)
-        
-        # 2. Demonstrativo da Operadora (o que a operadora processou)
-        # Simula algumas situações reais:
-        # - 70% das guias pagas corretamente
-        # - 15% com valores divergentes
-        # - 10% glosadas
-        # - 5% não processadas (não aparecem no demonstrativo)
-        
-        guias_operadora = []
-        
-        for _, guia_interna in df_interno.iterrows():
-            situacao = np.random.choice(['paga_correta', 'valor_divergente', 'glosada', 'nao_processada'], 
-                                      p=[0.70, 0.15, 0.10, 0.05])
-            
-            if situacao == 'nao_processada':
-                continue  # Não aparece no demonstrativo
-            
-            guia_op = {
-                'numero_guia': guia_interna['numero_guia'],
-                'convenio': guia_interna['convenio'],
-                'data_processamento': datetime.now() - timedelta(days=np.random.randint(1, 15)),
-                'paciente': guia_interna['paciente'],
-                'procedimento': guia_interna['procedimento']
-            }
-            
-            if situacao == 'paga_correta':
-                guia_op['valor_pago'] = guia_interna['valor_enviado']
-                guia_op['status_operadora'] = 'Pago'
-                guia_op['motivo_glosa'] = ''
-                
-            elif situacao == 'valor_divergente':
-                # Valor diferente (pode ser menor por co-participação, ou por tabela diferente)
-                fator = np.random.choice([0.7, 0.8, 0.9, 1.1, 1.2], p=[0.3, 0.3, 0.2, 0.1, 0.1])
-                guia_op['valor_pago'] = round(guia_interna['valor_enviado'] * fator, 2)
-                guia_op['status_operadora'] = 'Pago com Divergência'
-                guia_op['motivo_glosa'] = np.random.choice([
-                    'Valor tabela diferente', 'Co-participação aplicada', 
-                    'Desconto contratual', 'Valor não conferido'
-                ])
-                
-            elif situacao == 'glosada':
-                guia_op['valor_pago'] = 0.00
-                guia_op['status_operadora'] = 'Glosado'
-                guia_op['motivo_glosa'] = np.random.choice([
-                    'Falta de documentação', 'Autorização inválida', 'Código incorreto',
-                    'Prazo de envio vencido', 'Procedimento não coberto'
-                ])
-            
-            guias_operadora.append(guia_op)
+    def arquivo_saida(self, caminho):
+        """Caminho dentro do diretório de saída, com o diretório pai já criado"""
+        caminho = os.path.join(self.diretorio_saida, caminho)
+        os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+        return caminho
+    
+    def gerar_dados_ficticios(self, total_guias=300, semente=42, **parametros):
+        """Gera dados fictícios para demonstração ou testes de carga (ver GeradorDadosFicticios)"""
+        gerador = GeradorDadosFicticios(total_guias, semente=semente, **parametros)
+        total_interno, total_operadora = gerador.gravar(self.arquivo_interno, self.arquivo_operadora)
         
-        df_operadora = pd.DataFrame(guias_operadora)
+        print("✅ Dados fictícios gerados:")
+        print(f"   • {total_interno:,} guias no sistema interno")
+        print(f"   • {total_operadora:,} guias no demonstrativo da operadora")
         
-        # Salvar dados
-        df_interno.to_csv('dados/guias_sistema_interno.csv', index=False)
-        df_operadora.to_csv('dados/demonstrativo_operadora.csv', index=False)
+        return total_interno, total_operadora
+    
+    def carregar_fonte(self, caminho, esquema, datas, colunas=None, adaptador=None):
+        """Carrega uma fonte tipada, usando o cache Parquet quando válido
         
-        print("✅ Dados fictícios gerados:")
-        print(f"   • {len(df_interno)} guias no sistema interno")
-        print(f"   • {len(df_operadora)} guias no demonstrativo da operadora")
+        Sem `adaptador`, a fonte é um CSV no layout canônico; com ele, qualquer layout
+        de demonstrativo, lido em blocos pelo adaptador.
+        """
+        leitor = adaptador.assinatura() if adaptador is not None else None
+        df = self.cache.ler(caminho, colunas, leitor)
+        if df is not None:
+            return df
         
-        return df_interno, df_operadora
+        df = adaptador.ler(caminho) if adaptador is not None else ler_csv_tipado(caminho, esquema, datas)
+        self.cache.gravar(caminho, df, leitor)
+        return df if colunas is None else df[[coluna for coluna in colunas if coluna in df.columns]]
+    
+    def adaptador_demonstrativo(self, caminho):
+        """Adaptador do demonstrativo conforme a extensão do arquivo"""
+        extensao = os.path.splitext(caminho)[1].lower()
+        if extensao not in self.adaptadores_demonstrativo:
+            raise ValueError(f"Formato de demonstrativo não suportado: {caminho} "
+                             f"(extensões aceitas: {', '.join(sorted(self.adaptadores_demonstrativo))})")
+        return self.adaptadores_demonstrativo[extensao]
     
-    def carregar_dados(self):
+    def carregar_demonstrativo(self, caminho, colunas=None):
+        """Carrega um demonstrativo em qualquer formato suportado (CSV, TISS XML, XLSX, largura fixa)"""
+        return self.carregar_fonte(caminho, ESQUEMA_OPERADORA, DATAS_OPERADORA, colunas,
+                                   self.adaptador_demonstrativo(caminho))
+    
+    def carregar_dados(self, arquivos_operadora=None):
         """Carrega dados dos arquivos CSV"""
         try:
-            df_interno = pd.read_csv('dados/guias_sistema_interno.csv')
-            df_interno['data_atendimento'] = pd.to_datetime(df_interno['data_atendimento'])
-            df_interno['data_envio'] = pd.to_datetime(df_interno['data_envio'])
-            
-            df_operadora = pd.read_csv('dados/demonstrativo_operadora.csv')
-            df_operadora['data_processamento'] = pd.to_datetime(df_operadora['data_processamento'])
+            df_interno = self.carregar_fonte(self.arquivo_interno, ESQUEMA_INTERNO, DATAS_INTERNO)
+            df_operadora = self.carregar_demonstrativos(arquivos_operadora or [self.arquivo_operadora])
             
-            return df_interno, df_operadora
+            return self.consolidar_duplicidades(df_interno, df_operadora)
             
         except FileNotFoundError:
+            if arquivos_operadora:
+                raise
             print("❌ Arquivos não encontrados. Gerando dados fictícios...")
-            return self.gerar_dados_ficticios()
+            self.gerar_dados_ficticios()
+            return self.carregar_dados()
+    
+    def consolidar_duplicidades(self, df_interno, df_operadora):
+        """Uma linha por guia em cada lado; as ocorrências ficam em `ocorrencias_duplicidade`"""
+        if self.duplicidades is None:
+            return df_interno, df_operadora
+        df_interno, internas = self.duplicidades.consolidar_interno(df_interno)
+        valores_enviados = pd.Series(df_interno['valor_enviado'].to_numpy(), index=df_interno['numero_guia'].to_numpy())
+        df_operadora, da_operadora = self.duplicidades.consolidar_operadora(df_operadora, valores_enviados)
+        self.ocorrencias_duplicidade = pd.concat([internas, da_operadora], ignore_index=True)
+        return df_interno, df_operadora
     
-    def conciliar_guias(self, df_interno, df_operadora):
-        """Realiza a conciliação entre sistema interno e operadora"""
+    def carregar_demonstrativos(self, arquivos_operadora):
+        """Carrega e une os demonstrativos (ex.: um arquivo por convênio)"""
+        demonstrativos = [self.carregar_demonstrativo(arquivo) for arquivo in arquivos_operadora]
+        if len(demonstrativos) == 1:
+            return demonstrativos[0]
         
-        # Merge das bases
-        conciliacao = df_interno.merge(
-            df_operadora[['numero_guia', 'valor_pago', 'status_operadora', 'motivo_glosa', 'data_processamento']], 
-            on='numero_guia', 
-            how='left'
-        )
+        # Categorias diferentes entre arquivos viram texto no concat: recategoriza
+        df_operadora = pd.concat(demonstrativos, ignore_index=True)
+        categoricas = [coluna for coluna, tipo in ESQUEMA_OPERADORA.items()
+                       if tipo == 'category' and coluna in df_operadora.columns]
+        return df_operadora.astype({coluna: 'category' for coluna in categoricas})
+    
+    def carregar_indice_operadora(self, arquivo_operadora=None):
+        """Carrega apenas as colunas do demonstrativo usadas na conciliação"""
+        arquivo_operadora = arquivo_operadora or self.arquivo_operadora
+        colunas = COLUNAS_OPERADORA
+        if self.correspondencia is not None:
+            colunas = colunas + COLUNAS_CHAVE_SECUNDARIA
+        return self.carregar_demonstrativo(arquivo_operadora, colunas)
+    
+    def conciliar_guias(self, df_interno, df_operadora, data_referencia=None, orfas=None, indice_operadora=None):
+        """Realiza a conciliação entre sistema interno e operadora
+        
+        `indice_operadora` é o pd.Index dos números de guia do demonstrativo; montado uma vez
+        (ex.: no modo streaming), cada bloco só consulta a tabela hash já construída.
+        """
+        if indice_operadora is None:
+            indice_operadora = pd.Index(df_operadora['numero_guia'])
+        
+        # Cardinalidade exigida: no máximo uma linha do demonstrativo por guia (e, com a
+        # consolidação, uma guia interna por chave); uma junção que multiplicaria linhas falha
+        cardinalidade = 'one_to_one' if self.duplicidades is not None else 'many_to_one'
+        erro_cardinalidade = ValueError(f"Guias repetidas na junção (esperado {cardinalidade}): consolide-as antes "
+                                        f"com ConsolidacaoDuplicidades")
+        if not indice_operadora.is_unique:
+            raise erro_cardinalidade
+        
+        # Chave de junção: o número da guia ou, para guias sem correspondência exata,
+        # o número da linha do demonstrativo achada pela correspondência secundária
+        vinculos = self.vincular_guias(df_interno, df_operadora, orfas, indice_operadora)
+        chave = pd.Index(vinculos.pop('_chave'))
+        if cardinalidade == 'one_to_one' and not chave.is_unique:
+            raise erro_cardinalidade
+        
+        # Junção à esquerda pela posição no demonstrativo (-1: guia sem correspondência),
+        # mantendo o índice e a ordem das linhas do sistema interno
+        posicoes = indice_operadora.get_indexer(chave)
+        if COLUNA_DUPLICIDADE not in df_operadora.columns:
+            df_operadora = df_operadora.assign(**{COLUNA_DUPLICIDADE: None})
+        colunas_operadora = df_operadora[COLUNAS_OPERADORA[1:] + [COLUNA_DUPLICIDADE]]
+        colunas_operadora = colunas_operadora.reset_index(drop=True).reindex(posicoes)
+        conciliacao = df_interno.assign(**vinculos, **{
+            coluna: colunas_operadora[coluna].array for coluna in colunas_operadora.columns
+        })
         
         # Preencher valores não encontrados
-        conciliacao['valor_pago'] = conciliacao['valor_pago'].fillna(0)
-        conciliacao['status_operadora'] = conciliacao['status_operadora'].fillna('Não Processado')
-        conciliacao['motivo_glosa'] = conciliacao['motivo_glosa'].fillna('Guia não encontrada no demonstrativo')
+        conciliacao['valor_pago'] = conciliacao['valor_pago'].fillna(0).astype('int64')
+        conciliacao['status_operadora'] = self._preencher(conciliacao['status_operadora'], 'Não Processado')
+        conciliacao['motivo_glosa'] = self._preencher(conciliacao['motivo_glosa'], 'Guia não encontrada no demonstrativo')
         
         # Calcular divergências
         conciliacao['diferenca_valor'] = conciliacao['valor_pago'] - conciliacao['valor_enviado']
@@ -151,74 +2236,369 @@ class ConciliadorGuias:
         ).round(2)
         
         # Classificar tipos de divergência
-        def classificar_divergencia(row):
-            if pd.isna(row['data_processamento']):
-                return '🔴 Não Processado'
-            elif row['valor_pago'] == 0:
-                return '❌ Glosado'
-            elif abs(row['diferenca_valor']) < 0.01:  # Diferença menor que 1 centavo
-                return '✅ OK - Valores Conferem'
-            elif row['diferenca_valor'] > 0:
-                return '⚠️ Pago a Maior'
-            else:
-                return '🟡 Pago a Menor'
-        
-        conciliacao['classificacao'] = conciliacao.apply(classificar_divergencia, axis=1)
+        conciliacao['classificacao'] = self.classificar_divergencias(conciliacao)
         
         # Adicionar dias em aberto para itens não processados
         conciliacao['dias_em_aberto'] = (
-            datetime.now() - conciliacao['data_envio']
+            (data_referencia or datetime.now()) - conciliacao['data_envio']
         ).dt.days
         
         return conciliacao
     
-    def gerar_relatorio_divergencias(self, conciliacao):
-        """Gera relatório detalhado de divergências"""
+    def vincular_guias(self, df_interno, df_operadora, orfas=None, indice_operadora=None):
+        """Chave de junção, regra e confiança da correspondência de cada guia interna"""
+        if indice_operadora is None:
+            indice_operadora = pd.Index(df_operadora['numero_guia'])
+        if indice_operadora.is_unique:
+            encontradas = indice_operadora.get_indexer(df_interno['numero_guia']) >= 0
+        else:
+            encontradas = df_interno['numero_guia'].isin(indice_operadora).to_numpy()
+        chave = df_interno['numero_guia'].to_numpy(dtype=object, copy=True)
+        regra = np.where(encontradas, 'numero_guia', None).astype(object)
+        confianca = np.where(encontradas, 1.0, np.nan)
+        guia_operadora = np.full(len(df_interno), None, dtype=object)
         
-        # Resumo geral
-        total_guias = len(conciliacao)
-        valor_enviado_total = conciliacao['valor_enviado'].sum()
-        valor_pago_total = conciliacao['valor_pago'].sum()
-        diferenca_total = valor_pago_total - valor_enviado_total
+        if self.correspondencia is not None and not encontradas.all():
+            # Órfãs: linhas do demonstrativo sem guia correspondente no sistema interno
+            if orfas is None:
+                orfas = df_operadora[~df_operadora['numero_guia'].isin(df_interno['numero_guia'])]
+            if len(orfas):
+                pendentes = np.flatnonzero(~encontradas)
+                pares = self.correspondencia.vincular(df_interno.iloc[pendentes], orfas)
+                posicoes = pendentes[pares['posicao'].to_numpy(dtype='int64')]
+                chave[posicoes] = pares['numero_guia_operadora'].to_numpy()
+                regra[posicoes] = pares['regra'].to_numpy()
+                confianca[posicoes] = pares['confianca'].to_numpy()
+                guia_operadora[posicoes] = pares['numero_guia_operadora'].to_numpy()
+        
+        return {
+            '_chave': chave,
+            'regra_conciliacao': regra,
+            'confianca_conciliacao': confianca,
+            'numero_guia_operadora': guia_operadora
+        }
+    
+    @staticmethod
+    def _preencher(serie, valor):
+        """Preenche nulos, incluindo o valor nas categorias quando necessário"""
+        if isinstance(serie.dtype, pd.CategoricalDtype) and valor not in serie.cat.categories:
+            serie = serie.cat.add_categories([valor])
+        return serie.fillna(valor)
+    
+    def _leitura_previa_streaming(self, arquivo_interno, df_operadora, tamanho_chunk):
+        """Leitura prévia do sistema interno, em blocos, para o modo streaming
         
-        # Estatísticas por classificação
-        stats_classificacao = conciliacao['classificacao'].value_counts()
+        Em memória fica só uma marca por guia do demonstrativo: o hash de 64 bits e a posição
+        de cada linha interna vão para baldes no disco (pelos bits altos do hash), examinados
+        um de cada vez, e as guias de hash repetido são confirmadas pelo número numa segunda
+        leitura, que só retém essas linhas. Retorna o demonstrativo consolidado, as posições
+        (ordenadas) das linhas internas descartadas e a máscara das órfãs do demonstrativo.
+        """
+        def blocos(colunas):
+            return ler_csv_tipado(arquivo_interno, ESQUEMA_INTERNO, DATAS_INTERNO, colunas=colunas,
+                                  chunksize=tamanho_chunk)
         
-        # Guias com divergência significativa (>5% ou valor absoluto >50)
-        divergencias_significativas = conciliacao[
-            (abs(conciliacao['percentual_divergencia']) > 5) | 
-            (abs(conciliacao['diferenca_valor']) > 50)
-        ]
+        consolidar = self.duplicidades is not None
+        guias_operadora = pd.Index(df_operadora['numero_guia'].unique())
+        encontradas = np.zeros(len(guias_operadora), dtype=bool)
+        repetidas_operadora = df_operadora.loc[df_operadora['numero_guia'].duplicated(), 'numero_guia'].unique()
+        enviados = []
+        
+        tipo_balde = np.dtype([('hash', 'uint64'), ('posicao', 'int64')])
+        deslocamento = np.uint64(64 - int(np.log2(BALDES_LEITURA_PREVIA)))
+        diretorio = tempfile.mkdtemp(prefix='leitura_previa_')
+        baldes = [os.path.join(diretorio, f"balde_{numero:03d}.bin") for numero in range(BALDES_LEITURA_PREVIA)]
+        try:
+            colunas = ['numero_guia', 'data_envio', 'valor_enviado'] if consolidar else ['numero_guia']
+            inicio = 0
+            for bloco in blocos(colunas):
+                guias = bloco['numero_guia'].to_numpy(dtype=object)
+                posicoes = guias_operadora.get_indexer(guias)
+                encontradas[posicoes[posicoes >= 0]] = True
+                if consolidar:
+                    registros = np.empty(len(bloco), dtype=tipo_balde)
+                    registros['hash'] = pd.util.hash_array(guias)
+                    registros['posicao'] = np.arange(inicio, inicio + len(bloco))
+                    numeros = (registros['hash'] >> deslocamento).astype('int64')
+                    ordem = np.argsort(numeros, kind='stable')
+                    registros = registros[ordem]
+                    limites = np.searchsorted(numeros[ordem], np.arange(BALDES_LEITURA_PREVIA + 1))
+                    for numero, caminho in enumerate(baldes):
+                        if limites[numero + 1] > limites[numero]:
+                            with open(caminho, 'ab') as arquivo:
+                                registros[limites[numero]:limites[numero + 1]].tofile(arquivo)
+                    enviados.append(bloco[bloco['numero_guia'].isin(repetidas_operadora)])
+                inicio += len(bloco)
+            
+            # Candidatas: linhas de hash repetido dentro de cada balde (um balde por vez)
+            candidatas = [np.empty(0, dtype='int64')]
+            for caminho in baldes:
+                if os.path.exists(caminho):
+                    registros = np.fromfile(caminho, dtype=tipo_balde)
+                    candidatas.append(registros['posicao'][pd.Series(registros['hash']).duplicated(keep=False).to_numpy()])
+            candidatas = np.sort(np.concatenate(candidatas))
+        finally:
+            shutil.rmtree(diretorio, ignore_errors=True)
+        
+        descartadas = np.empty(0, dtype='int64')
+        if consolidar:
+            # Candidatas relidas para comparar o número da guia em si
+            internas = self.duplicidades.sem_ocorrencias()
+            if len(candidatas):
+                partes, inicio = [], 0
+                for bloco in blocos(['numero_guia', 'data_envio']):
+                    fim = inicio + len(bloco)
+                    locais = candidatas[np.searchsorted(candidatas, inicio):np.searchsorted(candidatas, fim)] - inicio
+                    partes.append(bloco.iloc[locais].assign(posicao=locais + inicio))
+                    inicio = fim
+                candidatas = pd.concat(partes, ignore_index=True)
+                descartadas, internas = self.duplicidades.linhas_descartadas(
+                    candidatas['numero_guia'], candidatas['data_envio'], candidatas['posicao']
+                )
+            
+            # Valor enviado das guias repetidas no demonstrativo: o do envio que fica
+            valores_enviados = None
+            if enviados:
+                enviados = pd.concat(enviados).sort_values('data_envio', kind='stable', na_position='first')
+                enviados = enviados.drop_duplicates('numero_guia', keep='last')
+                valores_enviados = pd.Series(enviados['valor_enviado'].to_numpy(),
+                                             index=enviados['numero_guia'].to_numpy())
+            df_operadora, da_operadora = self.duplicidades.consolidar_operadora(df_operadora, valores_enviados)
+            self.ocorrencias_duplicidade = pd.concat([internas, da_operadora], ignore_index=True)
+        
+        orfas = ~encontradas[guias_operadora.get_indexer(df_operadora['numero_guia'])]
+        return df_operadora, descartadas, orfas
+    
+    def conciliar_guias_streaming(self, arquivo_interno=None, arquivo_operadora=None,
+                                  tamanho_chunk=TAMANHO_CHUNK_PADRAO, medir_larguras=True):
+        """Concilia o sistema interno em blocos
+        
+        Do sistema interno, só o bloco corrente fica em memória: a leitura prévia e a
+        conciliação vão para o disco, e o Excel as relê uma parte por vez. A junção precisa
+        do demonstrativo nas colunas da conciliação e da sua tabela hash, que ficam inteiros
+        e são o que cresce com a entrada. Com `medir_larguras`, as larguras das colunas do
+        Excel são medidas ao gravar cada bloco.
+        """
+        arquivo_interno = arquivo_interno or self.arquivo_interno
+        
+        # Índice compacto do demonstrativo (somente as colunas da conciliação)
+        df_operadora = self.carregar_indice_operadora(arquivo_operadora)
+        
+        # Data de referência única para o cálculo de dias em aberto de todos os blocos
+        data_referencia = datetime.now()
         
-        # Top 10 maiores divergências
-        maiores_divergencias = conciliacao[
-            conciliacao['diferenca_valor'] != 0
-        ].nlargest(10, 'diferenca_valor')
+        # Guias repetidas e órfãs do demonstrativo dependem de todo o arquivo interno
+        descartadas = np.empty(0, dtype='int64')
+        orfas = None
+        if self.duplicidades is not None or self.correspondencia is not None:
+            df_operadora, descartadas, mascara_orfas = self._leitura_previa_streaming(
+                arquivo_interno, df_operadora, tamanho_chunk
+            )
+            if self.correspondencia is not None:
+                orfas = df_operadora[mascara_orfas]
         
-        # Guias não processadas há mais de 30 dias
-        nao_processadas_antigas = conciliacao[
-            (conciliacao['classificacao'] == '🔴 Não Processado') & 
-            (conciliacao['dias_em_aberto'] > 30)
+        # Tabela hash do demonstrativo montada uma única vez e consultada por cada bloco
+        indice_operadora = pd.Index(df_operadora['numero_guia'])
+        if COLUNA_DUPLICIDADE not in df_operadora.columns:
+            df_operadora[COLUNA_DUPLICIDADE] = None
+        
+        conciliacao = ConciliacaoEmDisco(medir_texto=self._medir_exportacao if medir_larguras else None)
+        acumulador = AcumuladorRelatorio(disco=conciliacao)
+        linha = lidas = 0
+        
+        try:
+            for df_interno in ler_csv_tipado(arquivo_interno, ESQUEMA_INTERNO, DATAS_INTERNO, chunksize=tamanho_chunk):
+                inicio, lidas = lidas, lidas + len(df_interno)
+                if len(descartadas):
+                    locais = descartadas[np.searchsorted(descartadas, inicio):np.searchsorted(descartadas, lidas)]
+                    if len(locais):
+                        df_interno = df_interno.drop(df_interno.index[locais - inicio])
+                    if df_interno.empty:
+                        continue
+                bloco = self.conciliar_guias(df_interno, df_operadora, data_referencia, orfas, indice_operadora)
+                
+                # Cada linha órfã do demonstrativo é usada por no máximo uma guia
+                usadas = bloco['numero_guia_operadora'].dropna()
+                if orfas is not None and len(usadas):
+                    orfas = orfas[~orfas['numero_guia'].isin(usadas)]
+                
+                # Índice contínuo entre blocos, como na conciliação em memória
+                bloco.index = pd.RangeIndex(linha, linha + len(bloco))
+                linha += len(bloco)
+                
+                acumulador.adicionar(bloco)
+                conciliacao.gravar(bloco)
+        except Exception:
+            conciliacao.limpar()
+            raise
+        
+        return conciliacao, acumulador.finalizar()
+    
+    def conciliar_paralelo(self, df_interno, df_operadora, max_workers=None, data_referencia=None):
+        """Concilia cada convênio num processo separado e combina os relatórios parciais"""
+        data_referencia = data_referencia or datetime.now()
+        
+        # Um código de partição por convênio das guias internas (convênio ausente também é uma
+        # partição), em ordem de convênio: o resultado não depende da ordem de término dos processos
+        codigos_interno, _ = pd.factorize(df_interno['convenio'].astype(object), sort=True,
+                                          use_na_sentinel=False)
+        
+        # Cada linha do demonstrativo vai para a partição da guia interna de mesmo número;
+        # as órfãs (-1) não entram em nenhuma partição
+        codigo_guia = df_interno[['numero_guia']].assign(_particao=codigos_interno).drop_duplicates('numero_guia')
+        codigos_operadora = df_operadora[['numero_guia']].merge(codigo_guia, on='numero_guia', how='left')['_particao']
+        codigos_operadora = codigos_operadora.fillna(-1).to_numpy(dtype='int64')
+        particoes_operadora = dict(list(df_operadora.groupby(codigos_operadora, sort=False)))
+        
+        # A correspondência secundária não respeita partições (ex.: número normalizado de outro
+        # convênio): as guias sem correspondência exata ficam para uma etapa final única
+        orfas = df_operadora[codigos_operadora == -1] if self.correspondencia is not None else None
+        adiar_pendentes = orfas is not None and len(orfas) > 0
+        
+        particoes = [
+            (df_particao, particoes_operadora.get(codigo, df_operadora.iloc[:0]))
+            for codigo, df_particao in df_interno.groupby(codigos_interno, sort=True)
         ]
         
-        relatorio = {
-            'resumo_geral': {
-                'total_guias': total_guias,
-                'valor_enviado_total': valor_enviado_total,
-                'valor_pago_total': valor_pago_total,
-                'diferenca_total': diferenca_total,
-                'percentual_diferenca_total': (diferenca_total / valor_enviado_total * 100) if valor_enviado_total > 0 else 0
-            },
-            'stats_classificacao': stats_classificacao,
-            'divergencias_significativas': divergencias_significativas,
-            'maiores_divergencias': maiores_divergencias,
-            'nao_processadas_antigas': nao_processadas_antigas
-        }
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            resultados = list(executor.map(
+                _conciliar_particao,
+                [self] * len(particoes),
+                [df_particao for df_particao, _ in particoes],
+                [df_particao for _, df_particao in particoes],
+                [data_referencia] * len(particoes),
+                [adiar_pendentes] * len(particoes)
+            ))
+        
+        acumulador = AcumuladorRelatorio()
+        for _, parcial in resultados:
+            acumulador.combinar(parcial)
+        conciliacoes = [conciliacao for conciliacao, _ in resultados]
+        
+        # Etapa final, serial: pendentes de todas as partições contra todas as órfãs, como no modo em memória
+        if adiar_pendentes:
+            encontradas = np.concatenate([conciliacao.index.to_numpy() for conciliacao in conciliacoes])
+            pendentes = df_interno[~df_interno.index.isin(encontradas)]
+            if len(pendentes):
+                conciliacao = self.conciliar_guias(pendentes, df_operadora, data_referencia, orfas)
+                acumulador.adicionar(conciliacao)
+                conciliacoes.append(conciliacao)
+        
+        # Volta à ordem original das guias internas
+        conciliacao = pd.concat(conciliacoes).sort_index(kind='stable')
+        return conciliacao, acumulador.finalizar()
+    
+    def conciliar_incremental(self, df_interno, df_operadora, estado, data_referencia=None):
+        """Concilia apenas as guias novas ou alteradas desde a última execução"""
+        
+        # O estado guarda uma linha por guia: prevalece a última ocorrência de cada lado
+        df_interno = df_interno.drop_duplicates('numero_guia', keep='last')
+        df_operadora = df_operadora.drop_duplicates('numero_guia', keep='last')
+        
+        # Assinaturas das linhas recebidas, completadas com as já armazenadas
+        assinaturas = pd.DataFrame({
+            'assinatura_interno': EstadoConciliacao.assinar(df_interno, EstadoConciliacao.COLUNAS_INTERNO).astype('Int64'),
+            'assinatura_operadora': EstadoConciliacao.assinar(df_operadora, COLUNAS_OPERADORA).astype('Int64')
+        })
+        anteriores = estado.guias_armazenadas(assinaturas.index)
+        armazenadas = anteriores[['assinatura_interno', 'assinatura_operadora']].astype('Int64')
+        assinaturas = assinaturas.combine_first(armazenadas).dropna(subset=['assinatura_interno'])
+        assinaturas = assinaturas.fillna(EstadoConciliacao.SEM_ASSINATURA).astype('int64')
+        armazenadas = armazenadas.reindex(assinaturas.index)
+        
+        # Guias novas (sem assinatura armazenada) ou com alguma assinatura diferente
+        iguais = (assinaturas == armazenadas).fillna(False).astype(bool).all(axis=1)
+        alteradas = assinaturas.index[~iguais]
+        
+        # Lado interno: linha recebida ou, se só o demonstrativo mudou, a armazenada
+        delta_interno = df_interno[df_interno['numero_guia'].isin(alteradas)]
+        faltantes = alteradas.difference(delta_interno['numero_guia'])
+        if len(faltantes):
+            delta_interno = pd.concat([delta_interno, anteriores.loc[faltantes, EstadoConciliacao.COLUNAS_INTERNO]],
+                                      ignore_index=True)
+        
+        # Lado operadora: linha recebida ou a última armazenada para a guia
+        delta_operadora = df_operadora[df_operadora['numero_guia'].isin(alteradas)]
+        faltantes = alteradas.difference(delta_operadora['numero_guia']).intersection(
+            anteriores.index[anteriores['assinatura_operadora'] != EstadoConciliacao.SEM_ASSINATURA]
+        )
+        if len(faltantes):
+            delta_operadora = pd.concat([delta_operadora,
+                                         anteriores.loc[faltantes, COLUNAS_OPERADORA + [COLUNA_DUPLICIDADE]]],
+                                        ignore_index=True)
+        
+        anteriores = anteriores.loc[anteriores.index.intersection(alteradas)]
+        if self.correspondencia is not None:
+            delta_interno, delta_operadora, anteriores, assinaturas = self._incluir_orfas(
+                df_operadora, estado, delta_interno, delta_operadora, anteriores, assinaturas, alteradas
+            )
         
-        return relatorio
+        conciliacao = self.conciliar_guias(delta_interno, delta_operadora, data_referencia)
+        conciliacao['assinatura_interno'] = assinaturas.loc[conciliacao['numero_guia'], 'assinatura_interno'].values
+        conciliacao['assinatura_operadora'] = assinaturas.loc[conciliacao['numero_guia'], 'assinatura_operadora'].values
+        
+        estado.registrar(conciliacao, anteriores)
+        return conciliacao
+    
+    def _incluir_orfas(self, df_operadora, estado, delta_interno, delta_operadora, anteriores, assinaturas, alteradas):
+        """Acrescenta ao delta as órfãs do demonstrativo e as guias que podem se ligar a elas"""
+        
+        # Órfãs: linhas do demonstrativo cujo número não é de nenhuma guia conhecida
+        orfas = df_operadora[~df_operadora['numero_guia'].isin(assinaturas.index)]
+        
+        # Com órfãs novas, todas as guias armazenadas sem correspondência exata são revistas
+        revinculaveis = estado.guias_revinculaveis() if len(orfas) else anteriores.iloc[:0]
+        revinculaveis = revinculaveis[~revinculaveis.index.isin(alteradas)]
+        if len(revinculaveis):
+            delta_interno = pd.concat([delta_interno, revinculaveis[EstadoConciliacao.COLUNAS_INTERNO]],
+                                      ignore_index=True)
+            anteriores = pd.concat([anteriores, revinculaveis])
+            novas = revinculaveis.index.difference(assinaturas.index)
+            assinaturas = pd.concat([
+                assinaturas, revinculaveis.loc[novas, ['assinatura_interno', 'assinatura_operadora']].astype('int64')
+            ])
+        
+        # Vínculos secundários já gravados cuja órfã não veio nesta carga: a linha é
+        # remontada do estado, com as chaves secundárias da própria guia vinculada
+        vinculadas = anteriores[anteriores['regra_conciliacao'].notna()
+                                & (anteriores['regra_conciliacao'] != 'numero_guia')]
+        vinculadas = vinculadas[~vinculadas['numero_guia_operadora'].isin(orfas['numero_guia'])]
+        remontadas = vinculadas[COLUNAS_OPERADORA[1:] + [COLUNA_DUPLICIDADE] + COLUNAS_CHAVE_SECUNDARIA].assign(
+            numero_guia=vinculadas['numero_guia_operadora']
+        )
+        
+        partes = [parte for parte in (delta_operadora, orfas, remontadas) if len(parte)]
+        if partes:
+            delta_operadora = pd.concat(partes, ignore_index=True)
+        return delta_interno, delta_operadora, anteriores, assinaturas
     
-    def gerar_graficos_conciliacao(self, conciliacao, relatorio):
-        """Gera gráficos da conciliação"""
+    def classificar_divergencias(self, conciliacao):
+        """Classifica as guias de forma vetorizada a partir da tabela de regras"""
+        rotulos = [rotulo for rotulo, _ in self.regras_classificacao]
+        condicoes = [
+            np.asarray(condicao(conciliacao), dtype=bool)
+            for _, condicao in self.regras_classificacao
+        ]
+        
+        classificacao = np.select(condicoes, rotulos, default=self.classificacao_padrao)
+        return pd.Categorical(classificacao, dtype=self.tipo_classificacao())
+    
+    def tipo_classificacao(self):
+        """Tipo categórico das classificações, em ordem alfabética para manter a ordenação das exportações"""
+        rotulos = [rotulo for rotulo, _ in self.regras_classificacao]
+        return pd.CategoricalDtype(sorted(set(rotulos) | {self.classificacao_padrao}))
+    
+    def gerar_relatorio_divergencias(self, conciliacao):
+        """Gera relatório detalhado de divergências"""
+        return AcumuladorRelatorio().analisar(conciliacao)
+    
+    def gerar_graficos_conciliacao(self, conciliacao, relatorio, arquivo=ARQUIVO_GRAFICO, dpi=DPI_GRAFICO):
+        """Gera gráficos da conciliação (usa apenas as medidas do relatório)"""
+        # Backend sem interface gráfica, escolhido antes de carregar o pyplot
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
         
         plt.style.use('default')
         fig, axes = plt.subplots(2, 2, figsize=(16, 12))
@@ -231,10 +2611,7 @@ class ConciliadorGuias:
         axes[0,0].set_title('Distribuição das Guias por Status', fontsize=14, fontweight='bold')
         
         # Gráfico 2: Divergências por convênio
-        div_convenio = conciliacao.groupby('convenio').agg({
-            'diferenca_valor': 'sum',
-            'numero_guia': 'count'
-        }).sort_values('diferenca_valor')
+        div_convenio = self._em_reais(relatorio['resumo_convenio']).sort_values('diferenca_valor')
         
         bars = axes[0,1].bar(div_convenio.index, div_convenio['diferenca_valor'], 
                             color=['red' if x < 0 else 'green' for x in div_convenio['diferenca_valor']])
@@ -253,12 +2630,7 @@ class ConciliadorGuias:
                               fontsize=9)
         
         # Gráfico 3: Evolução temporal das divergências
-        conciliacao_copy = conciliacao.copy()
-        conciliacao_copy['mes_envio'] = conciliacao_copy['data_envio'].dt.to_period('M')
-        evolucao = conciliacao_copy.groupby('mes_envio').agg({
-            'diferenca_valor': 'sum',
-            'numero_guia': 'count'
-        })
+        evolucao = self._em_reais(relatorio['evolucao_mensal'])
         
         axes[1,0].plot(range(len(evolucao)), evolucao['diferenca_valor'], marker='o', linewidth=2, color='#e74c3c')
         axes[1,0].set_title('Evolução das Divergências por Mês', fontsize=14, fontweight='bold')
@@ -267,203 +2639,982 @@ class ConciliadorGuias:
         axes[1,0].tick_params(axis='x', rotation=45)
         axes[1,0].grid(True, alpha=0.3)
         
-        # Gráfico 4: Distribuição de valores divergentes
-        divergencias_valores = conciliacao[conciliacao['diferenca_valor'] != 0]['diferenca_valor']
-        axes[1,1].hist(divergencias_valores, bins=20, edgecolor='black', alpha=0.7, color='#3498db')
+        # Gráfico 4: Distribuição de valores divergentes (faixas fixas do relatório reagrupadas em 20 barras)
+        histograma = relatorio['histograma_divergencias']
+        centros = (histograma.index.to_numpy() + LARGURA_FAIXA_HISTOGRAMA / 2) / 100
+        axes[1,1].hist(centros, bins=20, weights=histograma.to_numpy(), edgecolor='black', alpha=0.7, color='#3498db')
         axes[1,1].set_title('Distribuição dos Valores Divergentes', fontsize=14, fontweight='bold')
         axes[1,1].set_xlabel('Valor da Divergência (R$)')
         axes[1,1].set_ylabel('Quantidade de Guias')
         axes[1,1].axvline(x=0, color='red', linestyle='--', alpha=0.7)
         
         plt.tight_layout()
-        plt.savefig('graficos/conciliacao_guias.png', dpi=300, bbox_inches='tight')
+        arquivo = self.arquivo_saida(arquivo)
+        plt.savefig(arquivo, dpi=dpi, bbox_inches='tight')
         plt.close()
         
-        print("✅ Gráficos gerados: graficos/conciliacao_guias.png")
+        print(f"✅ Gráficos gerados: {arquivo}")
+        return arquivo
     
     def gerar_excel_conciliacao(self, conciliacao, relatorio):
         """Gera arquivo Excel completo com a conciliação"""
         
-        filename = f"conciliacao/Conciliacao_Guias_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
+        from openpyxl import Workbook
         
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            
-            # Aba 1: Resumo Executivo
-            resumo_data = [
-                ['Indicador', 'Valor'],
-                ['Total de Guias Analisadas', f"{relatorio['resumo_geral']['total_guias']:,}"],
-                ['Valor Total Enviado', f"R$ {relatorio['resumo_geral']['valor_enviado_total']:,.2f}"],
-                ['Valor Total Pago', f"R$ {relatorio['resumo_geral']['valor_pago_total']:,.2f}"],
-                ['Diferença Total', f"R$ {relatorio['resumo_geral']['diferenca_total']:,.2f}"],
-                ['% Diferença Total', f"{relatorio['resumo_geral']['percentual_diferenca_total']:.2f}%"],
-                ['', ''],
-                ['Status das Guias', 'Quantidade'],
-            ]
-            
-            for status, qtd in relatorio['stats_classificacao'].items():
-                resumo_data.append([status, qtd])
-            
-            df_resumo = pd.DataFrame(resumo_data[1:], columns=resumo_data[0])
-            df_resumo.to_excel(writer, sheet_name='Resumo Executivo', index=False)
-            
-            # Aba 2: Conciliação Completa
-            colunas_conciliacao = [
-                'numero_guia', 'convenio', 'data_atendimento', 'paciente', 'procedimento',
-                'valor_enviado', 'valor_pago', 'diferenca_valor', 'percentual_divergencia',
-                'classificacao', 'status_operadora', 'motivo_glosa', 'data_envio', 'dias_em_aberto'
-            ]
-            
-            conciliacao_export = conciliacao[colunas_conciliacao].copy()
-            conciliacao_export = conciliacao_export.sort_values(['classificacao', 'diferenca_valor'], ascending=[True, False])
-            conciliacao_export.to_excel(writer, sheet_name='Conciliação Completa', index=False)
-            
-            # Aba 3: Divergências Significativas
-            if not relatorio['divergencias_significativas'].empty:
-                divergencias_export = relatorio['divergencias_significativas'][colunas_conciliacao]
-                divergencias_export.to_excel(writer, sheet_name='Divergências Significativas', index=False)
-            
-            # Aba 4: Top 10 Maiores Divergências
-            if not relatorio['maiores_divergencias'].empty:
-                maiores_export = relatorio['maiores_divergencias'][colunas_conciliacao]
-                maiores_export.to_excel(writer, sheet_name='Maiores Divergências', index=False)
-            
-            # Aba 5: Não Processadas (>30 dias)
-            if not relatorio['nao_processadas_antigas'].empty:
-                nao_proc_export = relatorio['nao_processadas_antigas'][colunas_conciliacao]
-                nao_proc_export.to_excel(writer, sheet_name='Não Processadas +30d', index=False)
-            
-            # Aba 6: Resumo por Convênio
-            resumo_convenio = conciliacao.groupby('convenio').agg({
-                'numero_guia': 'count',
-                'valor_enviado': 'sum',
-                'valor_pago': 'sum',
-                'diferenca_valor': 'sum'
-            }).round(2)
-            resumo_convenio['percentual_diferenca'] = (
-                (resumo_convenio['diferenca_valor'] / resumo_convenio['valor_enviado']) * 100
-            ).round(2)
-            resumo_convenio.to_excel(writer, sheet_name='Resumo por Convênio')
-        
-        # Formatação do Excel
-        self.formatar_excel(filename)
+        filename = self.arquivo_saida(f"conciliacao/Conciliacao_Guias_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx")
+        
+        # Gravação em passagem única (write-only): estilos e larguras aplicados durante a escrita
+        wb = Workbook(write_only=True)
+        
+        # Aba 1: Resumo Executivo
+        resumo_data = [
+            ['Indicador', 'Valor'],
+            ['Total de Guias Analisadas', f"{relatorio['resumo_geral']['total_guias']:,}"],
+            ['Valor Total Enviado', f"R$ {relatorio['resumo_geral']['valor_enviado_total'] / 100:,.2f}"],
+            ['Valor Total Pago', f"R$ {relatorio['resumo_geral']['valor_pago_total'] / 100:,.2f}"],
+            ['Diferença Total', f"R$ {relatorio['resumo_geral']['diferenca_total'] / 100:,.2f}"],
+            ['% Diferença Total', f"{relatorio['resumo_geral']['percentual_diferenca_total']:.2f}%"],
+            ['', ''],
+            ['Status das Guias', 'Quantidade'],
+        ]
+        
+        for status, qtd in relatorio['stats_classificacao'].items():
+            resumo_data.append([status, qtd])
+        
+        df_resumo = pd.DataFrame(resumo_data[1:], columns=resumo_data[0])
+        self._escrever_aba(wb, 'Resumo Executivo', df_resumo)
+        
+        # Aba 2: Conciliação Completa
+        colunas_conciliacao = COLUNAS_CONCILIACAO
+        
+        if isinstance(conciliacao, ConciliacaoEmDisco):
+            # Larguras medidas ao gravar as partes ou, se não medidas, numa leitura prévia (a ordem não importa)
+            larguras = self._larguras_medidas(
+                conciliacao.maximos_texto.get('conciliacao'),
+                lambda: conciliacao.blocos_por_classificacao(colunas_conciliacao)
+            )
+            self._escrever_blocos(wb, 'Conciliação Completa', self._blocos_conciliacao_completa(conciliacao), larguras)
+        else:
+            conciliacao_export, = self._blocos_conciliacao_completa(conciliacao)
+            self._escrever_aba(wb, 'Conciliação Completa', conciliacao_export)
+        
+        # Aba 3: Divergências Significativas
+        if relatorio.quantidade('divergencias_significativas'):
+            self._escrever_subconjunto(wb, 'Divergências Significativas', relatorio, 'divergencias_significativas')
+        
+        # Aba 4: Top 10 Maiores Divergências
+        if relatorio.quantidade('maiores_divergencias'):
+            maiores_export = self._em_reais(relatorio.subconjunto('maiores_divergencias', colunas_conciliacao))
+            self._escrever_aba(wb, 'Maiores Divergências', maiores_export)
+        
+        # Aba 5: Não Processadas (>30 dias)
+        if relatorio.quantidade('nao_processadas_antigas'):
+            self._escrever_subconjunto(wb, 'Não Processadas +30d', relatorio, 'nao_processadas_antigas')
+        
+        # Aba 6: Resumo por Convênio
+        resumo_convenio = self._em_reais(relatorio['resumo_convenio']).round(2)
+        resumo_convenio['percentual_diferenca'] = (
+            (resumo_convenio['diferenca_valor'] / resumo_convenio['valor_enviado']) * 100
+        ).round(2)
+        self._escrever_aba(wb, 'Resumo por Convênio', resumo_convenio.reset_index())
+        
+        # Aba 7: Glosas e divergências por motivo (a partir do cubo, sem reagrupar as guias)
+        glosas_motivo = relatorio['cubo_glosas'].consultar(['convenio', 'procedimento', 'motivo_glosa'])
+        glosas_motivo = glosas_motivo[
+            (glosas_motivo['quantidade_glosada'] > 0) | (glosas_motivo['quantidade_divergente'] > 0)
+        ]
+        if not glosas_motivo.empty:
+            glosas_motivo = glosas_motivo[['quantidade', 'quantidade_glosada', 'valor_glosado',
+                                           'quantidade_divergente', 'valor_divergente']]
+            glosas_motivo = glosas_motivo.assign(valor_glosado=glosas_motivo['valor_glosado'] / 100,
+                                                 valor_divergente=glosas_motivo['valor_divergente'] / 100)
+            self._escrever_aba(wb, 'Glosas por Motivo', glosas_motivo.reset_index())
+        
+        wb.save(filename)
         
         print(f"✅ Relatório Excel gerado: {filename}")
         return filename
     
-    def formatar_excel(self, filename):
-        """Aplica formatação ao arquivo Excel"""
-        from openpyxl import load_workbook
+    def _blocos_conciliacao_completa(self, conciliacao):
+        """Gera a aba completa já ordenada por classificação e diferença"""
+        if isinstance(conciliacao, ConciliacaoEmDisco):
+            # Partes intercaladas na mesma ordem do sort_values em memória, sem juntar uma classificação inteira
+            for bloco in conciliacao.blocos_ordenados(COLUNAS_CONCILIACAO):
+                yield self._em_reais(bloco)
+        else:
+            conciliacao_export = conciliacao[COLUNAS_CONCILIACAO].copy()
+            yield self._em_reais(
+                conciliacao_export.sort_values(['classificacao', 'diferenca_valor'], ascending=[True, False])
+            )
+    
+    def _escrever_subconjunto(self, wb, nome, relatorio, chave):
+        """Escreve um subconjunto do relatório; do disco, bloco a bloco e com as larguras medidas na gravação"""
+        if not relatorio.em_disco(chave):
+            self._escrever_aba(wb, nome, self._em_reais(relatorio.subconjunto(chave, COLUNAS_CONCILIACAO)))
+            return
+        larguras = self._larguras_medidas(relatorio.maximos_texto(chave),
+                                          lambda: relatorio.blocos(chave, COLUNAS_CONCILIACAO))
+        blocos = (self._em_reais(bloco) for bloco in relatorio.blocos(chave, COLUNAS_CONCILIACAO))
+        self._escrever_blocos(wb, nome, blocos, larguras)
+    
+    @staticmethod
+    def _em_reais(df):
+        """Converte as colunas em centavos para R$ (apenas na apresentação)"""
+        return df.assign(**{coluna: df[coluna] / 100 for coluna in COLUNAS_MONETARIAS if coluna in df.columns})
+    
+    def _escrever_aba(self, wb, nome, df):
+        """Escreve um DataFrame numa aba nova, com larguras calculadas sobre ele"""
+        self._escrever_blocos(wb, nome, [df], self._larguras_colunas([df]))
+    
+    def _escrever_blocos(self, wb, nome, blocos, larguras):
+        """Escreve cabeçalho formatado e linhas de uma sequência de blocos em modo streaming"""
+        from openpyxl.cell import WriteOnlyCell
         from openpyxl.styles import Font, PatternFill, Alignment
+        from openpyxl.utils import get_column_letter
         
-        wb = load_workbook(filename)
-        
-        # Formatação geral para todas as abas
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
+        def nova_aba(numero):
+            # Continuações: 'Nome (2)', 'Nome (3)'... dentro dos 31 caracteres de um nome de aba
+            sufixo = f" ({numero})" if numero > 1 else ''
+            ws = wb.create_sheet(nome[:31 - len(sufixo)] + sufixo)
+            
+            # No modo write-only as larguras precisam ser definidas antes da primeira linha
+            for posicao, largura in enumerate(larguras.values(), start=1):
+                ws.column_dimensions[get_column_letter(posicao)].width = largura
             
             # Cabeçalhos
-            for cell in ws[1]:
+            cabecalho = []
+            for coluna in larguras:
+                cell = WriteOnlyCell(ws, value=coluna)
                 cell.font = Font(bold=True, color="FFFFFF")
                 cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
                 cell.alignment = Alignment(horizontal="center")
+                cabecalho.append(cell)
+            ws.append(cabecalho)
+            return ws
+        
+        # Linhas além do limite de uma aba continuam numa aba nova, com o mesmo cabeçalho
+        numero_aba, linhas_aba = 1, 0
+        ws = nova_aba(numero_aba)
+        for bloco in self._fatias_abas(blocos, LIMITE_LINHAS_EXCEL - 1):
+            if linhas_aba + len(bloco) > LIMITE_LINHAS_EXCEL - 1:
+                numero_aba, linhas_aba = numero_aba + 1, 0
+                ws = nova_aba(numero_aba)
+            linhas_aba += len(bloco)
+            colunas = []
+            for coluna in bloco.columns:
+                serie = bloco[coluna]
+                if pd.api.types.is_datetime64_any_dtype(serie):
+                    # Mesmo formato de data/hora que o pandas aplica no to_excel
+                    colunas.append([
+                        None if pd.isna(valor) else self._celula_data(WriteOnlyCell(ws, value=valor.to_pydatetime()))
+                        for valor in serie
+                    ])
+                    continue
+                valores = serie.astype(object).where(serie.notna(), None)
+                if pd.api.types.is_float_dtype(serie):
+                    # Infinitos são gravados como texto, como no to_excel
+                    valores = valores.mask(np.isposinf(serie), 'inf').mask(np.isneginf(serie), '-inf')
+                colunas.append(valores.tolist())
             
-            # Auto-ajustar largura das colunas
-            for column in ws.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                
-                adjusted_width = min(max_length + 2, 30)
-                ws.column_dimensions[column_letter].width = adjusted_width
+            for linha in zip(*colunas):
+                ws.append(linha)
+    
+    @staticmethod
+    def _fatias_abas(blocos, limite):
+        """Divide os blocos para que nenhum atravesse o limite de linhas de uma aba"""
+        linhas_aba = 0
+        for bloco in blocos:
+            inicio = 0
+            while inicio < len(bloco):
+                fim = min(len(bloco), inicio + limite - linhas_aba)
+                yield bloco.iloc[inicio:fim]
+                linhas_aba = (linhas_aba + fim - inicio) % limite
+                inicio = fim
+    
+    @staticmethod
+    def _celula_data(cell):
+        cell.number_format = 'YYYY-MM-DD HH:MM:SS'
+        return cell
+    
+    @staticmethod
+    def _comprimentos_texto(serie):
+        """Comprimento do texto de cada valor como lido de volta da planilha (vetorizado)"""
+        nulos = serie.isna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            # O Excel guarda datas com precisão de milissegundos
+            com_fracao = (serie.dt.round('ms').dt.microsecond != 0).to_numpy()
+            comprimentos = np.where(com_fracao, len('2000-01-01 00:00:00.000000'), len('2000-01-01 00:00:00'))
+        elif pd.api.types.is_float_dtype(serie):
+            # O openpyxl grava com 16 dígitos significativos e relê como int quando
+            # não há ponto nem expoente; infinitos viram o texto 'inf'/'-inf'
+            valores = serie.to_numpy(dtype='float64', na_value=np.nan)
+            finitos = np.isfinite(valores)
+            texto = pd.Series(np.char.mod('%.16g', np.where(finitos, valores, 0)))
+            inteiro = ~texto.str.contains('[.eE]').to_numpy()
+            relido = texto.astype('float64').astype(str).str.len().to_numpy()
+            comprimentos = np.where(inteiro, texto.str.len().to_numpy(), relido)
+            comprimentos = np.where(finitos, comprimentos, np.where(valores > 0, len('inf'), len('-inf')))
+        else:
+            comprimentos = serie.astype(object).astype(str).str.len().to_numpy()
+        # Células vazias contam como o texto 'None'
+        return np.where(nulos, len('None'), comprimentos)
+    
+    def _medir_texto(self, bloco, maximos):
+        """Acumula em `maximos` o maior texto de cada coluna do bloco (cabeçalho incluído)"""
+        for coluna in bloco.columns:
+            comprimento = len(str(coluna))
+            if len(bloco):
+                comprimento = max(comprimento, int(self._comprimentos_texto(bloco[coluna]).max()))
+            maximos[coluna] = max(maximos.get(coluna, 0), comprimento)
+    
+    def _medir_exportacao(self, conciliacao, maximos):
+        """Mede as colunas exportadas de um bloco conciliado, como aparecem no Excel (em R$)"""
+        self._medir_texto(self._em_reais(conciliacao[COLUNAS_CONCILIACAO]), maximos)
+    
+    def _larguras_colunas(self, blocos):
+        """Largura das colunas: maior texto + 2, limitada a 30"""
+        maximos = {}
+        for bloco in blocos:
+            self._medir_texto(bloco, maximos)
+        return {coluna: min(comprimento + 2, 30) for coluna, comprimento in maximos.items()}
+    
+    def _larguras_medidas(self, maximos, blocos):
+        """Larguras a partir dos maiores textos já medidos ou, sem eles, de uma leitura de `blocos()`"""
+        if maximos is None:
+            return self._larguras_colunas(self._em_reais(bloco) for bloco in blocos())
+        return {coluna: min(comprimento + 2, 30) for coluna, comprimento in maximos.items()}
+    
+    def gerar_resumo_json(self, relatorio):
+        """Grava o resumo da conciliação em JSON (valores em R$) para consumo por outros sistemas"""
+        filename = self.arquivo_saida(f"relatorios/resumo_conciliacao_{datetime.now().strftime('%Y%m%d_%H%M')}.json")
+        resumo = relatorio['resumo_geral']
         
-        wb.save(filename)
+        dados = {
+            'resumo_geral': {
+                'total_guias': resumo['total_guias'],
+                'valor_enviado_total': resumo['valor_enviado_total'] / 100,
+                'valor_pago_total': resumo['valor_pago_total'] / 100,
+                'diferenca_total': resumo['diferenca_total'] / 100,
+                'percentual_diferenca_total': round(resumo['percentual_diferenca_total'], 2)
+            },
+            'stats_classificacao': {str(status): int(qtd) for status, qtd in relatorio['stats_classificacao'].items()},
+            'divergencias_significativas': relatorio.quantidade('divergencias_significativas'),
+            'nao_processadas_antigas': relatorio.quantidade('nao_processadas_antigas'),
+            'resumo_convenio': self._em_reais(relatorio['resumo_convenio']).to_dict(orient='index')
+        }
+        
+        with open(filename, 'w', encoding='utf-8') as arquivo:
+            json.dump(dados, arquivo, indent=2, ensure_ascii=False, default=str)
+        
+        print(f"✅ Resumo JSON gerado: {filename}")
+        return filename
     
-    def executar_conciliacao_completa(self):
-        """Executa todo o processo de conciliação"""
+    def gerar_saidas(self, conciliacao, relatorio, saidas=SAIDAS_PADRAO, dpi=DPI_GRAFICO, medidor=None):
+        """Gera só os artefatos pedidos; com Excel e PNG, o gráfico é renderizado em outro processo
+        enquanto a planilha é gravada neste (a conciliação completa não precisa ser copiada)"""
+        _validar_saidas(saidas)
+        medidor = medidor or MedidorEtapas()
+        total_guias = relatorio['resumo_geral']['total_guias']
+        arquivos = {}
+        
+        executor = futuro = None
+        if 'png' in saidas and 'excel' in saidas:
+            # O processo do gráfico recebe apenas as medidas agregadas do relatório
+            medidas = {chave: relatorio[chave] for chave in
+                       ('stats_classificacao', 'resumo_convenio', 'evolucao_mensal', 'histograma_divergencias')}
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(max_workers=1)
+            futuro = executor.submit(_gerar_graficos_processo, self, medidas, ARQUIVO_GRAFICO, dpi)
+        
         try:
-            print("🔄 Iniciando Conciliação de Guias...")
-            print("="*50)
-            
-            # 1. Carregar dados
-            print("📊 Carregando dados...")
-            df_interno, df_operadora = self.carregar_dados()
-            
-            # 2. Realizar conciliação
-            print("🔍 Realizando conciliação...")
-            conciliacao = self.conciliar_guias(df_interno, df_operadora)
+            if 'png' in saidas and futuro is None:
+                print("📊 Criando gráficos...")
+                with medidor.etapa('graficos', total_guias):
+                    arquivos['png'] = self.gerar_graficos_conciliacao(conciliacao, relatorio, ARQUIVO_GRAFICO, dpi)
             
-            # 3. Gerar relatório
-            print("📈 Gerando análises...")
-            relatorio = self.gerar_relatorio_divergencias(conciliacao)
+            if 'excel' in saidas:
+                print("📋 Gerando relatório Excel" + (" (gráficos em paralelo)..." if futuro else "..."))
+                with medidor.etapa('excel', total_guias):
+                    arquivos['excel'] = self.gerar_excel_conciliacao(conciliacao, relatorio)
             
-            # 4. Gerar gráficos
-            print("📊 Criando gráficos...")
-            self.gerar_graficos_conciliacao(conciliacao, relatorio)
+            if 'json' in saidas:
+                with medidor.etapa('json'):
+                    arquivos['json'] = self.gerar_resumo_json(relatorio)
             
-            # 5. Gerar Excel
-            print("📋 Gerando relatório Excel...")
-            arquivo_excel = self.gerar_excel_conciliacao(conciliacao, relatorio)
-            
-            # 6. Resumo final
-            print("\n" + "="*60)
-            print("📊 RESULTADO DA CONCILIAÇÃO")
-            print("="*60)
+            if futuro is not None:
+                # Aqui se mede só a espera; o tempo de renderização vem do próprio processo
+                with medidor.etapa('graficos', total_guias) as medida:
+                    arquivos['png'], medida['segundos_processo'] = futuro.result()
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        
+        return arquivos
+    
+    def imprimir_resultado(self, relatorio, arquivos):
+        """Imprime o resumo final, os arquivos gerados e os alertas"""
+        print("\n" + "="*60)
+        print("📊 RESULTADO DA CONCILIAÇÃO")
+        print("="*60)
+        
+        resumo = relatorio['resumo_geral']
+        stats = relatorio['stats_classificacao']
+        
+        print(f"📋 Total de Guias Analisadas: {resumo['total_guias']:,}")
+        print(f"💰 Valor Enviado: R$ {resumo['valor_enviado_total'] / 100:,.2f}")
+        print(f"💳 Valor Pago: R$ {resumo['valor_pago_total'] / 100:,.2f}")
+        print(f"📊 Diferença: R$ {resumo['diferenca_total'] / 100:,.2f} ({resumo['percentual_diferenca_total']:.2f}%)")
+        
+        print("\n📈 DISTRIBUIÇÃO DAS GUIAS:")
+        for status, qtd in stats.items():
+            percentual = (qtd / resumo['total_guias']) * 100
+            print(f"   {status}: {qtd:,} ({percentual:.1f}%)")
+        
+        print(f"\n⚠️ Divergências Significativas: {relatorio.quantidade('divergencias_significativas'):,}")
+        print(f"🕐 Não Processadas +30 dias: {relatorio.quantidade('nao_processadas_antigas'):,}")
+        
+        print(f"\n📁 ARQUIVOS GERADOS:")
+        for saida in SAIDAS_DISPONIVEIS:
+            if saida in arquivos:
+                print(f"   • {arquivos[saida]}")
+        
+        print("\n✅ CONCILIAÇÃO CONCLUÍDA COM SUCESSO!")
+        
+        # Alertas importantes
+        if resumo['percentual_diferenca_total'] < -5:
+            print("\n🚨 ALERTA: Diferença significativa - Hospital recebendo MENOS que enviado!")
+        elif resumo['percentual_diferenca_total'] > 5:
+            print("\n✨ Hospital recebendo MAIS que enviado - Verificar se está correto")
+        
+        if relatorio.quantidade('nao_processadas_antigas') > 0:
+            print(f"\n⏰ AÇÃO NECESSÁRIA: {relatorio.quantidade('nao_processadas_antigas')} guias não processadas há mais de 30 dias!")
+    
+    def relatar_duplicidades(self, medidor=None):
+        """Resume as guias repetidas da última carga na tela, nas métricas e num CSV em relatorios/"""
+        ocorrencias = self.ocorrencias_duplicidade
+        if ocorrencias is None or ocorrencias.empty:
+            return None
+        
+        filename = self.arquivo_saida(f"relatorios/duplicidades_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
+        ocorrencias.to_csv(filename, index=False)
+        
+        contagens = ocorrencias.groupby(['lado', 'tipo']).agg(guias=('numero_guia', 'size'), linhas=('linhas', 'sum'))
+        lados = {'interno': 'no sistema interno', 'operadora': 'no demonstrativo'}
+        politicas = {'interno': self.duplicidades.politica_interno, 'operadora': self.duplicidades.politica_operadora}
+        # Com 'somar', só as complementares são somadas; os conflitos ficam com a linha mais recente
+        acoes = {('operadora', 'conflito'): 'mais_recente'} if politicas['operadora'] == 'somar' else {}
+        for (lado, tipo), linha in contagens.iterrows():
+            print(f"⚠️ {linha['guias']:,} guias repetidas {lados[lado]} ({tipo}, {linha['linhas']:,} linhas) "
+                  f"consolidadas por '{acoes.get((lado, tipo), politicas[lado])}'")
+        print(f"   • Detalhes: {filename}")
+        
+        if medidor is not None:
+            medidor.registrar('duplicidades', arquivo=filename, **{
+                f'{lado}_{tipo}': int(linha['guias']) for (lado, tipo), linha in contagens.iterrows()
+            })
+        return filename
+    
+    def descartar_indice_aging(self):
+        """Remove o índice de aging, que deixaria de acompanhar o estado incremental quando uma
+        execução não o atualiza; a próxima execução que pedir 'aging' o reconstrói por completo"""
+        arquivo_indice = os.path.join(self.diretorio_saida, ARQUIVO_INDICE_AGING)
+        if os.path.exists(arquivo_indice):
+            os.remove(arquivo_indice)
+    
+    def atualizar_indice_aging(self, conciliacao, delta=None):
+        """Atualiza o índice de aging; com `delta` (modo incremental), só as guias reconciliadas agora"""
+        indice = IndiceAging(self.arquivo_saida(ARQUIVO_INDICE_AGING))
+        try:
+            if delta is not None and indice.atualizado_em() is not None:
+                return indice.atualizar(delta, completa=False)
+            return indice.atualizar(conciliacao)
+        finally:
+            indice.fechar()
+    
+    def gravar_cubo_glosas(self, cubo):
+        """Grava o cubo de glosas em Parquet; retorna o número de células gravadas"""
+        if importlib.util.find_spec('pyarrow') is None:
+            print("⚠️ Cubo de glosas não gravado: Parquet requer o pacote pyarrow")
+            return 0
+        return cubo.gravar(self.arquivo_saida(ARQUIVO_CUBO_GLOSAS))
+    
+    def gerar_relatorio_estado(self, saidas=SAIDAS_PADRAO, dpi=DPI_GRAFICO):
+        """Gera as saídas a partir do estado persistido, sem reler as fontes nem reconciliar"""
+        arquivo_estado = os.path.join(self.diretorio_saida, self.arquivo_estado)
+        if not os.path.exists(arquivo_estado):
+            print(f"❌ Estado da conciliação não encontrado: {arquivo_estado} (execute a conciliação incremental)")
+            return False
+        
+        try:
+            _validar_saidas(saidas)
+            print("📈 Gerando análises a partir do estado persistido...")
+            data_referencia = datetime.now()
+            estado = EstadoConciliacao(arquivo_estado, self.tipo_classificacao())
+            try:
+                relatorio = estado.gerar_relatorio(data_referencia)
+                # A conciliação linha a linha só é lida quando a planilha ou o índice são pedidos
+                conciliacao = (estado.carregar_conciliacao(data_referencia)
+                               if 'excel' in saidas or 'aging' in saidas else None)
+            finally:
+                estado.fechar()
             
-            resumo = relatorio['resumo_geral']
-            stats = relatorio['stats_classificacao']
+            arquivos = self.gerar_saidas(conciliacao, relatorio, saidas, dpi)
+            if 'aging' in saidas:
+                self.atualizar_indice_aging(conciliacao)
+                arquivos['aging'] = self.arquivo_saida(ARQUIVO_INDICE_AGING)
+            if 'glosas' in saidas and self.gravar_cubo_glosas(relatorio['cubo_glosas']):
+                arquivos['glosas'] = self.arquivo_saida(ARQUIVO_CUBO_GLOSAS)
+            self.imprimir_resultado(relatorio, arquivos)
+            return True
+        
+        except Exception as e:
+            print(f"❌ Erro ao gerar o relatório: {str(e)}")
+            return False
+    
+    def executar_conciliacao_completa(self, streaming=False, tamanho_chunk=TAMANHO_CHUNK_PADRAO, incremental=False,
+                                      paralelo=False, max_workers=None, arquivos_operadora=None,
+                                      arquivo_metricas=ARQUIVO_METRICAS, perfil=False, saidas=SAIDAS_PADRAO,
+                                      dpi=DPI_GRAFICO):
+        """Executa todo o processo de conciliação; retorna True em caso de sucesso"""
+        conciliacao = delta = self.ocorrencias_duplicidade = None
+        medidor = MedidorEtapas(self.arquivo_saida(arquivo_metricas) if arquivo_metricas else None)
+        modo = 'streaming' if streaming else 'incremental' if incremental else 'paralelo' if paralelo else 'memoria'
+        medidor.registrar('inicio', modo=modo)
+        inicio = time.perf_counter()
+        
+        # Perfil opcional (cProfile) de toda a execução, gravado em relatorios/
+        profiler = None
+        if perfil:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        
+        try:
+            _validar_saidas(saidas)
+            print("🔄 Iniciando Conciliação de Guias...")
+            print("="*50)
             
-            print(f"📋 Total de Guias Analisadas: {resumo['total_guias']:,}")
-            print(f"💰 Valor Enviado: R$ {resumo['valor_enviado_total']:,.2f}")
-            print(f"💳 Valor Pago: R$ {resumo['valor_pago_total']:,.2f}")
-            print(f"📊 Diferença: R$ {resumo['diferenca_total']:,.2f} ({resumo['percentual_diferenca_total']:.2f}%)")
+            if streaming:
+                # 1-3. Conciliação em blocos com totais acumulados
+                if not os.path.exists(self.arquivo_interno) or not os.path.exists(self.arquivo_operadora):
+                    print("❌ Arquivos não encontrados. Gerando dados fictícios...")
+                    self.gerar_dados_ficticios()
+                print(f"🔍 Realizando conciliação em blocos de {tamanho_chunk:,} guias...")
+                with medidor.etapa('conciliacao_streaming') as medida:
+                    conciliacao, relatorio = self.conciliar_guias_streaming(tamanho_chunk=tamanho_chunk,
+                                                                            medir_larguras='excel' in saidas)
+                    medida['linhas_saida'] = relatorio['resumo_geral']['total_guias']
+            elif incremental:
+                # 1. Carregar dados
+                print("📊 Carregando dados...")
+                with medidor.etapa('carga') as medida:
+                    df_interno, df_operadora = self.carregar_dados()
+                    medida.update(linhas_saida=len(df_interno), linhas_operadora=len(df_operadora))
+                
+                # 2-3. Conciliar só o que mudou e atualizar os agregados persistidos
+                print("🔁 Conciliando guias novas ou alteradas...")
+                data_referencia = datetime.now()
+                estado = EstadoConciliacao(self.arquivo_saida(self.arquivo_estado), self.tipo_classificacao())
+                try:
+                    with medidor.etapa('conciliacao_incremental', len(df_interno)) as medida:
+                        delta = self.conciliar_incremental(df_interno, df_operadora, estado, data_referencia)
+                        medida['linhas_saida'] = len(delta)
+                    print(f"   • {len(delta):,} guias reconciliadas nesta execução")
+                    
+                    print("📈 Gerando análises...")
+                    with medidor.etapa('relatorio') as medida:
+                        relatorio = estado.gerar_relatorio(data_referencia)
+                        # O histórico linha a linha só é lido quando a planilha ou o índice são pedidos
+                        if 'excel' in saidas or 'aging' in saidas:
+                            conciliacao = estado.carregar_conciliacao(data_referencia)
+                        medida['linhas_saida'] = relatorio['resumo_geral']['total_guias']
+                finally:
+                    estado.fechar()
+            elif paralelo:
+                # 1. Carregar dados
+                print("📊 Carregando dados...")
+                with medidor.etapa('carga') as medida:
+                    df_interno, df_operadora = self.carregar_dados(arquivos_operadora)
+                    medida.update(linhas_saida=len(df_interno), linhas_operadora=len(df_operadora))
+                
+                # 2-3. Conciliação e relatórios parciais por convênio, em paralelo
+                print(f"🔍 Realizando conciliação por convênio em paralelo ({max_workers or os.cpu_count()} processos)...")
+                with medidor.etapa('conciliacao_paralela', len(df_interno)) as medida:
+                    conciliacao, relatorio = self.conciliar_paralelo(df_interno, df_operadora, max_workers)
+                    medida['linhas_saida'] = len(conciliacao)
+            else:
+                # 1. Carregar dados
+                print("📊 Carregando dados...")
+                with medidor.etapa('carga') as medida:
+                    df_interno, df_operadora = self.carregar_dados(arquivos_operadora)
+                    medida.update(linhas_saida=len(df_interno), linhas_operadora=len(df_operadora))
+                
+                # 2. Realizar conciliação
+                print("🔍 Realizando conciliação...")
+                with medidor.etapa('conciliacao', len(df_interno)) as medida:
+                    conciliacao = self.conciliar_guias(df_interno, df_operadora)
+                    medida['linhas_saida'] = len(conciliacao)
+                
+                # 3. Gerar relatório
+                print("📈 Gerando análises...")
+                with medidor.etapa('relatorio', len(conciliacao)) as medida:
+                    relatorio = self.gerar_relatorio_divergencias(conciliacao)
+                    medida['linhas_saida'] = relatorio.quantidade('divergencias_significativas')
             
-            print("\n📈 DISTRIBUIÇÃO DAS GUIAS:")
-            for status, qtd in stats.items():
-                percentual = (qtd / resumo['total_guias']) * 100
-                print(f"   {status}: {qtd:,} ({percentual:.1f}%)")
+            # 4. Guias repetidas consolidadas antes da junção
+            self.relatar_duplicidades(medidor)
             
-            print(f"\n⚠️ Divergências Significativas: {len(relatorio['divergencias_significativas']):,}")
-            print(f"🕐 Não Processadas +30 dias: {len(relatorio['nao_processadas_antigas']):,}")
+            # 5. Atualizar o índice de aging das guias em aberto (no incremental, só as alteradas)
+            arquivos_estado = {}
+            if 'aging' in saidas:
+                with medidor.etapa('indice_aging', relatorio['resumo_geral']['total_guias']) as medida:
+                    medida['linhas_saida'] = self.atualizar_indice_aging(conciliacao, delta)
+                arquivos_estado['aging'] = self.arquivo_saida(ARQUIVO_INDICE_AGING)
+            elif delta is not None:
+                self.descartar_indice_aging()
             
-            print(f"\n📁 ARQUIVOS GERADOS:")
-            print(f"   • {arquivo_excel}")
-            print(f"   • graficos/conciliacao_guias.png")
+            # 6. Gravar o cubo de glosas (no incremental, já ajustado pelas guias alteradas)
+            if 'glosas' in saidas:
+                with medidor.etapa('cubo_glosas', relatorio['resumo_geral']['total_guias']) as medida:
+                    medida['linhas_saida'] = self.gravar_cubo_glosas(relatorio['cubo_glosas'])
+                if medida['linhas_saida']:
+                    arquivos_estado['glosas'] = self.arquivo_saida(ARQUIVO_CUBO_GLOSAS)
             
-            print("\n✅ CONCILIAÇÃO CONCLUÍDA COM SUCESSO!")
+            # 7-8. Gerar as saídas pedidas (gráficos e Excel em paralelo)
+            arquivos = {**self.gerar_saidas(conciliacao, relatorio, saidas, dpi, medidor), **arquivos_estado}
             
-            # Alertas importantes
-            if resumo['percentual_diferenca_total'] < -5:
-                print("\n🚨 ALERTA: Diferença significativa - Hospital recebendo MENOS que enviado!")
-            elif resumo['percentual_diferenca_total'] > 5:
-                print("\n✨ Hospital recebendo MAIS que enviado - Verificar se está correto")
+            # 9. Resumo final
+            self.imprimir_resultado(relatorio, arquivos)
             
-            if len(relatorio['nao_processadas_antigas']) > 0:
-                print(f"\n⏰ AÇÃO NECESSÁRIA: {len(relatorio['nao_processadas_antigas'])} guias não processadas há mais de 30 dias!")
+            medidor.registrar(
+                'fim', modo=modo, status='sucesso', segundos=round(time.perf_counter() - inicio, 4),
+                pico_rss_mb=medidor.pico_memoria_mb(), total_guias=relatorio['resumo_geral']['total_guias'],
+                divergencias_significativas=relatorio.quantidade('divergencias_significativas'),
+                nao_processadas_antigas=relatorio.quantidade('nao_processadas_antigas')
+            )
+            return True
             
         except Exception as e:
             print(f"❌ Erro na conciliação: {str(e)}")
             import traceback
             traceback.print_exc()
+            medidor.registrar(
+                'fim', modo=modo, status='erro', segundos=round(time.perf_counter() - inicio, 4),
+                pico_rss_mb=medidor.pico_memoria_mb(), erro=f"{type(e).__name__}: {e}"
+            )
+            return False
+        
+        finally:
+            if isinstance(conciliacao, ConciliacaoEmDisco):
+                conciliacao.limpar()
+            if profiler is not None:
+                profiler.disable()
+                arquivo_perfil = self.arquivo_saida(f"relatorios/perfil_{medidor.execucao}.prof")
+                profiler.dump_stats(arquivo_perfil)
+                print(f"🧭 Perfil de execução: {arquivo_perfil} (abrir com python -m pstats)")
+
+def _benchmark_tamanho(total_guias, semente, data_referencia):
+    """Gera os dados num diretório temporário e mede cada etapa da conciliação"""
+    diretorio = tempfile.mkdtemp(prefix='benchmark_conciliacao_')
+    medidor = MedidorEtapas()
+    try:
+        # Entradas, saídas, cache e estado ficam no diretório temporário (o diretório atual não muda)
+        conciliador = ConciliadorGuias(
+            arquivo_interno=os.path.join(diretorio, ARQUIVO_INTERNO),
+            arquivo_operadora=os.path.join(diretorio, ARQUIVO_OPERADORA),
+            diretorio_saida=diretorio, diretorio_cache=os.path.join(diretorio, DIRETORIO_CACHE),
+            arquivo_estado=os.path.join(diretorio, ARQUIVO_ESTADO)
+        )
+        GeradorDadosFicticios(total_guias, data_referencia=data_referencia, semente=semente).gravar(
+            conciliador.arquivo_interno, conciliador.arquivo_operadora
+        )
+        
+        # Etapas dependentes: uma falha (ex.: falta de memória) encerra este tamanho
+        try:
+            with medidor.etapa('carga', total_guias):
+                df_interno, df_operadora = conciliador.carregar_dados()
+            with medidor.etapa('conciliacao', total_guias):
+                conciliacao = conciliador.conciliar_guias(df_interno, df_operadora, data_referencia)
+            with medidor.etapa('relatorio', total_guias):
+                relatorio = conciliador.gerar_relatorio_divergencias(conciliacao)
+            with medidor.etapa('graficos', total_guias):
+                conciliador.gerar_graficos_conciliacao(conciliacao, relatorio)
+            with medidor.etapa('excel', total_guias):
+                conciliador.gerar_excel_conciliacao(conciliacao, relatorio)
+        except Exception as e:
+            print(f"❌ Benchmark interrompido em {total_guias:,} guias: {e}")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+    return medidor.etapas
+
+
+def medir_partida_fria(repeticoes=5):
+    """Tempo (melhor de N) para a linha de comando responder `--help` e, como referência, do interpretador vazio"""
+    import subprocess
+    
+    def melhor_tempo(comando):
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            subprocess.run(comando, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            tempos.append(time.perf_counter() - inicio)
+        return round(min(tempos), 4)
+    
+    return {
+        'segundos': melhor_tempo([sys.executable, os.path.abspath(__file__), '--help']),
+        'interpretador_segundos': melhor_tempo([sys.executable, '-c', 'pass'])
+    }
+
+
+def comparar_benchmark(resultado, base, limite=LIMITE_REGRESSAO_BENCHMARK):
+    """Etapas com tempo ou pico de memória acima da base além do limite"""
+    regressoes = []
+    
+    # Partida a frio da linha de comando, registrada como a etapa 'partida_fria' de 0 guias
+    atual, referencia = resultado.get('partida_fria', {}).get('segundos'), base.get('partida_fria', {}).get('segundos')
+    if atual and referencia and atual > referencia * (1 + limite) and atual - referencia >= TEMPO_MINIMO_BENCHMARK:
+        regressoes.append({
+            'tamanho': '0', 'etapa': 'partida_fria', 'metrica': 'segundos',
+            'base': referencia, 'atual': atual, 'variacao': round(atual / referencia - 1, 4)
+        })
+    
+    for tamanho, etapas in resultado['tamanhos'].items():
+        for etapa, medida in etapas.items():
+            anterior = base.get('tamanhos', {}).get(tamanho, {}).get(etapa)
+            if not anterior or 'erro' in medida or 'erro' in anterior:
+                continue
+            for metrica, minimo in (('segundos', TEMPO_MINIMO_BENCHMARK), ('pico_rss_mb', 0)):
+                atual, referencia = medida.get(metrica), anterior.get(metrica)
+                if not atual or not referencia:
+                    continue
+                # Tempos muito curtos variam mais que o limite só por ruído
+                if atual > referencia * (1 + limite) and atual - referencia >= minimo:
+                    regressoes.append({
+                        'tamanho': tamanho, 'etapa': etapa, 'metrica': metrica,
+                        'base': referencia, 'atual': atual, 'variacao': round(atual / referencia - 1, 4)
+                    })
+    return regressoes
+
+
+def executar_benchmark(tamanhos=TAMANHOS_BENCHMARK, arquivo_resultado=None, arquivo_base=ARQUIVO_BASE_BENCHMARK,
+                       limite=LIMITE_REGRESSAO_BENCHMARK, atualizar_base=False, semente=42,
+                       data_referencia='2025-01-01'):
+    """Mede as etapas do pipeline em dados sintéticos e compara com a base gravada"""
+    arquivo_resultado = os.path.abspath(
+        arquivo_resultado or f"relatorios/benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    arquivo_base = os.path.abspath(arquivo_base)
+    data_referencia = pd.Timestamp(data_referencia)
+    
+    resultado = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'semente': semente,
+        'tamanhos': {}
+    }
+    
+    print("⏱️ Partida a frio da linha de comando...")
+    resultado['partida_fria'] = medir_partida_fria()
+    print(f"   • {resultado['partida_fria']['segundos']:.3f}s "
+          f"(interpretador vazio: {resultado['partida_fria']['interpretador_segundos']:.3f}s)")
+    
+    for total_guias in tamanhos:
+        print(f"⏱️ Benchmark com {total_guias:,} guias...")
+        etapas = _benchmark_tamanho(total_guias, semente, data_referencia)
+        resultado['tamanhos'][str(total_guias)] = etapas
+        for etapa, medida in etapas.items():
+            if 'erro' in medida:
+                print(f"   • {etapa}: ❌ {medida['erro']}")
+            else:
+                print(f"   • {etapa}: {medida['segundos']:.2f}s, pico {medida['pico_rss_mb'] or 0:,.0f} MB, "
+                      f"{medida['linhas_por_segundo'] or 0:,} guias/s")
+    
+    resultado['regressoes'] = []
+    if os.path.exists(arquivo_base) and not atualizar_base:
+        with open(arquivo_base, encoding='utf-8') as arquivo:
+            resultado['regressoes'] = comparar_benchmark(resultado, json.load(arquivo), limite)
+        for regressao in resultado['regressoes']:
+            alvo = f" com {int(regressao['tamanho']):,} guias" if int(regressao['tamanho']) else ""
+            print(f"🚨 Regressão: {regressao['etapa']}{alvo}, "
+                  f"{regressao['metrica']} {regressao['base']} → {regressao['atual']} ({regressao['variacao']:+.0%})")
+        if not resultado['regressoes']:
+            print(f"✅ Sem regressões acima de {limite:.0%} em relação à base")
+    
+    os.makedirs(os.path.dirname(arquivo_resultado), exist_ok=True)
+    with open(arquivo_resultado, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"📁 Resultado do benchmark: {arquivo_resultado}")
+    
+    if atualizar_base:
+        os.makedirs(os.path.dirname(arquivo_base), exist_ok=True)
+        shutil.copyfile(arquivo_resultado, arquivo_base)
+        print(f"📌 Base de comparação atualizada: {arquivo_base}")
+    
+    return resultado
+
+
+def _lista_saidas(texto):
+    """Converte 'excel,png,json' na tupla de saídas, validando os nomes"""
+    saidas = tuple(saida.strip() for saida in texto.split(',') if saida.strip())
+    try:
+        _validar_saidas(saidas)
+    except ValueError as e:
+        import argparse
+        raise argparse.ArgumentTypeError(str(e))
+    return saidas
+
+
+def _arquivo_estado(args):
+    """Estado informado na linha de comando (relativo ao diretório atual) ou o padrão dentro de --saida"""
+    return os.path.abspath(args.estado) if args.estado else ARQUIVO_ESTADO
+
+
+def _comando_conciliar(args):
+    operadoras = args.operadora or [ARQUIVO_OPERADORA]
+    if len(operadoras) > 1 and args.modo in ('streaming', 'incremental'):
+        print(f"❌ O modo {args.modo} aceita um único demonstrativo")
+        return 1
+    # Caminhos informados explicitamente precisam existir (os padrões são gerados com dados fictícios)
+    for caminho in ([args.interno] if args.interno else []) + (args.operadora or []):
+        if not os.path.exists(caminho):
+            print(f"❌ Arquivo não encontrado: {caminho}")
+            return 1
+    
+    conciliador = ConciliadorGuias(
+        arquivo_interno=args.interno or ARQUIVO_INTERNO, arquivo_operadora=operadoras[0],
+        diretorio_saida=args.saida, diretorio_cache=args.cache, arquivo_estado=_arquivo_estado(args),
+        duplicidades=ConsolidacaoDuplicidades(args.repetidas_operadora, args.repetidas_interno)
+    )
+    sucesso = conciliador.executar_conciliacao_completa(
+        streaming=args.modo == 'streaming', tamanho_chunk=args.tamanho_chunk,
+        incremental=args.modo == 'incremental', paralelo=args.modo == 'paralelo', max_workers=args.workers,
+        arquivos_operadora=args.operadora if len(operadoras) > 1 else None,
+        perfil=args.perfil, saidas=args.saidas, dpi=DPI_PREVIA if args.previa else DPI_GRAFICO
+    )
+    return 0 if sucesso else 1
+
+
+def _comando_relatorio(args):
+    conciliador = ConciliadorGuias(diretorio_saida=args.saida, arquivo_estado=_arquivo_estado(args))
+    sucesso = conciliador.gerar_relatorio_estado(args.saidas, DPI_PREVIA if args.previa else DPI_GRAFICO)
+    return 0 if sucesso else 1
+
+
+def _comando_gerar(args):
+    # Os nomes padrão acompanham o formato (ex.: dados/guias_sistema_interno.parquet)
+    arquivo_interno, arquivo_operadora = (
+        caminho or os.path.splitext(padrao)[0] + '.' + args.formato
+        for caminho, padrao in ((args.interno, ARQUIVO_INTERNO), (args.operadora, ARQUIVO_OPERADORA))
+    )
+    gerador = GeradorDadosFicticios(args.total, data_referencia=args.data_referencia, semente=args.semente,
+                                    tamanho_bloco=args.tamanho_bloco)
+    total_interno, total_operadora = gerador.gravar(arquivo_interno, arquivo_operadora, args.formato)
+    print("✅ Dados fictícios gerados:")
+    print(f"   • {total_interno:,} guias no sistema interno: {arquivo_interno}")
+    print(f"   • {total_operadora:,} guias no demonstrativo da operadora: {arquivo_operadora}")
+    return 0
+
+
+def _comando_benchmark(args):
+    resultado = executar_benchmark(args.tamanhos or TAMANHOS_BENCHMARK, args.resultado, args.base,
+                                   args.limite, args.atualizar_base)
+    return 1 if resultado['regressoes'] else 0
+
+
+def _comando_aging(args):
+    arquivo_indice = os.path.join(args.saida, ARQUIVO_INDICE_AGING)
+    if not os.path.exists(arquivo_indice):
+        print(f"❌ Índice de aging não encontrado: {arquivo_indice} (execute uma conciliação)")
+        return 1
+    data_referencia = datetime.strptime(args.data_referencia, '%Y-%m-%d') if args.data_referencia else None
+    
+    indice = IndiceAging(arquivo_indice)
+    try:
+        _concluir_importacao('pandas')  # o tempo medido é só o das consultas
+        inicio = time.perf_counter()
+        resumo = indice.resumo_faixas(args.convenio, args.lote, data_referencia, args.por,
+                                      args.dias_minimo, args.dias_maximo, args.faixa)
+        guias = indice.consultar(args.convenio, args.lote, args.dias_minimo, args.dias_maximo, args.faixa,
+                                 data_referencia, args.limite or None)
+        milissegundos = (time.perf_counter() - inicio) * 1000
+        atualizado_em = indice.atualizado_em()
+    finally:
+        indice.fechar()
+    
+    print(f"🕐 GUIAS EM ABERTO POR FAIXA DE DIAS (índice atualizado em {atualizado_em})")
+    if resumo.empty:
+        print("   Nenhuma guia em aberto para os filtros informados")
+    else:
+        # Colunas na ordem das faixas (o unstack não garante essa ordem)
+        quantidades = resumo['quantidade'].unstack(fill_value=0)
+        quantidades = quantidades[[nome for nome, _, _ in FAIXAS_AGING if nome in quantidades.columns]]
+        quantidades['valor_em_aberto'] = (resumo['valor_em_aberto'].groupby(level=0).sum() / 100).map('R$ {:,.2f}'.format)
+        print(quantidades.to_string())
+    
+    if not guias.empty:
+        print(f"\n📋 GUIAS ({len(guias):,}, das mais antigas{'; limite ' + str(args.limite) if args.limite else ''}):")
+        guias['data_envio'] = guias['data_envio'].dt.strftime('%Y-%m-%d')
+        guias['valor_em_aberto'] = ((guias['valor_enviado'] - guias['valor_pago']) / 100).map('R$ {:,.2f}'.format)
+        print(guias[['numero_guia', 'convenio', 'lote', 'data_envio', 'dias_em_aberto', 'faixa_aging',
+                     'classificacao', 'valor_em_aberto']].to_string(index=False))
+    
+    print(f"\n⏱️ Consultas respondidas em {milissegundos:.1f} ms")
+    return 0
+
+
+def _comando_glosas(args):
+    arquivo_cubo = os.path.join(args.saida, ARQUIVO_CUBO_GLOSAS)
+    if not os.path.exists(arquivo_cubo):
+        print(f"❌ Cubo de glosas não encontrado: {arquivo_cubo} (execute uma conciliação)")
+        return 1
+    filtros = {dimensao: getattr(args, dimensao) for dimensao in CuboGlosas.DIMENSOES if getattr(args, dimensao)}
+    
+    _concluir_importacao('pandas')  # o tempo medido é só o da consulta
+    inicio = time.perf_counter()
+    resultado = CuboGlosas.ler(arquivo_cubo).consultar(args.por, filtros, args.ordenar, args.top or None)
+    milissegundos = (time.perf_counter() - inicio) * 1000
+    
+    print(f"❌ GLOSAS E DIVERGÊNCIAS POR {', '.join(args.por).upper()}")
+    if resultado.empty:
+        print("   Nenhuma guia para os filtros informados")
+    else:
+        for medida in ['valor_enviado', 'valor_glosado', 'valor_divergente']:
+            resultado[medida] = (resultado[medida] / 100).map('R$ {:,.2f}'.format)
+        print(resultado.to_string())
+    
+    print(f"\n⏱️ Consulta respondida em {milissegundos:.1f} ms")
+    return 0
+
+
+def criar_parser():
+    """Linha de comando com os subcomandos reconcile, report, aging, glosas, generate e bench"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        prog='conciliador_guias',
+        description='Conciliação de guias hospitalares com os demonstrativos das operadoras'
+    )
+    subcomandos = parser.add_subparsers(dest='comando', required=True, metavar='comando')
+    
+    # Opções de saída comuns à conciliação e ao relatório
+    saida = argparse.ArgumentParser(add_help=False)
+    saida.add_argument('--saida', default='', metavar='DIR',
+                       help='diretório base de conciliacao/, graficos/ e relatorios/ (padrão: diretório atual)')
+    saida.add_argument('--saidas', type=_lista_saidas, default=SAIDAS_PADRAO, metavar='LISTA',
+                       help=f"artefatos a gerar, separados por vírgula: {','.join(SAIDAS_DISPONIVEIS)} "
+                            f"(padrão: {','.join(SAIDAS_PADRAO)})")
+    saida.add_argument('--previa', action='store_true', help=f'gráfico em resolução de prévia ({DPI_PREVIA} dpi)')
+    saida.add_argument('--estado', metavar='ARQUIVO',
+                       help=f'estado da conciliação incremental (padrão: <saida>/{ARQUIVO_ESTADO})')
+    
+    conciliar = subcomandos.add_parser('reconcile', aliases=['conciliar'], parents=[saida],
+                                       help='concilia as guias e gera as saídas')
+    conciliar.add_argument('--interno', metavar='CSV', help=f'guias do sistema interno (padrão: {ARQUIVO_INTERNO})')
+    conciliar.add_argument('--operadora', nargs='+', metavar='ARQUIVO',
+                           help=f"demonstrativo(s) da operadora: {', '.join(sorted(ADAPTADORES_DEMONSTRATIVO))} "
+                                f"(padrão: {ARQUIVO_OPERADORA})")
+    conciliar.add_argument('--modo', choices=['memoria', 'streaming', 'incremental', 'paralelo'], default='memoria')
+    conciliar.add_argument('--repetidas-operadora', choices=POLITICAS_DUPLICIDADE_OPERADORA, default='somar',
+                           help='linhas diferentes da mesma guia no demonstrativo (padrão: somar as '
+                                'complementares; nos conflitos fica a mais recente)')
+    conciliar.add_argument('--repetidas-interno', choices=POLITICAS_DUPLICIDADE_INTERNO, default='mais_recente',
+                           help='guia repetida no sistema interno (padrão: mais_recente)')
+    conciliar.add_argument('--tamanho-chunk', type=int, default=TAMANHO_CHUNK_PADRAO,
+                           help='guias por bloco no modo streaming')
+    conciliar.add_argument('--workers', type=int, help='processos no modo paralelo (padrão: número de CPUs)')
+    conciliar.add_argument('--cache', default=DIRETORIO_CACHE, metavar='DIR', help='diretório do cache Parquet das fontes')
+    conciliar.add_argument('--perfil', action='store_true', help='grava um perfil cProfile em relatorios/')
+    conciliar.set_defaults(executar=_comando_conciliar)
+    
+    relatorio = subcomandos.add_parser('report', aliases=['relatorio'], parents=[saida],
+                                       help='gera as saídas a partir do estado incremental, sem reconciliar')
+    relatorio.set_defaults(executar=_comando_relatorio)
+    
+    gerar = subcomandos.add_parser('generate', aliases=['gerar'], help='gera dados fictícios para testes')
+    gerar.add_argument('--total', type=int, default=300, help='quantidade de guias')
+    gerar.add_argument('--semente', type=int, default=42)
+    gerar.add_argument('--data-referencia', help='data de referência fixa (AAAA-MM-DD); padrão: hoje')
+    gerar.add_argument('--formato', choices=['csv', 'parquet'], default='csv')
+    gerar.add_argument('--tamanho-bloco', type=int, default=TAMANHO_CHUNK_PADRAO)
+    gerar.add_argument('--interno', metavar='ARQUIVO', help=f'padrão: {ARQUIVO_INTERNO} (extensão conforme o formato)')
+    gerar.add_argument('--operadora', metavar='ARQUIVO', help=f'padrão: {ARQUIVO_OPERADORA} (extensão conforme o formato)')
+    gerar.set_defaults(executar=_comando_gerar)
+    
+    aging = subcomandos.add_parser('aging', aliases=['pendencias'],
+                                   help='consulta as guias em aberto por convênio, lote e faixa de dias')
+    aging.add_argument('--saida', default='', metavar='DIR', help='diretório base usado na conciliação')
+    aging.add_argument('--convenio')
+    aging.add_argument('--lote')
+    aging.add_argument('--faixa', choices=[nome for nome, _, _ in FAIXAS_AGING])
+    aging.add_argument('--dias-minimo', type=int, metavar='N', help='guias com pelo menos N dias em aberto')
+    aging.add_argument('--dias-maximo', type=int, metavar='N', help='guias com no máximo N dias em aberto')
+    aging.add_argument('--por', choices=['convenio', 'lote'], default='convenio', help='agrupamento do resumo')
+    aging.add_argument('--data-referencia', help='data de referência (AAAA-MM-DD); padrão: agora')
+    aging.add_argument('--limite', type=int, default=20, help='máximo de guias listadas (0 = todas)')
+    aging.set_defaults(executar=_comando_aging)
+    
+    glosas = subcomandos.add_parser('glosas', help='consulta o cubo de glosas por convênio, procedimento, '
+                                                   'motivo e mês (drill-down e top-K)')
+    glosas.add_argument('--saida', default='', metavar='DIR', help='diretório base usado na conciliação')
+    glosas.add_argument('--por', nargs='+', choices=CuboGlosas.DIMENSOES, default=['motivo_glosa'],
+                        help='dimensões do agrupamento (padrão: motivo_glosa)')
+    glosas.add_argument('--convenio')
+    glosas.add_argument('--procedimento')
+    glosas.add_argument('--motivo', dest='motivo_glosa')
+    glosas.add_argument('--mes', dest='mes_envio', metavar='AAAA-MM')
+    glosas.add_argument('--ordenar', choices=CuboGlosas.MEDIDAS, default='valor_glosado')
+    glosas.add_argument('--top', type=int, default=10, help='máximo de linhas (0 = todas)')
+    glosas.set_defaults(executar=_comando_glosas)
+    
+    benchmark = subcomandos.add_parser('bench', aliases=['benchmark'],
+                                       help='mede as etapas e a partida a frio e compara com a base')
+    benchmark.add_argument('tamanhos', nargs='*', type=int,
+                           help=f"quantidades de guias (padrão: {' '.join(map(str, TAMANHOS_BENCHMARK))})")
+    benchmark.add_argument('--atualizar-base', action='store_true', help='grava o resultado como nova base')
+    benchmark.add_argument('--base', default=ARQUIVO_BASE_BENCHMARK, metavar='ARQUIVO')
+    benchmark.add_argument('--resultado', metavar='ARQUIVO', help='padrão: relatorios/benchmark_<data>.json')
+    benchmark.add_argument('--limite', type=float, default=LIMITE_REGRESSAO_BENCHMARK,
+                           help='variação máxima aceita em relação à base (0.20 = 20%%)')
+    benchmark.set_defaults(executar=_comando_benchmark)
+    
+    return parser
+
+
+def main(argv=None):
+    """Executa a linha de comando e devolve o código de saída"""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    
+    # Sem subcomando, mantém o uso original: conciliação completa com as dicas de portfólio
+    padrao = not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help'))
+    if padrao:
+        argv = ['reconcile'] + argv
+    
+    args = criar_parser().parse_args(argv)
+    codigo = args.executar(args)
+    
+    if padrao:
+        print("\n" + "="*60)
+        print("🎯 COMO USAR ESTE PROJETO NO SEU PORTFÓLIO:")
+        print("="*60)
+        print("1. 📊 Substitua dados fictícios por arquivos reais do hospital")
+        print("2. 🔧 Configure para diferentes formatos de demonstrativos")
+        print("3. 📧 Adicione envio automático para gestores")
+        print("4. 🕒 Agende execução diária/semanal")
+        print("5. 📱 Crie alertas para divergências críticas")
+        print("6. 🌐 Desenvolva dashboard web interativo")
+        print("\n💡 Este projeto resolve um problema REAL e custoso dos hospitais!")
+        print("🚀 Mostra domínio técnico E conhecimento específico do negócio!")
+    
+    return codigo
+
 
 # EXECUÇÃO PRINCIPAL
 if __name__ == "__main__":
-    conciliador = ConciliadorGuias()
-    conciliador.executar_conciliacao_completa()
-    
-    print("\n" + "="*60)
-    print("🎯 COMO USAR ESTE PROJETO NO SEU PORTFÓLIO:")
-    print("="*60)
-    print("1. 📊 Substitua dados fictícios por arquivos reais do hospital")
-    print("2. 🔧 Configure para diferentes formatos de demonstrativos")
-    print("3. 📧 Adicione envio automático para gestores")
-    print("4. 🕒 Agende execução diária/semanal")
-    print("5. 📱 Crie alertas para divergências críticas")
-    print("6. 🌐 Desenvolva dashboard web interativo")
-    print("\n💡 Este projeto resolve um problema REAL e custoso dos hospitais!")
-    print("🚀 Mostra domínio técnico E conhecimento específico do negócio!")
\ No newline at end of file
+    # python conciliador_guias.py.py [reconcile|report|aging|glosas|generate|bench] [opções]  (--help em cada subcomando)
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,257 @@
+import importlib.util
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# O script tem extensão dupla (conciliador_guias.py.py): carregado pelo caminho
+CAMINHO_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'conciliador_guias.py.py')
+_spec = importlib.util.spec_from_file_location('conciliador_guias', CAMINHO_SCRIPT)
+cg = importlib.util.module_from_spec(_spec)
+sys.modules['conciliador_guias'] = cg  # os processos do modo paralelo importam as funções pelo nome
+_spec.loader.exec_module(cg)
+
+DATA_REFERENCIA = pd.Timestamp('2024-06-30')
+
+
+def _pendentes(linhas):
+    return pd.DataFrame(linhas, columns=['numero_guia', 'convenio', 'paciente', 'procedimento',
+                                         'data_atendimento', 'valor_enviado']).astype(
+        {'data_atendimento': 'datetime64[ns]', 'valor_enviado': 'int64'})
+
+
+def _orfas(linhas):
+    return pd.DataFrame(linhas, columns=['numero_guia', 'convenio', 'paciente', 'procedimento',
+                                         'data_processamento', 'valor_pago']).astype(
+        {'data_processamento': 'datetime64[ns]', 'valor_pago': 'int64'})
+
+
+def _vinculos(pendentes, orfas, **parametros):
+    pares = cg.CorrespondenciaSecundaria(**parametros).vincular(pendentes, orfas)
+    numeros = pendentes['numero_guia'].to_numpy()[pares['posicao'].to_numpy(dtype='int64')]
+    return dict(zip(numeros, zip(pares['numero_guia_operadora'], pares['regra'])))
+
+
+# --- Correspondência secundária ---
+
+def test_guia_com_prefixo_e_separadores_vincula_pelo_numero_normalizado():
+    pendentes = _pendentes([('GH2024000123', 'Amil', 'Paciente 001', 'Exame ECG', '2024-05-01', 10000)])
+    orfas = _orfas([('GH-2024-000123', 'Amil', 'Outro', 'Consulta', '2024-05-20', 9000)])
+    assert _vinculos(pendentes, orfas) == {'GH2024000123': ('GH-2024-000123', 'guia_normalizada')}
+
+
+def test_digitos_invertidos_corroborados_vinculam_por_aproximacao():
+    # Procedimento diferente: a chave composta não casa, só o número a uma inversão de distância
+    pendentes = _pendentes([('GH2024000456', 'Amil', 'Paciente 002', 'Exame ECG', '2024-05-01', 10000)])
+    orfas = _orfas([('GH2024000465', 'Amil', 'Paciente 002', 'Hemograma', '2024-05-20', 10000)])
+    pares = cg.CorrespondenciaSecundaria().vincular(pendentes, orfas)
+    assert pares[['numero_guia_operadora', 'regra']].values.tolist() == [['GH2024000465', 'guia_aproximada']]
+    assert pares['confianca'].iloc[0] == pytest.approx(0.7)
+
+
+def test_numero_proximo_sem_corroboracao_e_descartado():
+    # Uma edição de distância, mas paciente, procedimento e valor divergem
+    pendentes = _pendentes([('GH2024000789', 'Amil', 'Paciente 003', 'Exame ECG', '2024-05-01', 10000)])
+    orfas = _orfas([('GH2024000788', 'Amil', 'Outro', 'Hemograma', '2024-05-20', 50000)])
+    assert _vinculos(pendentes, orfas) == {}
+    # Aceito apenas quando o chamador reduz a confiança mínima
+    assert _vinculos(pendentes, orfas, confianca_minima_aproximada=0.5) == {
+        'GH2024000789': ('GH2024000788', 'guia_aproximada')}
+
+
+def test_orfa_disputada_vincula_no_maximo_uma_guia():
+    pendentes = _pendentes([('GH2024000555', 'Amil', 'Paciente 004', 'Exame ECG', '2024-05-01', 10000),
+                            ('GH2024000556', 'Amil', 'Paciente 004', 'Exame ECG', '2024-05-01', 10000)])
+    orfas = _orfas([('GH2024000557', 'Amil', 'Paciente 004', 'Hemograma', '2024-05-20', 10000)])
+    assert list(_vinculos(pendentes, orfas).values()) == [('GH2024000557', 'guia_aproximada')]
+
+
+def test_aproximacao_fora_da_janela_de_datas_e_descartada():
+    pendentes = _pendentes([('GH2024000456', 'Amil', 'Paciente 002', 'Exame ECG', '2024-01-01', 10000)])
+    orfas = _orfas([('GH2024000465', 'Amil', 'Paciente 002', 'Hemograma', '2024-06-20', 10000)])
+    assert _vinculos(pendentes, orfas) == {}
+
+
+# --- Consolidação de duplicidades ---
+
+@pytest.fixture
+def demonstrativo_repetido():
+    linhas = [
+        # Complementares: 70,00 + 50,00 de 120,00 enviados
+        ('G1', 7000, 'Pago com Divergência', 'Co-participação aplicada', '2024-05-01'),
+        ('G1', 5000, 'Pago', None, '2024-05-05'),
+        # Reprocessada: paga e depois glosada
+        ('G2', 10000, 'Pago', None, '2024-05-01'),
+        ('G2', 0, 'Glosado', 'Código incorreto', '2024-05-03'),
+        # Correção: 100,00 e depois 120,00 (a soma passaria do enviado)
+        ('G3', 10000, 'Pago', None, '2024-05-01'),
+        ('G3', 12000, 'Pago', None, '2024-05-04'),
+        # Linha reenviada idêntica
+        ('G4', 8000, 'Pago', None, '2024-05-02'),
+        ('G4', 8000, 'Pago', None, '2024-05-02'),
+        ('G5', 9000, 'Pago', None, '2024-05-02'),
+    ]
+    df = pd.DataFrame(linhas, columns=['numero_guia', 'valor_pago', 'status_operadora', 'motivo_glosa',
+                                       'data_processamento'])
+    return df.astype({'data_processamento': 'datetime64[ns]'})
+
+
+VALORES_ENVIADOS = pd.Series({'G1': 12000, 'G2': 10000, 'G3': 12000, 'G4': 8000, 'G5': 9000})
+
+
+def _por_guia(df):
+    return df.set_index('numero_guia')
+
+
+def test_politica_somar(demonstrativo_repetido):
+    df, ocorrencias = cg.ConsolidacaoDuplicidades('somar').consolidar_operadora(demonstrativo_repetido,
+                                                                                 VALORES_ENVIADOS)
+    assert df['numero_guia'].tolist() == ['G1', 'G2', 'G3', 'G4', 'G5']
+    linhas = _por_guia(df)
+    assert linhas.loc['G1', 'valor_pago'] == 12000
+    assert linhas.loc['G1', 'status_operadora'] == cg.SITUACAO_PAGAMENTO_SOMADO
+    assert linhas.loc['G1', 'motivo_glosa'] == 'Co-participação aplicada'
+    assert linhas.loc['G2', ['valor_pago', 'status_operadora']].tolist() == [0, 'Glosado']
+    assert linhas.loc['G3', 'valor_pago'] == 12000
+    assert linhas.loc['G4', 'valor_pago'] == 8000
+    assert linhas[cg.COLUNA_DUPLICIDADE].dropna().to_dict() == {
+        'G1': 'complementar', 'G2': 'conflito', 'G3': 'conflito', 'G4': 'duplicata'}
+    assert _por_guia(ocorrencias)['linhas'].to_dict() == {'G1': 2, 'G2': 2, 'G3': 2, 'G4': 2}
+
+
+def test_politica_somar_sem_valores_enviados_nao_soma(demonstrativo_repetido):
+    df, _ = cg.ConsolidacaoDuplicidades('somar').consolidar_operadora(demonstrativo_repetido)
+    linhas = _por_guia(df)
+    assert linhas.loc['G1', ['valor_pago', cg.COLUNA_DUPLICIDADE]].tolist() == [5000, 'conflito']
+
+
+def test_politica_mais_recente(demonstrativo_repetido):
+    df, _ = cg.ConsolidacaoDuplicidades('mais_recente').consolidar_operadora(demonstrativo_repetido,
+                                                                              VALORES_ENVIADOS)
+    linhas = _por_guia(df)
+    assert linhas['valor_pago'].to_dict() == {'G1': 5000, 'G2': 0, 'G3': 12000, 'G4': 8000, 'G5': 9000}
+    assert linhas.loc['G1', cg.COLUNA_DUPLICIDADE] == 'conflito'
+
+
+def test_politica_erro(demonstrativo_repetido):
+    consolidacao = cg.ConsolidacaoDuplicidades('erro')
+    with pytest.raises(ValueError, match='3 guias repetidas'):
+        consolidacao.consolidar_operadora(demonstrativo_repetido, VALORES_ENVIADOS)
+    # Duplicatas idênticas não são conflito: ficam uma vez, sem erro
+    so_duplicatas = demonstrativo_repetido[demonstrativo_repetido['numero_guia'].isin(['G4', 'G5'])]
+    df, _ = consolidacao.consolidar_operadora(so_duplicatas, VALORES_ENVIADOS)
+    assert df['numero_guia'].tolist() == ['G4', 'G5']
+
+
+def test_politica_desconhecida():
+    with pytest.raises(ValueError, match='Política desconhecida'):
+        cg.ConsolidacaoDuplicidades('primeira')
+
+
+def test_interno_fica_com_envio_mais_recente():
+    df_interno = pd.DataFrame({
+        'numero_guia': ['G1', 'G2', 'G1'],
+        'valor_enviado': [10000, 20000, 12000],
+        'data_envio': pd.to_datetime(['2024-05-01', '2024-05-01', '2024-05-03']),
+    })
+    df, ocorrencias = cg.ConsolidacaoDuplicidades().consolidar_interno(df_interno)
+    assert df[['numero_guia', 'valor_enviado']].values.tolist() == [['G2', 20000], ['G1', 12000]]
+    assert ocorrencias[['lado', 'numero_guia', 'linhas']].values.tolist() == [['interno', 'G1', 2]]
+    with pytest.raises(ValueError, match='no sistema interno'):
+        cg.ConsolidacaoDuplicidades(politica_interno='erro').consolidar_interno(df_interno)
+
+
+# --- Modos de execução ---
+
+@pytest.fixture
+def conciliador(tmp_path):
+    """Conciliador sobre dados fictícios em tmp_path, com órfãs para a correspondência secundária"""
+    conciliador = cg.ConciliadorGuias(
+        arquivo_interno=str(tmp_path / 'guias_sistema_interno.csv'),
+        arquivo_operadora=str(tmp_path / 'demonstrativo_operadora.csv'),
+        diretorio_saida=str(tmp_path), diretorio_cache=str(tmp_path / 'cache'),
+        arquivo_estado=str(tmp_path / 'estado.sqlite')
+    )
+    cg.GeradorDadosFicticios(240, data_referencia=DATA_REFERENCIA, semente=7, tamanho_bloco=100).gravar(
+        conciliador.arquivo_interno, conciliador.arquivo_operadora)
+
+    # Números alterados no demonstrativo: um com separadores, um com dígitos invertidos
+    df = pd.read_csv(conciliador.arquivo_operadora, dtype=str)
+    df.loc[df['numero_guia'] == 'GH2024000010', 'numero_guia'] = 'GH-2024-000010'
+    df.loc[df['numero_guia'] == 'GH2024000201', 'numero_guia'] = 'GH2024002001'
+    df.to_csv(conciliador.arquivo_operadora, index=False)
+    return conciliador
+
+
+COLUNAS_COMPARADAS = [coluna for coluna in cg.COLUNAS_CONCILIACAO if coluna != 'dias_em_aberto']
+
+
+def _normalizada(conciliacao):
+    conciliacao = conciliacao.sort_values('numero_guia', kind='stable').reset_index(drop=True)
+    return conciliacao[COLUNAS_COMPARADAS].astype(str)
+
+
+def test_memoria_streaming_e_paralelo_concordam(conciliador):
+    df_interno, df_operadora = conciliador.carregar_dados()
+    memoria = conciliador.conciliar_guias(df_interno, df_operadora, DATA_REFERENCIA)
+    relatorio = conciliador.gerar_relatorio_divergencias(memoria)
+    assert set(memoria['regra_conciliacao'].dropna()) >= {'numero_guia', 'guia_normalizada', 'chave_composta'}
+
+    em_disco, relatorio_streaming = conciliador.conciliar_guias_streaming(tamanho_chunk=70)
+    try:
+        streaming = pd.concat(em_disco.blocos_ordenados(), ignore_index=True)
+    finally:
+        em_disco.limpar()
+    paralelo, relatorio_paralelo = conciliador.conciliar_paralelo(df_interno, df_operadora, max_workers=2,
+                                                                  data_referencia=DATA_REFERENCIA)
+
+    esperado = _normalizada(memoria)
+    pd.testing.assert_frame_equal(_normalizada(streaming), esperado)
+    pd.testing.assert_frame_equal(_normalizada(paralelo), esperado)
+    assert relatorio_streaming['resumo_geral'] == relatorio['resumo_geral']
+    assert relatorio_paralelo['resumo_geral'] == relatorio['resumo_geral']
+    # O paralelo preserva a ordem original das guias internas
+    assert paralelo['numero_guia'].tolist() == memoria['numero_guia'].tolist()
+
+
+def _assert_relatorios_iguais(obtido, esperado):
+    assert obtido['resumo_geral'] == esperado['resumo_geral']
+    pd.testing.assert_series_equal(obtido['stats_classificacao'], esperado['stats_classificacao'])
+    pd.testing.assert_frame_equal(obtido['resumo_convenio'], esperado['resumo_convenio'])
+
+
+def test_incremental_repetido_nao_altera_o_estado(conciliador):
+    df_interno, df_operadora = conciliador.carregar_dados()
+    estado = cg.EstadoConciliacao(conciliador.arquivo_estado, conciliador.tipo_classificacao())
+    try:
+        primeira = conciliador.conciliar_incremental(df_interno, df_operadora, estado, DATA_REFERENCIA)
+        relatorio = estado.gerar_relatorio(DATA_REFERENCIA)
+        conciliacao = estado.carregar_conciliacao(DATA_REFERENCIA)
+
+        segunda = conciliador.conciliar_incremental(df_interno, df_operadora, estado, DATA_REFERENCIA)
+        assert len(primeira) == len(df_interno)
+        # Com órfãs no demonstrativo, só as guias sem correspondência exata são revistas
+        assert len(segunda) and (segunda['regra_conciliacao'] != 'numero_guia').all()
+        _assert_relatorios_iguais(estado.gerar_relatorio(DATA_REFERENCIA), relatorio)
+        pd.testing.assert_frame_equal(_normalizada(estado.carregar_conciliacao(DATA_REFERENCIA)),
+                                      _normalizada(conciliacao))
+
+        # E o estado coincide com a conciliação completa em memória
+        memoria = conciliador.conciliar_guias(df_interno, df_operadora, DATA_REFERENCIA)
+        assert relatorio['resumo_geral'] == conciliador.gerar_relatorio_divergencias(memoria)['resumo_geral']
+    finally:
+        estado.fechar()
+
+
+def test_incremental_repetido_sem_correspondencia_secundaria_tem_delta_vazio(conciliador):
+    conciliador.correspondencia = None
+    df_interno, df_operadora = conciliador.carregar_dados()
+    estado = cg.EstadoConciliacao(conciliador.arquivo_estado, conciliador.tipo_classificacao())
+    try:
+        conciliador.conciliar_incremental(df_interno, df_operadora, estado, DATA_REFERENCIA)
+        relatorio = estado.gerar_relatorio(DATA_REFERENCIA)
+        assert len(conciliador.conciliar_incremental(df_interno, df_operadora, estado, DATA_REFERENCIA)) == 0
+        _assert_relatorios_iguais(estado.gerar_relatorio(DATA_REFERENCIA), relatorio)
+    finally:
+        estado.fechar()